@@ -67,7 +67,9 @@ class UserProfile(models.Model):
         verbose_name_plural = 'Perfiles de Usuario'
 
     def __str__(self):
-        return f'Perfil de {self.user.username}'
+        if UserProfile.user.is_cached(self):
+            return f'Perfil de {self.user.username}'
+        return f'Perfil del usuario #{self.user_id}'
 
 
 # Signals para crear y guardar el perfil automáticamente
@@ -81,9 +83,11 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
+def save_user_profile(sender, instance, created, **kwargs):
     """
-    Guarda el perfil cuando se guarda el usuario.
+    Guarda el perfil cuando se guarda el usuario, solo si ya está cargado
+    en la instancia. No lo consulta (cada login guarda last_login) ni lo
+    vuelve a escribir justo después de crearlo.
     """
-    if hasattr(instance, 'profile'):
+    if not created and User.profile.is_cached(instance):
         instance.profile.save()
@@ -1,10 +1,52 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
 # Create your models here.
 class Categoria(models.Model):
     nombre = models.CharField(max_length=100)
     descripcion = models.TextField(blank=True)
+    # Da el ETag/Last-Modified del catálogo (cliente_app.conditional)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     
     def __str__(self):
-        return self.nombre
\ No newline at end of file
+        return self.nombre
+
+
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def invalidar_catalogo_categoria(sender, instance, **kwargs):
+    """
+    Invalida las respuestas cacheadas del catálogo
+    (cliente_app.response_cache).
+    """
+    from cliente_app.response_cache import invalidar_al_confirmar
+
+    invalidar_al_confirmar()
+
+
+@receiver(post_save, sender=Categoria)
+def actualizar_sugerencias_categoria(sender, instance, update_fields=None, **kwargs):
+    """
+    Agrega o renombra la categoría en las sugerencias del buscador
+    (productos.sugerencias) una vez confirmada la transacción.
+    """
+    if update_fields is not None and 'nombre' not in update_fields:
+        return
+    from productos.sugerencias import CATEGORIA, indice_sugerencias
+
+    pk, nombre = instance.pk, instance.nombre
+    transaction.on_commit(lambda: indice_sugerencias.actualizar(CATEGORIA, pk, nombre))
+
+
+@receiver(post_delete, sender=Categoria)
+def eliminar_de_sugerencias_categoria(sender, instance, **kwargs):
+    """
+    Quita la categoría eliminada de las sugerencias. Sus productos se
+    eliminan en cascada y cada uno envía su propia señal.
+    """
+    from productos.sugerencias import CATEGORIA, indice_sugerencias
+
+    pk = instance.pk
+    transaction.on_commit(lambda: indice_sugerencias.eliminar(CATEGORIA, pk))
@@ -1,7 +1,8 @@
 from rest_framework import serializers
+from cliente_app.fieldsets import SparseFieldsetMixin
 from .models import Categoria
 
-class CategoriaSerializer(serializers.ModelSerializer):
+class CategoriaSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Categoria
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
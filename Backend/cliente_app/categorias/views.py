@@ -1,7 +1,19 @@
 from rest_framework import viewsets
+from cliente_app.conditional import ConditionalGetMixin
+from cliente_app.fieldsets import campos_solicitados, columnas_para
+from cliente_app.response_cache import CachedResponseMixin
 from .models import Categoria
 from .serializers import CategoriaSerializer
 
-class CategoriaViewSet(viewsets.ModelViewSet):
+class CategoriaViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
+    # list y retrieve: ETag/Last-Modified (cliente_app.conditional) y
+    # cache del catálogo (cliente_app.response_cache)
     queryset = Categoria.objects.all()
     serializer_class = CategoriaSerializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        campos = campos_solicitados(self.request)
+        if campos is not None:
+            queryset = queryset.only(*columnas_para(Categoria, campos))
+        return queryset
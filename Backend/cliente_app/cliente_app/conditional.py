@@ -0,0 +1,106 @@
+"""
+GET condicional (ETag y Last-Modified) para los endpoints del catálogo.
+
+Los clientes y el CDN vuelven a pedir el catálogo en cada carga de
+página. ConditionalGetMixin calcula los validadores antes de evaluar el
+queryset de la vista, con un MAX que se resuelve en el índice de
+updated_at (no recorre la tabla):
+
+    SELECT MAX(updated_at) FROM productos_producto
+
+- ETag (fuerte): hash de la ruta, los parámetros normalizados, el
+  formato de la respuesta, el último updated_at y la versión del
+  catálogo de cliente_app.response_cache. Crear, editar o mover stock
+  cambia updated_at; eliminar (y las escrituras masivas, que llaman
+  invalidar_catalogo()) cambia la versión, que ya mantienen las señales
+  y no cuesta una consulta. En el detalle se usa solo el updated_at de
+  la fila pedida: si la eliminan, la vista responde 404.
+- Last-Modified: el último updated_at. No ve las eliminaciones, por eso
+  If-None-Match tiene prioridad cuando vienen los dos.
+
+Si el If-None-Match (o el If-Modified-Since) coincide, se responde 304
+sin cuerpo y sin leer las filas. Si no, el ETag se agrega a la clave de
+CachedResponseMixin: una respuesta guardada nunca sale con el ETag de
+otro estado de la tabla.
+
+Es conservador: cualquier cambio en la tabla cambia el ETag de todos los
+listados, aunque no afecte a los filtros de la consulta.
+"""
+
+import hashlib
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError
+from django.db.models import Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+
+from .response_cache import parametros_normalizados, version_catalogo
+
+
+# modificado es None si no hay filas
+Estado = namedtuple('Estado', ['modificado', 'version'])
+
+
+def estado_de(queryset, versionado=True):
+    """
+    Último updated_at del queryset y, si `versionado`, la versión actual
+    del catálogo (ve las eliminaciones).
+    """
+    modificado = queryset.order_by().aggregate(modificado=Max('updated_at'))['modificado']
+    return Estado(modificado, version_catalogo() if versionado else '')
+
+
+def etag_de(request, formato, estado):
+    modificado = estado.modificado.isoformat() if estado.modificado else ''
+    consulta = parametros_normalizados(request.query_params)
+    huella = f'{request.path}?{consulta}|{formato}|{estado.version}|{modificado}'
+    return quote_etag(hashlib.sha256(huella.encode()).hexdigest()[:32])
+
+
+class ConditionalGetMixin:
+    """
+    Mixin para ViewSets de modelos con updated_at: agrega ETag y
+    Last-Modified a list y retrieve y responde 304 cuando el cliente ya
+    tiene la versión actual. Va antes de CachedResponseMixin en las bases.
+    """
+
+    etag = ''
+
+    def filas_validadas(self):
+        """Filas de las que dependen los validadores de la acción."""
+        filas = self.queryset.model._default_manager.all()
+        if self.action == 'retrieve':
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            filas = filas.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return filas
+
+    def _condicional(self, request, vista, *args, **kwargs):
+        try:
+            estado = estado_de(self.filas_validadas(), versionado=self.action != 'retrieve')
+        except (TypeError, ValueError, ValidationError):
+            # Lookup inválido: la vista responde 404
+            return vista(request, *args, **kwargs)
+        if self.action == 'retrieve' and estado.modificado is None:
+            return vista(request, *args, **kwargs)
+
+        self.etag = etag_de(request, request.accepted_renderer.format, estado)
+        modificado = int(estado.modificado.timestamp()) if estado.modificado else None
+        response = get_conditional_response(request, etag=self.etag, last_modified=modificado)
+        if response is None:
+            response = vista(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = self.etag
+            if modificado is not None:
+                response['Last-Modified'] = http_date(modificado)
+        return response
+
+    def variante_de_cache(self, request):
+        return self.etag
+
+    def list(self, request, *args, **kwargs):
+        return self._condicional(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._condicional(request, super().retrieve, *args, **kwargs)
@@ -0,0 +1,52 @@
+"""
+Sparse fieldsets para las respuestas de la API.
+
+Permite que el cliente pida solo algunos campos con ?fields=, por ejemplo:
+    GET /api/productos/?fields=id,nombre,precio
+
+Solo aplica a lecturas (GET) y al serializer de primer nivel; los
+serializers anidados conservan todos sus campos.
+"""
+
+FIELDS_PARAM = 'fields'
+
+
+def campos_solicitados(request):
+    """
+    Retorna el conjunto de campos pedidos en ?fields=, o None si el
+    cliente no lo indicó (o la petición no es de lectura).
+    """
+    if request is None or request.method != 'GET':
+        return None
+    valor = request.query_params.get(FIELDS_PARAM)
+    if not valor:
+        return None
+    return {campo.strip() for campo in valor.split(',') if campo.strip()}
+
+
+def columnas_para(model, campos):
+    """
+    Traduce campos de la respuesta a columnas concretas del modelo,
+    para usarlas con QuerySet.only(). Ignora los campos calculados.
+    """
+    concretos = {
+        field.name for field in model._meta.concrete_fields
+    }
+    columnas = {campo for campo in campos if campo in concretos}
+    columnas.add(model._meta.pk.name)
+    return sorted(columnas)
+
+
+class SparseFieldsetMixin:
+    """
+    Mixin para ModelSerializer que elimina los campos no solicitados
+    en ?fields= antes de serializar.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        campos = campos_solicitados(self.context.get('request'))
+        if campos is None:
+            return
+        for nombre in set(self.fields) - campos:
+            self.fields.pop(nombre)
@@ -0,0 +1,60 @@
+"""
+Paginador del admin para tablas grandes.
+
+El changelist del admin cuenta las filas en cada página (COUNT(*)), que
+con millones de órdenes recorre toda la tabla. EstimatedCountPaginator
+usa, sin filtros, la estimación que ya mantiene la base de datos:
+
+- PostgreSQL: pg_class.reltuples (actualizado por VACUUM/ANALYZE)
+- MySQL: information_schema.tables.table_rows
+- SQLite y otros: el id más alto, leído del índice de la clave primaria
+
+Con filtros o búsqueda el conteo es exacto (lo acota el WHERE), y en tablas
+chicas también. Como el total es aproximado, la última página puede quedar
+vacía o incompleta. Usar junto con show_full_result_count = False, que
+evita el segundo COUNT(*) del total sin filtros.
+"""
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max
+from django.utils.functional import cached_property
+
+
+def filas_estimadas(queryset):
+    """Cantidad aproximada de filas de la tabla del queryset, o None."""
+    model = queryset.model
+    conexion = connections[queryset.db]
+    tabla = model._meta.db_table
+    if conexion.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass'
+    elif conexion.vendor == 'mysql':
+        sql = ('SELECT table_rows FROM information_schema.tables '
+               'WHERE table_schema = DATABASE() AND table_name = %s')
+    else:
+        return model._default_manager.using(queryset.db).aggregate(maximo=Max('pk'))['maximo'] or 0
+    with conexion.cursor() as cursor:
+        cursor.execute(sql, [tabla])
+        fila = cursor.fetchone()
+    # reltuples es -1 si la tabla nunca se analizó
+    if fila is None or fila[0] is None or fila[0] < 0:
+        return None
+    return fila[0]
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator que estima el total de una tabla sin filtrar en lugar de
+    contarlo. Por debajo de `umbral` filas estimadas cuenta exacto.
+    """
+
+    umbral = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimado = filas_estimadas(queryset)
+            if estimado is not None and estimado >= self.umbral:
+                return estimado
+        return super().count
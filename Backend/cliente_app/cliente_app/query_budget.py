@@ -0,0 +1,129 @@
+"""
+Presupuesto de consultas SQL por petición.
+
+Un N+1 (por ejemplo un __str__ o un serializer que sigue una ForeignKey
+por cada fila) no falla ni se ve en las respuestas: solo hace que la
+petición lance una consulta por fila. Este módulo los hace visibles:
+
+- QueryBudgetMiddleware (solo con DEBUG) cuenta las consultas de cada
+  petición y su tiempo total con connection.execute_wrapper, los
+  expone en el header Server-Timing:
+
+      Server-Timing: db;dur=4.21;desc="7 queries"
+
+  y registra un warning en el logger 'cliente_app.query_budget' cuando
+  la petición supera QUERY_BUDGET consultas, con las consultas que más se
+  repitieron (la firma de un N+1).
+
+- presupuesto_de_consultas(maximo) hace lo mismo en las pruebas: falla
+  si el bloque lanza más de `maximo` consultas.
+
+      with presupuesto_de_consultas(3):
+          self.client.get('/api/productos/')
+"""
+
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+# Consultas repetidas que se muestran en el log y en los errores
+MAX_REPETIDAS = 3
+
+
+class ContadorConsultas:
+    """
+    execute_wrapper que cuenta las consultas, acumula su duración y
+    agrupa las repetidas por su SQL (sin parámetros).
+    """
+
+    def __init__(self):
+        self.consultas = 0
+        self.duracion = 0.0
+        self.por_sql = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duracion += time.perf_counter() - inicio
+            self.consultas += 1
+            self.por_sql[sql] += 1
+
+    @property
+    def duracion_ms(self):
+        return self.duracion * 1000
+
+    def repetidas(self):
+        """[(veces, sql)] de las consultas lanzadas más de una vez."""
+        return [
+            (veces, sql) for sql, veces in self.por_sql.most_common(MAX_REPETIDAS)
+            if veces > 1
+        ]
+
+    def resumen(self):
+        lineas = [f'{self.consultas} consultas en {self.duracion_ms:.1f} ms']
+        lineas += [f'  {veces}x {sql}' for veces, sql in self.repetidas()]
+        return '\n'.join(lineas)
+
+
+@contextmanager
+def contar_consultas():
+    """Instala un ContadorConsultas en todas las conexiones del bloque."""
+    contador = ContadorConsultas()
+    with ExitStack() as stack:
+        for conexion in connections.all():
+            stack.enter_context(conexion.execute_wrapper(contador))
+        yield contador
+
+
+@contextmanager
+def presupuesto_de_consultas(maximo):
+    """
+    Falla con AssertionError si el bloque lanza más de `maximo`
+    consultas. A diferencia de assertNumQueries admite menos consultas, y
+    el error muestra las repetidas.
+    """
+    with contar_consultas() as contador:
+        yield contador
+    if contador.consultas > maximo:
+        raise AssertionError(
+            f'Se esperaban a lo sumo {maximo} consultas: {contador.resumen()}'
+        )
+
+
+class QueryBudgetMiddleware:
+    """
+    Middleware de desarrollo: agrega Server-Timing con las consultas de
+    la petición y avisa en el log las que superan QUERY_BUDGET. No se
+    carga si DEBUG es False.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.presupuesto = settings.QUERY_BUDGET
+
+    def __call__(self, request):
+        with contar_consultas() as contador:
+            response = self.get_response(request)
+
+        metrica = f'db;dur={contador.duracion_ms:.2f};desc="{contador.consultas} queries"'
+        existente = response.get('Server-Timing')
+        response['Server-Timing'] = f'{existente}, {metrica}' if existente else metrica
+
+        if contador.consultas > self.presupuesto:
+            logger.warning(
+                '%s %s superó el presupuesto de %s consultas: %s',
+                request.method, request.path, self.presupuesto, contador.resumen()
+            )
+        return response
@@ -0,0 +1,182 @@
+"""
+Cache de respuestas para los endpoints públicos del catálogo.
+
+GET /api/productos/, /api/productos/{id}/, /api/categorias/ y
+/api/categorias/{id}/ no dependen del usuario, así que su respuesta se
+guarda (ya serializada, antes de renderizarla: la negociación de formato
+sigue funcionando) en el cache CATALOG_CACHE_ALIAS durante
+CATALOG_CACHE_TTL segundos:
+
+- La clave es la ruta más los parámetros normalizados: el orden de los
+  parámetros y de los campos de ?fields= no importa, se ignoran los vacíos
+  y ?format=.
+- Todas las claves llevan la versión del catálogo. Guardar o eliminar un
+  Producto, una Categoria o una Promocion la cambia (ver las señales de
+  cada app), así que las respuestas anteriores dejan de usarse sin
+  borrarlas. La versión cambia al guardar y otra vez al confirmar la
+  transacción: una lectura que corrió entre ambos momentos no queda
+  guardada con datos viejos.
+- Las escrituras masivas (bulk_create, update, import_stock) no envían
+  señales: deben llamar invalidar_catalogo(). Los movimientos de stock del
+  checkout tampoco invalidan, pero actualizan updated_at: en las vistas
+  con ConditionalGetMixin (cliente_app.conditional) la clave lleva el
+  ETag, así que cambia igual. En las demás lo guardado puede atrasarse
+  hasta CATALOG_CACHE_TTL segundos.
+- Cuando una clave no está, solo una petición la genera (candado con
+  cache.add); las demás esperan su resultado en lugar de repetir la misma
+  consulta. El candado es atómico entre procesos solo con un backend
+  compartido (Redis, Memcached); con locmem protege a cada proceso.
+
+Con CATALOG_CACHE_TTL = 0 no se cachea nada.
+"""
+
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from .fieldsets import FIELDS_PARAM
+
+
+CLAVE_VERSION = 'catalogo:version'
+# Segundos que dura el candado de una clave y que se espera a quien la genera
+DURACION_CANDADO = 10
+# Parámetros que no cambian los datos de la respuesta
+IGNORADOS = {'format'}
+
+
+def _cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def version_catalogo():
+    """
+    Versión actual del catálogo. Si no existe (cache nuevo o clave
+    desalojada) arranca en el reloj actual, que no coincide con ninguna
+    versión anterior.
+    """
+    cache = _cache()
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, time.time_ns(), timeout=None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def invalidar_catalogo():
+    """Cambia la versión del catálogo: lo guardado deja de usarse."""
+    cache = _cache()
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        cache.add(CLAVE_VERSION, time.time_ns(), timeout=None)
+
+
+def invalidar_al_confirmar():
+    """Invalida ahora y al confirmar la transacción en curso."""
+    invalidar_catalogo()
+    transaction.on_commit(invalidar_catalogo)
+
+
+def parametros_normalizados(query_params):
+    """Query string canónico: mismo resultado para consultas equivalentes."""
+    pares = []
+    for nombre in sorted(set(query_params) - IGNORADOS):
+        valores = {' '.join(valor.split()) for valor in query_params.getlist(nombre)}
+        if nombre == FIELDS_PARAM:
+            valores = {','.join(sorted({
+                campo.strip() for valor in valores for campo in valor.split(',') if campo.strip()
+            }))}
+        pares.extend((nombre, valor) for valor in sorted(valores) if valor)
+    return urlencode(pares)
+
+
+def clave_de(request, variante=''):
+    consulta = parametros_normalizados(request.query_params)
+    huella = hashlib.sha256(f'{request.path}?{consulta}|{variante}'.encode()).hexdigest()
+    return f'catalogo:{version_catalogo()}:{huella}'
+
+
+def _esperar(clave, candado):
+    """
+    Espera a que quien tiene el candado guarde la respuesta. Retorna los
+    datos, o None si el candado se liberó sin guardar o se agotó el tiempo.
+    """
+    cache = _cache()
+    limite = time.monotonic() + DURACION_CANDADO
+    pausa = 0.01
+    while time.monotonic() < limite:
+        time.sleep(pausa)
+        pausa = min(pausa * 2, 0.2)
+        datos = cache.get(clave)
+        if datos is not None:
+            return datos
+        if cache.get(candado) is None:
+            return cache.get(clave)
+    return None
+
+
+def _marcar(response, estado):
+    response['X-Cache'] = estado
+    return response
+
+
+def respuesta_en_cache(request, generar, variante=''):
+    """
+    Retorna la respuesta guardada para la petición o la genera con
+    `generar()` y la guarda si es 200. `variante` se agrega a la clave.
+    """
+    ttl = settings.CATALOG_CACHE_TTL
+    if ttl <= 0 or request.method not in ('GET', 'HEAD'):
+        return generar()
+
+    cache = _cache()
+    clave = clave_de(request, variante)
+    datos = cache.get(clave)
+    if datos is not None:
+        return _marcar(Response(datos), 'HIT')
+
+    candado = f'{clave}:candado'
+    if not cache.add(candado, 1, timeout=DURACION_CANDADO):
+        datos = _esperar(clave, candado)
+        if datos is not None:
+            return _marcar(Response(datos), 'HIT')
+        return _marcar(generar(), 'MISS')
+
+    try:
+        response = generar()
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(clave, response.data, ttl)
+    finally:
+        cache.delete(candado)
+    return _marcar(response, 'MISS')
+
+
+class CachedResponseMixin:
+    """
+    Mixin para ViewSets públicos cuya respuesta no depende del usuario:
+    list y retrieve pasan por respuesta_en_cache.
+    """
+
+    def variante_de_cache(self, request):
+        """Parte extra de la clave (p. ej. el ETag de ConditionalGetMixin)."""
+        return ''
+
+    def list(self, request, *args, **kwargs):
+        return respuesta_en_cache(
+            request,
+            lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs),
+            self.variante_de_cache(request),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return respuesta_en_cache(
+            request,
+            lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs),
+            self.variante_de_cache(request),
+        )
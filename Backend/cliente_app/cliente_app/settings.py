@@ -65,6 +65,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Solo con DEBUG: consultas por petición en Server-Timing y en el log
+    'cliente_app.query_budget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -102,6 +104,19 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # SQLite ignora select_for_update: IMMEDIATE toma el bloqueo de
+        # escritura al iniciar cada transacción, en lugar de fallar con
+        # "database is locked" al intentar pasar de lectura a escritura
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # Base de pruebas en archivo: la base en memoria compartida entre
+        # hilos falla con "database table is locked" en vez de esperar, y
+        # las pruebas de concurrencia escriben desde varios hilos
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
@@ -165,6 +180,81 @@ from decouple import config
 
 OPENAI_API_KEY = config('OPENAI_API_KEY')
 
+# Embeddings: ruta al proveedor y kwargs del constructor.
+# Para desarrollo sin red: 'productos.embeddings.HashingEmbeddingProvider'
+EMBEDDING_PROVIDER = config('EMBEDDING_PROVIDER', default='productos.embeddings.OpenAIEmbeddingProvider')
+EMBEDDING_PROVIDER_OPTIONS = {}
+
+# Segundos de espera tras la última edición antes de regenerar un embedding
+EMBEDDING_REFRESH_DELAY = config('EMBEDDING_REFRESH_DELAY', default=10, cast=int)
+
+# Recomendaciones: segundos antes de reconstruir el índice vectorial del worker
+RECOMMENDATION_INDEX_TTL = config('RECOMMENDATION_INDEX_TTL', default=300, cast=int)
+# Vecinos precalculados por producto (python manage.py precompute_recommendations)
+RECOMMENDATION_PRECOMPUTED_N = 10
+# Backend de búsqueda vectorial: 'exact' (en memoria) o 'ivf' (aproximado,
+# requiere python manage.py build_ann_index). Más nprobe = más recall y latencia.
+RECOMMENDATION_BACKEND = config('RECOMMENDATION_BACKEND', default='exact')
+RECOMMENDATION_ANN_PATH = BASE_DIR / 'ann_index'
+RECOMMENDATION_IVF_NPROBE = config('RECOMMENDATION_IVF_NPROBE', default=8, cast=int)
+# Búsqueda de texto: segundos antes de reconstruir el índice invertido del worker
+SEARCH_INDEX_TTL = config('SEARCH_INDEX_TTL', default=300, cast=int)
+# Productos más relevantes que devuelve ?search= (el listado no se pagina)
+SEARCH_MAX_RESULTS = config('SEARCH_MAX_RESULTS', default=1000, cast=int)
+# Búsqueda híbrida (/api/productos/search/): codificador de las consultas
+# (vacío = EMBEDDING_PROVIDER si es local; si es remoto la búsqueda queda
+# solo léxica. Debe dar vectores del mismo espacio que los productos: con
+# el EMBEDDING_PROVIDER por defecto, la parte semántica se activa con
+# SEARCH_QUERY_ENCODER=productos.embeddings.OpenAIEmbeddingProvider),
+# segundos de espera de un codificador remoto y tamaño del LRU de
+# embeddings de consultas por worker
+SEARCH_QUERY_ENCODER = config('SEARCH_QUERY_ENCODER', default='')
+SEARCH_QUERY_ENCODER_OPTIONS = {}
+SEARCH_QUERY_TIMEOUT = config('SEARCH_QUERY_TIMEOUT', default=2.0, cast=float)
+SEARCH_QUERY_CACHE_SIZE = config('SEARCH_QUERY_CACHE_SIZE', default=1024, cast=int)
+# Sugerencias (/api/productos/suggest/): segundos antes de reconstruir el
+# índice de nombres del worker (y de recoger las ventas nuevas)
+SUGGEST_INDEX_TTL = config('SUGGEST_INDEX_TTL', default=300, cast=int)
+# Peso de las compras conjuntas (OrderItem) en el score híbrido de los vecinos
+# precalculados (precompute_recommendations, refresh_copurchases); 0 lo desactiva
+RECOMMENDATION_COPURCHASE_WEIGHT = config('RECOMMENDATION_COPURCHASE_WEIGHT', default=0.3, cast=float)
+
 # Stripe Configuration
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')
 STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='')
+# Secreto de firma del endpoint /api/stripe/webhook/ (whsec_...)
+STRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET', default='')
+
+# Minutos que una orden pendiente retiene stock antes de que
+# release_expired_orders la cancele y lo devuelva
+ORDER_RESERVATION_TTL = config('ORDER_RESERVATION_TTL', default=30, cast=int)
+
+# Horas que se guarda la respuesta de un create_order con Idempotency-Key
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=24, cast=int)
+# Segundos que un reintento concurrente espera a que termine el original
+IDEMPOTENCY_WAIT_TIMEOUT = config('IDEMPOTENCY_WAIT_TIMEOUT', default=30, cast=float)
+# Segundos que una petición retiene su clave; si no termina (el proceso se
+# cayó), pasado ese tiempo un reintento la toma. Mayor que lo que puede
+# tardar create_order, o un reintento podría repetirlo
+IDEMPOTENCY_LEASE = config('IDEMPOTENCY_LEASE', default=120, cast=float)
+
+# Máximo de consultas SQL por petición; con DEBUG, QueryBudgetMiddleware
+# registra un warning (con las consultas repetidas) si se supera
+QUERY_BUDGET = config('QUERY_BUDGET', default=15, cast=int)
+
+# Cache de respuestas del catálogo (cliente_app.response_cache). Por defecto
+# en memoria de cada proceso; para compartirla entre procesos, por ejemplo:
+#   CATALOG_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+#   CATALOG_CACHE_LOCATION=redis://127.0.0.1:6379/1
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalogo': {
+        'BACKEND': config('CATALOG_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CATALOG_CACHE_LOCATION', default='catalogo'),
+    },
+}
+CATALOG_CACHE_ALIAS = 'catalogo'
+# Segundos que se reutiliza una respuesta del catálogo; 0 desactiva el cache
+CATALOG_CACHE_TTL = config('CATALOG_CACHE_TTL', default=60, cast=int)
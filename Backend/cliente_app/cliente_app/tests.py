@@ -0,0 +1,290 @@
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+
+from authentication.models import UserProfile
+from categorias.models import Categoria
+from orders.models import Order, OrderItem
+from productos.models import Producto
+from productos.stock import reponer_stock
+from promocion.models import Promocion
+from .query_budget import presupuesto_de_consultas
+from .response_cache import (
+    clave_de,
+    invalidar_catalogo,
+    parametros_normalizados,
+    respuesta_en_cache,
+)
+
+
+# Consultas máximas por endpoint, sin importar cuántas filas devuelva
+PRESUPUESTOS = {
+    '/api/productos/': 3,    # token + ETag + productos
+    '/api/orders/': 2,       # token + página de órdenes
+    '/api/auth/user': 2,     # token + perfil
+}
+
+
+class QueryBudgetTests(TestCase):
+    """Presupuesto de consultas por endpoint (detecta N+1)."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('sara', 'sara@example.com', 'x')
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.categoria = Categoria.objects.create(nombre='Frutas')
+
+    def poblar(self, cantidad):
+        productos = Producto.objects.bulk_create([
+            Producto(nombre=f'Fruta {i}', precio=1, stock=5, categoria=self.categoria)
+            for i in range(cantidad)
+        ])
+        ordenes = Order.objects.bulk_create([
+            Order(user=self.user, total_amount=1, item_count=1, units=1,
+                  billing_name='Sara', billing_email='sara@example.com',
+                  billing_phone='1', billing_address='Calle', billing_city='Quito')
+            for _ in range(cantidad)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, producto=producto, cantidad=1, precio_unitario=1, subtotal=1)
+            for order, producto in zip(ordenes, productos)
+        ])
+        # bulk_create no envía señales; se mide sin respuestas cacheadas
+        invalidar_catalogo()
+
+    def test_presupuestos_por_endpoint(self):
+        for cantidad in (1, 30):
+            self.poblar(cantidad)
+            for url, maximo in PRESUPUESTOS.items():
+                with self.subTest(url=url, filas=cantidad):
+                    with presupuesto_de_consultas(maximo):
+                        response = self.client.get(url)
+                    self.assertEqual(response.status_code, 200)
+
+    def test_presupuesto_excedido_muestra_las_repetidas(self):
+        self.poblar(3)
+        with self.assertRaisesRegex(AssertionError, r'3x SELECT'):
+            with presupuesto_de_consultas(1):
+                [item.producto.nombre for item in OrderItem.objects.all()]
+
+    def test_str_no_consulta(self):
+        self.poblar(1)
+        order = Order.objects.get()
+        item = OrderItem.objects.get()
+        profile = UserProfile.objects.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(str(order), f'Order #{order.pk} - user #{self.user.pk} - pending')
+            self.assertIn(f'producto #{item.producto_id}', str(item))
+            str(profile)
+
+    def test_perfil_sin_escrituras_extra(self):
+        # INSERT usuario e INSERT perfil, sin volver a guardar el perfil
+        with self.assertNumQueries(2):
+            user = User.objects.create(username='nuevo')
+        user = User.objects.get(pk=user.pk)
+        # Guardar el usuario (p. ej. last_login) no lee ni escribe el perfil
+        with self.assertNumQueries(1):
+            user.save(update_fields=['last_login'])
+
+
+@override_settings(DEBUG=True)
+class QueryBudgetMiddlewareTests(TestCase):
+    """Server-Timing y log de QueryBudgetMiddleware."""
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre='Verduras')
+        Producto.objects.create(nombre='Papa', precio=1, stock=1, categoria=categoria)
+
+    def test_server_timing(self):
+        response = self.client.get('/api/productos/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="2 queries"$')
+
+    @override_settings(QUERY_BUDGET=0)
+    def test_log_sobre_el_presupuesto(self):
+        with self.assertLogs('cliente_app.query_budget', 'WARNING') as logs:
+            self.client.get('/api/productos/')
+        self.assertIn('GET /api/productos/', logs.output[0])
+
+    @override_settings(DEBUG=False)
+    def test_sin_debug_no_se_carga(self):
+        response = self.client.get('/api/productos/')
+        self.assertNotIn('Server-Timing', response)
+
+
+class CatalogCacheTests(TestCase):
+    """Cache de respuestas del catálogo (cliente_app.response_cache)."""
+
+    def setUp(self):
+        invalidar_catalogo()
+        self.categoria = Categoria.objects.create(nombre='Lácteos')
+        self.producto = Producto.objects.create(
+            nombre='Leche', precio=1, stock=3, categoria=self.categoria
+        )
+
+    def test_segunda_peticion_sin_consultas(self):
+        for url in ('/api/productos/', f'/api/productos/{self.producto.pk}/', '/api/categorias/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+                # Solo la consulta del ETag (cliente_app.conditional)
+                with self.assertNumQueries(1):
+                    response = self.client.get(url)
+                self.assertEqual(response['X-Cache'], 'HIT')
+                self.assertEqual(response.status_code, 200)
+
+    def test_parametros_equivalentes_comparten_clave(self):
+        self.client.get('/api/productos/?fields=nombre,id&search=leche')
+        response = self.client.get('/api/productos/?search=leche&fields=id,%20nombre&format=json')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.json(), [{'id': self.producto.pk, 'nombre': 'Leche'}])
+
+    def test_parametros_normalizados(self):
+        consulta = APIRequestFactory().get('/', {'b': '  x  y ', 'a': ['2', '1', '2'], 'vacio': ''})
+        self.assertEqual(parametros_normalizados(Request(consulta).query_params), 'a=1&a=2&b=x+y')
+
+    def test_guardar_invalida(self):
+        self.client.get('/api/productos/')
+        self.producto.nombre = 'Leche entera'
+        self.producto.save()
+        response = self.client.get('/api/productos/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()[0]['nombre'], 'Leche entera')
+
+    def test_categoria_y_promocion_invalidan(self):
+        for cambiar in (
+            lambda: Categoria.objects.create(nombre='Quesos'),
+            lambda: Promocion.objects.create(producto=self.producto, descuento=10),
+        ):
+            self.client.get('/api/categorias/')
+            cambiar()
+            self.assertEqual(self.client.get('/api/categorias/')['X-Cache'], 'MISS')
+
+    def test_embedding_no_invalida(self):
+        self.client.get('/api/productos/')
+        self.producto.embedding_hash = 'x'
+        self.producto.save(update_fields=['embedding_hash'])
+        self.assertEqual(self.client.get('/api/productos/')['X-Cache'], 'HIT')
+
+    def test_no_cachea_errores(self):
+        # El 404 sale como excepción: libera el candado y no guarda nada
+        for _ in range(2):
+            with self.assertNumQueries(2):
+                response = self.client.get('/api/productos/999999/')
+            self.assertEqual(response.status_code, 404)
+
+    @override_settings(CATALOG_CACHE_TTL=0)
+    def test_ttl_cero_desactiva(self):
+        self.client.get('/api/productos/')
+        response = self.client.get('/api/productos/')
+        self.assertNotIn('X-Cache', response)
+
+    def test_una_sola_generacion_concurrente(self):
+        request = Request(APIRequestFactory().get('/api/productos/', {'search': 'leche'}))
+        generaciones = []
+
+        def generar():
+            generaciones.append(1)
+            time.sleep(0.2)
+            return Response({'ok': True})
+
+        respuestas = []
+        hilos = [
+            threading.Thread(target=lambda: respuestas.append(respuesta_en_cache(request, generar)))
+            for _ in range(8)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(len(generaciones), 1)
+        self.assertEqual(sorted(r['X-Cache'] for r in respuestas), ['HIT'] * 7 + ['MISS'])
+        self.assertTrue(clave_de(request).startswith('catalogo:'))
+
+
+class ConditionalGetTests(TestCase):
+    """ETag y Last-Modified del catálogo (cliente_app.conditional)."""
+
+    def setUp(self):
+        invalidar_catalogo()
+        self.categoria = Categoria.objects.create(nombre='Panadería')
+        self.producto = Producto.objects.create(
+            nombre='Pan', precio=1, stock=3, categoria=self.categoria
+        )
+        self.otro = Producto.objects.create(
+            nombre='Croissant', precio=2, stock=1, categoria=self.categoria
+        )
+
+    def test_304_sin_leer_las_filas(self):
+        for url in ('/api/productos/', f'/api/productos/{self.producto.pk}/', '/api/categorias/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('Last-Modified', response)
+                with self.assertNumQueries(1) as contexto:
+                    revalidada = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertNotIn('COUNT', contexto.captured_queries[0]['sql'].upper())
+                self.assertEqual(revalidada.status_code, 304)
+                self.assertEqual(revalidada.content, b'')
+                self.assertEqual(revalidada['ETag'], response['ETag'])
+
+    def test_if_modified_since(self):
+        response = self.client.get('/api/productos/')
+        revalidada = self.client.get(
+            '/api/productos/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(revalidada.status_code, 304)
+
+    def test_cambios_cambian_el_etag(self):
+        etags = {self.client.get('/api/productos/')['ETag']}
+        for cambiar in (
+            lambda: Producto.objects.filter(pk=self.producto.pk).get().save(),
+            lambda: reponer_stock({self.producto.pk: 2}),
+            lambda: self.otro.delete(),
+            # update() no toca updated_at: la escritura masiva cambia la versión
+            lambda: (Producto.objects.filter(pk=self.producto.pk).update(nombre='Pan blanco'), invalidar_catalogo()),
+        ):
+            cambiar()
+            response = self.client.get('/api/productos/', HTTP_IF_NONE_MATCH=', '.join(etags))
+            self.assertEqual(response.status_code, 200)
+            etags.add(response['ETag'])
+
+    def test_stock_no_sale_del_cache(self):
+        # reponer_stock no invalida el cache, pero cambia el ETag de la clave
+        self.client.get(f'/api/productos/{self.producto.pk}/')
+        reponer_stock({self.producto.pk: 2})
+        response = self.client.get(f'/api/productos/{self.producto.pk}/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['stock'], 5)
+
+    def test_etag_por_representacion(self):
+        etags = {
+            self.client.get(url)['ETag'] for url in (
+                '/api/productos/',
+                '/api/productos/?fields=id',
+                '/api/productos/?format=api',
+            )
+        }
+        self.assertEqual(len(etags), 3)
+        self.assertEqual(
+            self.client.get('/api/productos/?fields=id,nombre')['ETag'],
+            self.client.get('/api/productos/?fields=nombre,id')['ETag'],
+        )
+
+    def test_detalle_no_depende_de_otras_filas(self):
+        url = f'/api/productos/{self.producto.pk}/'
+        etag = self.client.get(url)['ETag']
+        self.otro.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_detalle_inexistente(self):
+        for url in ('/api/productos/999999/', '/api/productos/abc/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 404)
+            self.assertNotIn('ETag', response)
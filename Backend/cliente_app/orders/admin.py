@@ -1,5 +1,19 @@
-from django.contrib import admin
-from .models import Order, OrderItem
+from django.contrib import admin, messages
+from django.db import transaction
+
+from cliente_app.paginators import EstimatedCountPaginator
+
+from .models import Order, OrderItem, StripeEvent
+from .services import StockInsuficiente, ajustar_stock_por_estado
+
+
+def buscar_por_id(search_term):
+    """
+    El id que contiene la búsqueda ('123' o '#123'), o None si no es un
+    id. Los ids se buscan por igualdad, sin mezclarlos con icontains.
+    """
+    termino = search_term.strip().lstrip('#')
+    return int(termino) if termino.isdigit() else None
 
 
 class OrderItemInline(admin.TabularInline):
@@ -20,18 +34,23 @@ class OrderAdmin(admin.ModelAdmin):
         'user',
         'status',
         'total_amount',
+        'item_count',
         'billing_name',
         'billing_email',
         'created_at',
     ]
     list_filter = ['status', 'created_at', 'updated_at']
+    list_select_related = ['user']
+    date_hierarchy = 'created_at'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # Texto libre; los ids y los payment intents se buscan en
+    # get_search_results
     search_fields = [
-        'id',
         'user__username',
         'user__email',
         'billing_name',
         'billing_email',
-        'stripe_payment_intent_id',
     ]
     readonly_fields = [
         'id',
@@ -39,11 +58,16 @@ class OrderAdmin(admin.ModelAdmin):
         'created_at',
         'updated_at',
         'total_amount',
+        'item_count',
+        'units',
         'stripe_payment_intent_id',
     ]
     fieldsets = [
         ('Información de la Orden', {
-            'fields': ['id', 'user', 'status', 'total_amount', 'created_at', 'updated_at']
+            'fields': [
+                'id', 'user', 'status', 'total_amount', 'item_count', 'units',
+                'created_at', 'updated_at',
+            ]
         }),
         ('Datos de Facturación', {
             'fields': [
@@ -69,6 +93,38 @@ class OrderAdmin(admin.ModelAdmin):
         """No permitir crear órdenes desde el admin."""
         return False
 
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Un id o un payment intent (pi_...) se buscan por igualdad sobre su
+        índice. Combinarlos en el OR con los icontains del texto libre
+        obligaría a recorrer toda la tabla.
+        """
+        order_id = buscar_por_id(search_term)
+        if order_id is not None:
+            return queryset.filter(pk=order_id), False
+        if search_term.strip().startswith('pi_'):
+            return queryset.filter(stripe_payment_intent_id=search_term.strip()), False
+        return super().get_search_results(request, queryset, search_term)
+
+    def save_model(self, request, obj, form, change):
+        """
+        Si cambia el estado, mueve el stock de la orden en la misma
+        transacción (ver orders.services.ajustar_stock_por_estado). Si no
+        alcanza para reactivarla, se guarda el resto sin cambiar el estado.
+        """
+        if not (change and 'status' in form.changed_data):
+            return super().save_model(request, obj, form, change)
+
+        anterior = form.initial['status']
+        try:
+            with transaction.atomic():
+                ajustar_stock_por_estado(obj, anterior, obj.status)
+                super().save_model(request, obj, form, change)
+        except StockInsuficiente as e:
+            obj.status = anterior
+            super().save_model(request, obj, form, change)
+            messages.warning(request, f'El estado no cambió: {e}')
+
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
@@ -83,8 +139,11 @@ class OrderItemAdmin(admin.ModelAdmin):
         'subtotal',
     ]
     list_filter = ['order__status', 'order__created_at']
+    list_select_related = ['order__user', 'producto']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # Texto libre; el id de la orden se busca en get_search_results
     search_fields = [
-        'order__id',
         'producto__nombre',
         'order__user__username',
     ]
@@ -96,6 +155,19 @@ class OrderItemAdmin(admin.ModelAdmin):
         'subtotal',
     ]
 
+    def get_queryset(self, request):
+        # El producto se une para su nombre; el embedding no se lee
+        return super().get_queryset(request).defer(
+            'producto__embedding', 'producto__descripcion'
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        """Un id ('123' o '#123') busca los items de esa orden por índice."""
+        order_id = buscar_por_id(search_term)
+        if order_id is not None:
+            return queryset.filter(order_id=order_id), False
+        return super().get_search_results(request, queryset, search_term)
+
     def has_add_permission(self, request):
         """No permitir crear items desde el admin."""
         return False
@@ -103,3 +175,38 @@ class OrderItemAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         """No permitir eliminar items desde el admin."""
         return False
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    """
+    Eventos recibidos del webhook de Stripe (solo lectura). El filtro
+    requires_review muestra los cobros de órdenes ya canceladas o fallidas
+    que hay que reembolsar o revisar.
+    """
+
+    list_display = [
+        'id',
+        'event_id',
+        'type',
+        'payment_intent_id',
+        'received_at',
+        'processed_at',
+        'requires_review',
+    ]
+    list_filter = ['requires_review', 'type']
+    search_fields = ['=event_id', '=payment_intent_id']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    readonly_fields = [
+        'event_id',
+        'type',
+        'payment_intent_id',
+        'payload',
+        'received_at',
+        'processed_at',
+    ]
+
+    def has_add_permission(self, request):
+        """Los eventos solo llegan por el webhook."""
+        return False
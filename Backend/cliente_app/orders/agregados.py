@@ -0,0 +1,92 @@
+"""
+Agregados de los items guardados en cada orden.
+
+Order guarda item_count (líneas), units (unidades) y total_amount (suma de
+los subtotales) para que los listados y el admin no tengan que leer
+OrderItem. Se escriben al crear la orden (services.reservar_orden) y los
+items no cambian después, así que no hay que mantenerlos en cada
+escritura.
+
+Las órdenes anteriores a estas columnas, o las creadas por fuera del
+checkout, se completan con sync_order_aggregates. En las pruebas:
+
+    self.assertEqual(inconsistencias(), {})
+
+total_amount es el monto que se cobró en Stripe: se verifica, pero
+sincronizar() no lo reescribe.
+"""
+
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db.models import Count, Sum
+
+from .models import Order, OrderItem
+
+
+Agregados = namedtuple('Agregados', ['item_count', 'units', 'total_amount'])
+
+VACIOS = Agregados(0, 0, Decimal('0.00'))
+
+
+def agregados_de_items(items):
+    """Agregados de una lista de OrderItem (guardados o no)."""
+    return Agregados(
+        item_count=len(items),
+        units=sum(item.cantidad for item in items),
+        total_amount=sum((item.subtotal for item in items), Decimal('0.00')),
+    )
+
+
+def agregados_reales(order_ids):
+    """{order_id: Agregados} calculados desde OrderItem con una consulta."""
+    reales = {order_id: VACIOS for order_id in order_ids}
+    filas = (
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .values('order_id')
+        .annotate(item_count=Count('id'), units=Sum('cantidad'), total=Sum('subtotal'))
+        .order_by()
+    )
+    for fila in filas:
+        reales[fila['order_id']] = Agregados(fila['item_count'], fila['units'], fila['total'])
+    return reales
+
+
+def guardados(order):
+    return Agregados(order.item_count, order.units, order.total_amount)
+
+
+def inconsistencias(orders=None):
+    """
+    Órdenes cuyos agregados guardados no coinciden con sus items.
+    Recibe una lista o queryset de órdenes (por defecto todas) y retorna
+    {order_id: (guardados, reales)}, vacío si todo coincide.
+    """
+    if orders is None:
+        orders = Order.objects.only('id', 'item_count', 'units', 'total_amount')
+    orders = list(orders)
+    reales = agregados_reales([order.pk for order in orders])
+    return {
+        order.pk: (guardados(order), reales[order.pk])
+        for order in orders
+        if guardados(order) != reales[order.pk]
+    }
+
+
+def sincronizar(orders, diferencias=None):
+    """
+    Corrige item_count y units de las órdenes que no coinciden con sus
+    items, con un solo bulk_update. Retorna las órdenes corregidas.
+    """
+    if diferencias is None:
+        diferencias = inconsistencias(orders)
+    corregidas = []
+    for order in orders:
+        if order.pk not in diferencias:
+            continue
+        _, reales = diferencias[order.pk]
+        if (order.item_count, order.units) != (reales.item_count, reales.units):
+            order.item_count, order.units = reales.item_count, reales.units
+            corregidas.append(order)
+    Order.objects.bulk_update(corregidas, ['item_count', 'units'])
+    return corregidas
@@ -0,0 +1,195 @@
+"""
+Idempotencia de peticiones con el header Idempotency-Key.
+
+Los clientes móviles reintentan create_order cuando vence el timeout; sin
+clave, cada reintento reservaría stock y crearía otra orden y otro
+PaymentIntent. Con el decorador `idempotente`:
+
+1. La primera petición con una clave la reclama insertando un
+   IdempotencyKey sin respuesta (un INSERT sobre la restricción única
+   user + key decide quién gana, también entre procesos).
+2. Al terminar guarda la respuesta si fue exitosa (2xx). Los errores
+   liberan la clave, así que el cliente puede reintentar con la misma.
+3. Un reintento de una petición terminada recibe la respuesta guardada
+   (header Idempotent-Replayed: true) con una sola lectura indexada: no
+   toca productos, órdenes ni Stripe.
+4. Un duplicado que llega mientras la original sigue en curso espera su
+   resultado (hasta IDEMPOTENCY_WAIT_TIMEOUT segundos; luego 409).
+5. Reusar una clave con otro cuerpo responde 422.
+6. La reclamación es un lease de IDEMPOTENCY_LEASE segundos
+   (locked_until). Si la petición original no termina (el proceso se cayó
+   o se reinició el worker), un reintento con el mismo cuerpo toma la
+   clave vencida con un UPDATE condicional y ejecuta la petición. Solo
+   quien tiene el lease vigente guarda la respuesta o libera la clave.
+
+Las claves se guardan por usuario durante IDEMPOTENCY_KEY_TTL horas;
+purge_idempotency_keys elimina las vencidas.
+"""
+
+import functools
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+
+HEADER = 'Idempotency-Key'
+MAX_LARGO_CLAVE = 255
+
+
+def huella(datos):
+    """SHA-256 del cuerpo de la petición, independiente del orden de claves."""
+    contenido = json.dumps(datos, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(contenido.encode()).hexdigest()
+
+
+def lease_vencido(fila):
+    """True si la petición en curso que tiene la clave dejó de renovarla."""
+    return fila.status_code is None and fila.locked_until <= timezone.now()
+
+
+def tomar(fila):
+    """
+    Toma una clave abandonada (en curso con el lease vencido) con un UPDATE
+    condicional: entre varios reintentos solo uno lo logra. Retorna True
+    si la tomó.
+    """
+    bloqueo = timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_LEASE)
+    tomadas = IdempotencyKey.objects.filter(
+        pk=fila.pk, status_code__isnull=True, locked_until=fila.locked_until
+    ).update(locked_until=bloqueo)
+    if tomadas:
+        fila.locked_until = bloqueo
+    return bool(tomadas)
+
+
+def reclamar(user, clave, request_hash):
+    """
+    Intenta reclamar la clave para esta petición. Retorna (fila, propia):
+    propia es True si la petición debe ejecutarse; si no, `fila` es la
+    petición original (terminada o en curso). Las claves vencidas se
+    reemplazan y las abandonadas se toman.
+    """
+    while True:
+        # Los reintentos de peticiones terminadas son el caso frecuente:
+        # una lectura y listo
+        fila = IdempotencyKey.objects.filter(user=user, key=clave).first()
+        if fila is not None:
+            if fila.expires_at <= timezone.now():
+                IdempotencyKey.objects.filter(pk=fila.pk, expires_at__lte=timezone.now()).delete()
+            elif fila.request_hash == request_hash and lease_vencido(fila):
+                if tomar(fila):
+                    return fila, True
+                continue
+            else:
+                return fila, False
+        try:
+            with transaction.atomic():
+                ahora = timezone.now()
+                fila = IdempotencyKey.objects.create(
+                    user=user,
+                    key=clave,
+                    request_hash=request_hash,
+                    locked_until=ahora + timedelta(seconds=settings.IDEMPOTENCY_LEASE),
+                    expires_at=ahora + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL),
+                )
+            return fila, True
+        except IntegrityError:
+            # Otra petición con la misma clave la reclamó primero
+            continue
+
+
+def esperar(fila, timeout):
+    """
+    Espera a que la petición original termine. Retorna la fila con la
+    respuesta, None si la original liberó la clave (falló) o la última
+    fila sin respuesta si se agotó el tiempo o venció su lease.
+    """
+    limite = time.monotonic() + timeout
+    pausa = 0.02
+    while time.monotonic() < limite and not lease_vencido(fila):
+        time.sleep(pausa)
+        pausa = min(pausa * 2, 0.5)
+        fila = IdempotencyKey.objects.filter(pk=fila.pk).first()
+        if fila is None or fila.status_code is not None:
+            return fila
+    return fila
+
+
+def repetir(fila):
+    """Response con la respuesta guardada de la petición original."""
+    response = Response(fila.response, status=fila.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotente(vista):
+    """
+    Decorador para acciones POST de un ViewSet que hace idempotentes las
+    peticiones que traen el header Idempotency-Key (ver el módulo).
+    Sin el header la acción se ejecuta como siempre.
+    """
+
+    @functools.wraps(vista)
+    def envoltura(self, request, *args, **kwargs):
+        clave = request.headers.get(HEADER)
+        if not clave:
+            return vista(self, request, *args, **kwargs)
+        if len(clave) > MAX_LARGO_CLAVE:
+            return Response(
+                {'error': f'{HEADER} no puede superar {MAX_LARGO_CLAVE} caracteres'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        request_hash = huella(request.data)
+        while True:
+            fila, propia = reclamar(request.user, clave, request_hash)
+            if propia:
+                break
+            if fila.request_hash != request_hash:
+                return Response(
+                    {'error': f'{HEADER} ya se usó con otra petición'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            if fila.status_code is None:
+                fila = esperar(fila, settings.IDEMPOTENCY_WAIT_TIMEOUT)
+                if fila is None or lease_vencido(fila):
+                    continue
+                if fila.status_code is None:
+                    return Response(
+                        {'error': 'La petición original sigue en curso, reintenta más tarde'},
+                        status=status.HTTP_409_CONFLICT
+                    )
+            return repetir(fila)
+
+        # Si otro reintento tomó la clave (este lease venció), es suya
+        propia = IdempotencyKey.objects.filter(
+            pk=fila.pk, status_code__isnull=True, locked_until=fila.locked_until
+        )
+        try:
+            response = vista(self, request, *args, **kwargs)
+        except BaseException:
+            propia.delete()
+            raise
+        if status.is_success(response.status_code):
+            propia.update(status_code=response.status_code, response=response.data)
+        else:
+            propia.delete()
+        return response
+
+    return envoltura
+
+
+def purgar_vencidas(ahora=None):
+    """Elimina las claves vencidas. Retorna cuántas eliminó."""
+    ahora = ahora or timezone.now()
+    eliminadas, _ = IdempotencyKey.objects.filter(expires_at__lte=ahora).delete()
+    return eliminadas
@@ -0,0 +1,120 @@
+"""
+Management command para medir cuánto tiempo retiene bloqueos el checkout
+bajo carga concurrente, con un proveedor de pagos local (orders.stripe_stub)
+de latencia configurable.
+
+Compara dos modos con el mismo carrito (todos los hilos compran el mismo
+producto, el peor caso de contención):
+  - dos-fases: el flujo de create_order (reserva, Stripe sin bloqueos,
+    adjuntar intent)
+  - una-fase: las tres fases dentro de una sola transacción, como antes,
+    así que la llamada al proveedor ocurre con el producto bloqueado
+
+Para cada modo reporta el tiempo dentro de transacciones por checkout
+(incluye la espera por el bloqueo), la latencia total, el throughput y
+los checkouts fallidos. Los datos se crean en la base de datos
+configurada y se eliminan al terminar.
+
+Uso:
+    python manage.py benchmark_checkout --hilos 8 --checkouts 40 --latencia 0.1
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from categorias.models import Categoria
+from orders.models import Order
+from orders.services import adjuntar_payment_intent, crear_payment_intent, reservar_orden
+from orders.stripe_stub import ServidorStripeStub
+from productos.models import Producto
+
+
+BILLING = {
+    'name': 'Benchmark', 'email': 'bench@example.com', 'phone': '',
+    'address': '', 'city': '', 'country': 'US',
+}
+
+
+def percentiles_ms(tiempos):
+    tiempos_ms = np.asarray(tiempos) * 1000
+    return np.percentile(tiempos_ms, 50), np.percentile(tiempos_ms, 99)
+
+
+class Command(BaseCommand):
+    help = 'Mide el tiempo con bloqueos del checkout con un proveedor de pagos local'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8)
+        parser.add_argument('--checkouts', type=int, default=40)
+        parser.add_argument('--latencia', type=float, default=0.1,
+                            help='Segundos de respuesta del proveedor de pagos')
+        parser.add_argument('--modo', choices=['dos-fases', 'una-fase', 'ambos'], default='ambos')
+
+    def handle(self, *args, **options):
+        modos = ['dos-fases', 'una-fase'] if options['modo'] == 'ambos' else [options['modo']]
+        usuario = User.objects.create(username=f'benchmark_checkout_{time.time_ns()}')
+        categoria = Categoria.objects.create(nombre='Benchmark checkout')
+        producto = Producto.objects.create(
+            nombre='Producto concurrido', precio=10, stock=10 ** 6, categoria=categoria
+        )
+        try:
+            with ServidorStripeStub(latencia=options['latencia']):
+                self.stdout.write(
+                    f"{'modo':<10} {'en tx p50':>10} {'en tx p99':>10} "
+                    f"{'total p50':>10} {'total p99':>10} {'checkouts/s':>12} {'errores':>8}"
+                )
+                for modo in modos:
+                    self.medir(modo, usuario, producto, options)
+        finally:
+            Order.objects.filter(user=usuario).delete()
+            producto.delete()
+            categoria.delete()
+            usuario.delete()
+
+    def medir(self, modo, usuario, producto, options):
+        items = [{'producto_id': producto.pk, 'cantidad': 1}]
+
+        def checkout(_):
+            inicio = time.perf_counter()
+            try:
+                if modo == 'dos-fases':
+                    order = reservar_orden(usuario, items, BILLING)
+                    en_transaccion = time.perf_counter() - inicio
+                    intent = crear_payment_intent(order)
+                    fase3 = time.perf_counter()
+                    with transaction.atomic():
+                        adjuntar_payment_intent(order, intent)
+                    en_transaccion += time.perf_counter() - fase3
+                else:
+                    with transaction.atomic():
+                        order = reservar_orden(usuario, items, BILLING)
+                        intent = crear_payment_intent(order)
+                        adjuntar_payment_intent(order, intent)
+                    en_transaccion = time.perf_counter() - inicio
+                return en_transaccion, time.perf_counter() - inicio
+            except Exception as e:
+                return e
+            finally:
+                connection.close()
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['hilos']) as pool:
+            resultados = list(pool.map(checkout, range(options['checkouts'])))
+        duracion = time.perf_counter() - inicio
+
+        exitosos = [r for r in resultados if isinstance(r, tuple)]
+        errores = [r for r in resultados if not isinstance(r, tuple)]
+        if not exitosos:
+            self.stdout.write(f'{modo:<10} sin checkouts exitosos: {errores[0]}')
+            return
+        tx_p50, tx_p99 = percentiles_ms([r[0] for r in exitosos])
+        total_p50, total_p99 = percentiles_ms([r[1] for r in exitosos])
+        self.stdout.write(
+            f'{modo:<10} {tx_p50:>8.1f}ms {tx_p99:>8.1f}ms {total_p50:>8.1f}ms '
+            f'{total_p99:>8.1f}ms {len(exitosos) / duracion:>12.1f} {len(errores):>8}'
+        )
@@ -0,0 +1,42 @@
+"""
+Worker que aplica los eventos de Stripe guardados por el webhook.
+
+Toma los eventos pendientes de la bandeja de entrada (StripeEvent) en
+bloques y aplica cada bloque en una transacción: estados de las órdenes
+con bulk_update y devolución de stock con un UPDATE con F()
+(ver orders.webhooks).
+
+Uso:
+    python manage.py process_stripe_events            # corre indefinidamente
+    python manage.py process_stripe_events --once     # vacía la bandeja y termina
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.webhooks import procesar_eventos
+
+
+class Command(BaseCommand):
+    help = 'Aplica en lote los eventos de Stripe recibidos por el webhook'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Eventos por transacción')
+        parser.add_argument('--sleep', type=float, default=1.0,
+                            help='Segundos de espera cuando no hay eventos')
+        parser.add_argument('--once', action='store_true',
+                            help='Procesar los eventos pendientes y terminar')
+
+    def handle(self, *args, **options):
+        tamano = max(1, options['batch_size'])
+
+        while True:
+            eventos, ordenes = procesar_eventos(tamano)
+            if not eventos:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+            self.stdout.write(f'Eventos aplicados: {eventos} (órdenes actualizadas: {ordenes})')
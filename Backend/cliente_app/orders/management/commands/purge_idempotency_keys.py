@@ -0,0 +1,19 @@
+"""
+Management command que elimina las Idempotency-Key vencidas
+(IDEMPOTENCY_KEY_TTL). Pensado para ejecutarse periódicamente (cron).
+
+Uso:
+    python manage.py purge_idempotency_keys
+"""
+
+from django.core.management.base import BaseCommand
+
+from orders.idempotency import purgar_vencidas
+
+
+class Command(BaseCommand):
+    help = 'Elimina las respuestas guardadas de Idempotency-Key vencidas'
+
+    def handle(self, *args, **options):
+        eliminadas = purgar_vencidas()
+        self.stdout.write(self.style.SUCCESS(f'Claves eliminadas: {eliminadas}'))
@@ -0,0 +1,67 @@
+"""
+Management command que cancela en bloque las órdenes abandonadas.
+
+Una orden pendiente reserva su stock (StockReservation) por
+ORDER_RESERVATION_TTL minutos. Cuando sus reservas vencen y la orden sigue
+pendiente (el cliente abandonó el pago, o el proceso cayó entre las fases
+del checkout), se cancela su PaymentIntent y, por bloques, las órdenes
+pasan a 'cancelled' y lo reservado vuelve a estar disponible con un UPDATE
+para todo el bloque. Pensado para ejecutarse periódicamente (cron).
+
+Uso:
+    python manage.py release_expired_orders
+    python manage.py release_expired_orders --batch-size 1000 --dry-run
+"""
+
+import stripe
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from orders.services import expirar_ordenes, ordenes_vencidas
+
+
+class Command(BaseCommand):
+    help = 'Cancela las órdenes pendientes con reservas vencidas y libera su stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Órdenes por transacción')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Solo listar las órdenes vencidas')
+
+    def handle(self, *args, **options):
+        stripe.api_key = getattr(settings, 'STRIPE_SECRET_KEY', '')
+        tamano = max(1, options['batch_size'])
+        ahora = timezone.now()
+
+        if options['dry_run']:
+            vencidas = list(ordenes_vencidas(ahora))
+            for order_id, _ in vencidas:
+                self.stdout.write(f'  Orden #{order_id}')
+            self.stdout.write(f'Órdenes vencidas: {len(vencidas)}')
+            return
+
+        liberadas = 0
+        omitidas = set()
+        while True:
+            bloque = list(ordenes_vencidas(ahora).exclude(pk__in=omitidas)[:tamano])
+            if not bloque:
+                break
+            cancelables = []
+            for order_id, intent_id in bloque:
+                if intent_id:
+                    try:
+                        stripe.PaymentIntent.cancel(intent_id)
+                    except stripe.error.StripeError as e:
+                        # Por ejemplo, el pago ya se completó: no se libera
+                        omitidas.add(order_id)
+                        self.stderr.write(f'  Orden #{order_id}: no se pudo cancelar el pago ({e})')
+                        continue
+                cancelables.append(order_id)
+            # Las canceladas (o pagadas mientras tanto) dejan de estar pendientes
+            liberadas += len(expirar_ordenes(cancelables))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Órdenes canceladas: {liberadas} (omitidas: {len(omitidas)})'
+        ))
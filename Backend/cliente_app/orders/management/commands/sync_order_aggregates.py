@@ -0,0 +1,69 @@
+"""
+Management command que completa y verifica los agregados de las órdenes.
+
+Recorre las órdenes por bloques de id y compara item_count, units y
+total_amount con sus items (una consulta agregada por bloque, ver
+orders.agregados). Corrige item_count y units con un bulk_update por
+bloque; las diferencias en total_amount solo se informan, porque es el
+monto que se cobró. Sirve para completar las órdenes anteriores a estas
+columnas y, con --check, para verificar la consistencia (por ejemplo en
+CI o en un cron), terminando con error si algo no coincide.
+
+Uso:
+    python manage.py sync_order_aggregates
+    python manage.py sync_order_aggregates --check --batch-size 5000
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from orders.agregados import inconsistencias, sincronizar
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Completa y verifica item_count, units y total_amount de las órdenes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Órdenes por bloque')
+        parser.add_argument('--check', action='store_true',
+                            help='Solo verificar; termina con error si hay diferencias')
+
+    def handle(self, *args, **options):
+        tamano = max(1, options['batch_size'])
+        revisadas = corregidas = 0
+        diferentes = []
+        ultimo = 0
+
+        while True:
+            bloque = list(
+                Order.objects.filter(pk__gt=ultimo).order_by('pk')
+                .only('id', 'item_count', 'units', 'total_amount')[:tamano]
+            )
+            if not bloque:
+                break
+            ultimo = bloque[-1].pk
+            revisadas += len(bloque)
+
+            diferencias = inconsistencias(bloque)
+            for order_id, (guardados, reales) in diferencias.items():
+                diferentes.append(order_id)
+                if options['check'] or guardados.total_amount != reales.total_amount:
+                    self.stderr.write(
+                        f'  Orden #{order_id}: guardado {tuple(guardados)}, items {tuple(reales)}'
+                    )
+            if diferencias and not options['check']:
+                with transaction.atomic():
+                    corregidas += len(sincronizar(bloque, diferencias))
+
+        if options['check']:
+            if diferentes:
+                raise CommandError(
+                    f'{len(diferentes)} de {revisadas} órdenes con agregados inconsistentes'
+                )
+            self.stdout.write(self.style.SUCCESS(f'Órdenes verificadas: {revisadas}'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Órdenes revisadas: {revisadas}, corregidas: {corregidas}'
+        ))
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.3 on 2026-10-17 22:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True)),
+                ('type', models.CharField(max_length=100)),
+                ('payment_intent_id', models.CharField(blank=True, help_text='ID del PaymentIntent al que se refiere el evento, si aplica', max_length=255)),
+                ('payload', models.JSONField(help_text='Evento tal como lo envió Stripe')),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Stripe Event',
+                'verbose_name_plural': 'Stripe Events',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.1.3 on 2026-10-17 22:13
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def reservar_ordenes_pendientes(apps, schema_editor):
+    """
+    Las órdenes pendientes o en proceso creadas antes no sacaron nada del
+    stock (el código original lo descontaba recién al confirmar el pago).
+    Sus cantidades se apartan como cualquier reserva nueva: se suman a
+    Producto.reservado y se registran en StockReservation, sin tocar el
+    stock. Al pagarlas la reserva sale del stock y al cancelarlas o
+    vencer solo se libera lo reservado.
+    """
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    Producto = apps.get_model('productos', 'Producto')
+    StockReservation = apps.get_model('orders', 'StockReservation')
+    ttl = timedelta(minutes=getattr(settings, 'ORDER_RESERVATION_TTL', 30))
+
+    vencimientos = dict(
+        Order.objects.filter(status__in=['pending', 'processing'])
+        .values_list('id', 'created_at')
+    )
+    cantidades = {}
+    reservas = {}
+    for order_id, producto_id, cantidad in OrderItem.objects.filter(
+        order_id__in=list(vencimientos)
+    ).values_list('order_id', 'producto_id', 'cantidad'):
+        cantidades[producto_id] = cantidades.get(producto_id, 0) + cantidad
+        clave = (order_id, producto_id)
+        reservas[clave] = reservas.get(clave, 0) + cantidad
+
+    for producto_id, cantidad in cantidades.items():
+        Producto.objects.filter(pk=producto_id).update(reservado=F('reservado') + cantidad)
+    StockReservation.objects.bulk_create([
+        StockReservation(
+            order_id=order_id,
+            producto_id=producto_id,
+            cantidad=cantidad,
+            expires_at=vencimientos[order_id] + ttl,
+        )
+        for (order_id, producto_id), cantidad in reservas.items()
+    ])
+
+
+def devolver_reservas(apps, schema_editor):
+    Producto = apps.get_model('productos', 'Producto')
+    StockReservation = apps.get_model('orders', 'StockReservation')
+    for producto_id, cantidad in StockReservation.objects.values_list('producto_id', 'cantidad'):
+        Producto.objects.filter(pk=producto_id).update(reservado=F('reservado') - cantidad)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_stripeevent'),
+        ('productos', '0009_producto_reservado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField(help_text='Unidades reservadas')),
+                ('expires_at', models.DateTimeField(db_index=True, help_text='Momento en que la reserva vence si la orden sigue pendiente')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(help_text='Orden que retiene el stock', on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='orders.order')),
+                ('producto', models.ForeignKey(help_text='Producto reservado', on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='productos.producto')),
+            ],
+            options={
+                'verbose_name': 'Stock Reservation',
+                'verbose_name_plural': 'Stock Reservations',
+                'constraints': [models.UniqueConstraint(fields=('order', 'producto'), name='stock_reservation_unica')],
+            },
+        ),
+        migrations.RunPython(reservar_ordenes_pendientes, devolver_reservas),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-17 22:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_order_user_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Cantidad de items (líneas) de la orden'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='units',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Unidades sumando todos los items'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.3 on 2026-10-17 22:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_order_item_count_units'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='stripe_payment_intent_id',
+            field=models.CharField(blank=True, db_index=True, help_text='ID del PaymentIntent de Stripe', max_length=255, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-created_at', '-id'], name='order_created_idx'),
+        ),
+    ]
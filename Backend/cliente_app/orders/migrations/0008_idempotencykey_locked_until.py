@@ -0,0 +1,22 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_order_admin_indexes'),
+    ]
+
+    operations = [
+        # Las claves en curso al migrar quedan con el lease vencido: sus
+        # peticiones murieron con el despliegue
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='locked_until',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Fin del lease de la petición en curso; vencido sin respuesta, un reintento puede tomar la clave'),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_idempotencykey_locked_until'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stripeevent',
+            name='requires_review',
+            field=models.BooleanField(default=False, help_text='Pago exitoso de una orden ya cancelada o fallida: el cliente fue cobrado sin orden ni stock, revisar y reembolsar'),
+        ),
+    ]
@@ -1,4 +1,7 @@
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 from productos.models import Producto
 
@@ -37,6 +40,18 @@ class Order(models.Model):
         decimal_places=2,
         help_text='Monto total de la orden'
     )
+    # Agregados de los items, escritos al crear la orden para que los
+    # listados no lean OrderItem (ver orders.agregados)
+    item_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text='Cantidad de items (líneas) de la orden'
+    )
+    units = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text='Unidades sumando todos los items'
+    )
     status = models.CharField(
         max_length=20,
         choices=STATUS_CHOICES,
@@ -47,6 +62,7 @@ class Order(models.Model):
         max_length=255,
         blank=True,
         null=True,
+        db_index=True,
         help_text='ID del PaymentIntent de Stripe'
     )
 
@@ -63,14 +79,29 @@ class Order(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Listado paginado por cursor de las órdenes de un usuario
+            models.Index(
+                fields=['user', '-created_at', '-id'],
+                name='order_user_created_idx',
+            ),
+            # Orden y date_hierarchy del admin sobre todas las órdenes
+            models.Index(fields=['-created_at', '-id'], name='order_created_idx'),
+        ]
         verbose_name = 'Order'
         verbose_name_plural = 'Orders'
 
     def __str__(self):
-        return f"Order #{self.id} - {self.user.username} - {self.status}"
+        # El usuario solo se muestra si ya está cargado: __str__ no consulta
+        # (se usa por fila en el admin y en los logs)
+        usuario = self.user.username if Order.user.is_cached(self) else f'user #{self.user_id}'
+        return f"Order #{self.pk} - {usuario} - {self.status}"
 
     def calculate_total(self):
-        """Calcula el total de la orden basado en los items."""
+        """
+        Calcula el total de la orden basado en los items. Lee todos los
+        items; para listados usar total_amount, item_count y units.
+        """
         return sum(item.subtotal for item in self.items.all())
 
 
@@ -113,7 +144,12 @@ class OrderItem(models.Model):
         verbose_name_plural = 'Order Items'
 
     def __str__(self):
-        return f"{self.cantidad}x {self.producto.nombre} - Order #{self.order.id}"
+        # Sin consultas: el nombre del producto solo si ya está cargado
+        producto = (
+            self.producto.nombre if OrderItem.producto.is_cached(self)
+            else f'producto #{self.producto_id}'
+        )
+        return f"{self.cantidad}x {producto} - Order #{self.order_id}"
 
     def save(self, *args, **kwargs):
         """
@@ -124,3 +160,143 @@ class OrderItem(models.Model):
             self.precio_unitario = self.producto.precio
         self.subtotal = self.precio_unitario * self.cantidad
         super().save(*args, **kwargs)
+
+
+class StockReservation(models.Model):
+    """
+    Unidades de un producto apartadas por una orden pendiente.
+
+    Mientras existe, la cantidad está sumada en Producto.reservado (lo
+    mantiene productos.stock). Se elimina cuando la orden se paga (la
+    reserva pasa a venta) o se libera; release_expired_orders cancela en
+    bloque las órdenes pendientes cuyas reservas vencieron.
+    """
+
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.CASCADE,
+        related_name='reservations',
+        help_text='Orden que retiene el stock'
+    )
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.CASCADE,
+        related_name='reservations',
+        help_text='Producto reservado'
+    )
+    cantidad = models.PositiveIntegerField(help_text='Unidades reservadas')
+    expires_at = models.DateTimeField(
+        db_index=True,
+        help_text='Momento en que la reserva vence si la orden sigue pendiente'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['order', 'producto'],
+                name='stock_reservation_unica'
+            ),
+        ]
+        verbose_name = 'Stock Reservation'
+        verbose_name_plural = 'Stock Reservations'
+
+    def __str__(self):
+        return f"{self.cantidad}x producto #{self.producto_id} - Order #{self.order_id}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Respuesta guardada de una petición con header Idempotency-Key.
+
+    Se crea al empezar la petición (sin respuesta, "en curso") y guarda la
+    respuesta exitosa al terminar; un reintento con la misma clave del
+    mismo usuario recibe esa respuesta sin repetir la operación. Ver
+    orders.idempotency.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='idempotency_keys'
+    )
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(
+        max_length=64,
+        help_text='SHA-256 del cuerpo de la petición original'
+    )
+    status_code = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        help_text='Vacío mientras la petición original está en curso'
+    )
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    locked_until = models.DateTimeField(
+        help_text='Fin del lease de la petición en curso; vencido sin '
+                  'respuesta, un reintento puede tomar la clave'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'key'],
+                name='idempotency_key_unica'
+            ),
+        ]
+        verbose_name = 'Idempotency Key'
+        verbose_name_plural = 'Idempotency Keys'
+
+    def __str__(self):
+        return f"{self.key} (user #{self.user_id})"
+
+
+class StripeEvent(models.Model):
+    """
+    Bandeja de entrada de los eventos que Stripe envía al webhook.
+
+    Solo se insertan (una fila por event_id, así que los reintentos de
+    Stripe no se duplican) y se marcan como procesados: el worker
+    process_stripe_events aplica sus efectos sobre las órdenes en lote.
+    """
+
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payment_intent_id = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text='ID del PaymentIntent al que se refiere el evento, si aplica'
+    )
+    payload = models.JSONField(help_text='Evento tal como lo envió Stripe')
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    requires_review = models.BooleanField(
+        default=False,
+        help_text='Pago exitoso de una orden ya cancelada o fallida: el cliente '
+                  'fue cobrado sin orden ni stock, revisar y reembolsar'
+    )
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'Stripe Event'
+        verbose_name_plural = 'Stripe Events'
+
+    def __str__(self):
+        return f"{self.type} ({self.event_id})"
+
+
+@receiver(post_save, sender=Order)
+def registrar_compras_conjuntas(sender, instance, update_fields=None, **kwargs):
+    """
+    Suma la orden a las compras conjuntas del recomendador cuando queda
+    pagada. registrar_orden es idempotente, así que guardar de nuevo una
+    orden pagada no la cuenta dos veces.
+    """
+    from productos.compras_conjuntas import ESTADOS_PAGADOS, registrar_orden
+
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    if instance.status in ESTADOS_PAGADOS:
+        order_id = instance.pk
+        transaction.on_commit(lambda: registrar_orden(order_id))
@@ -0,0 +1,107 @@
+"""
+Paginación por cursor del listado de órdenes.
+
+Con OFFSET la base de datos lee y descarta todas las filas anteriores a la
+página pedida, así que las páginas profundas de un usuario con muchas
+órdenes se vuelven lentas, y una orden nueva desplaza las demás entre
+páginas. El cursor guarda la posición (created_at, id) de la última orden
+entregada y la página siguiente se pide con
+
+    WHERE user_id = ?
+      AND created_at <= ? AND (created_at < ? OR id < ?)
+    ORDER BY created_at DESC, id DESC
+
+que recorre el índice (user, -created_at, -id) de Order desde esa
+posición, sin importar cuán profunda sea la página.
+"""
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class OrderCursorPagination(CursorPagination):
+    """
+    Cursor sobre (-created_at, -id). El CursorPagination de DRF solo
+    guarda created_at y desempata con un offset, que vuelve a desplazarse
+    cuando varias órdenes comparten el instante; aquí la posición incluye
+    el id, así que es única y el offset siempre es 0.
+    Admite ?page_size= hasta max_page_size.
+    """
+
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def _get_position_from_instance(self, instance, ordering):
+        return f'{instance.created_at.isoformat()}|{instance.pk}'
+
+    def _posicion(self, posicion):
+        """(created_at, id) de una posición del cursor."""
+        try:
+            fecha, pk = posicion.split('|')
+            fecha, pk = parse_datetime(fecha), int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if fecha is None:
+            raise NotFound(self.invalid_cursor_message)
+        return fecha, pk
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        posicion = self.cursor.position if self.cursor else None
+
+        # El cursor inverso (página anterior) recorre hacia las más nuevas
+        if reverse:
+            queryset = queryset.order_by('created_at', 'id')
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if posicion is not None:
+            fecha, pk = self._posicion(posicion)
+            if reverse:
+                queryset = queryset.filter(
+                    Q(created_at__gt=fecha) | Q(id__gt=pk), created_at__gte=fecha
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(created_at__lt=fecha) | Q(id__lt=pk), created_at__lte=fecha
+                )
+
+        # Una fila de más indica si hay otra página en la misma dirección
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        hay_mas = len(results) > len(self.page)
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = posicion is not None, hay_mas
+        else:
+            self.has_next, self.has_previous = hay_mas, posicion is not None
+        self.display_page_controls = self.has_next or self.has_previous
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        posicion = (
+            self._get_position_from_instance(self.page[-1], self.ordering)
+            if self.page else self.cursor.position
+        )
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=posicion))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        posicion = (
+            self._get_position_from_instance(self.page[0], self.ordering)
+            if self.page else self.cursor.position
+        )
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=posicion))
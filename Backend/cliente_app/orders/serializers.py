@@ -3,6 +3,7 @@ from django.contrib.auth.models import User
 from .models import Order, OrderItem
 from productos.serializers import ProductoSerializer
 from productos.models import Producto
+from cliente_app.fieldsets import SparseFieldsetMixin
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -40,14 +41,29 @@ class OrderItemSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'precio_unitario', 'subtotal']
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class ItemsDeOrdenSerializer(serializers.ListSerializer):
+    """
+    Items de una orden. Si la orden trae items_guardados (los que
+    orders.services.guardar_items acaba de insertar) los usa en lugar de
+    consultar order.items.
+    """
+
+    def get_attribute(self, instance):
+        guardados = getattr(instance, 'items_guardados', None)
+        if guardados is not None:
+            return guardados
+        return super().get_attribute(instance)
+
+
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer completo para órdenes.
     Incluye información del usuario, items y campos calculados.
+    Admite ?fields= para limitar los campos en los listados.
     """
 
     user = UserSerializer(read_only=True)
-    items = OrderItemSerializer(many=True, read_only=True)
+    items = ItemsDeOrdenSerializer(child=OrderItemSerializer(), read_only=True)
     client_secret = serializers.CharField(read_only=True, required=False)
 
     class Meta:
@@ -58,6 +74,8 @@ class OrderSerializer(serializers.ModelSerializer):
             'created_at',
             'updated_at',
             'total_amount',
+            'item_count',
+            'units',
             'status',
             'stripe_payment_intent_id',
             'billing_name',
@@ -76,25 +94,46 @@ class OrderSerializer(serializers.ModelSerializer):
             'created_at',
             'updated_at',
             'total_amount',
+            'item_count',
+            'units',
             'status',
             'stripe_payment_intent_id',
         ]
 
 
+class OrderSummarySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    Serializer liviano para el listado de órdenes.
+    No anida usuario ni items: item_count y units son columnas de la orden
+    (ver orders.agregados). El detalle completo se obtiene con
+    GET /api/orders/{id}/.
+    """
+
+    class Meta:
+        model = Order
+        fields = [
+            'id',
+            'created_at',
+            'updated_at',
+            'total_amount',
+            'status',
+            'billing_name',
+            'billing_address',
+            'billing_city',
+            'item_count',
+            'units',
+        ]
+        read_only_fields = fields
+
+
 class CreateOrderItemSerializer(serializers.Serializer):
     """Serializer para validar items al crear una orden."""
 
+    # La existencia y el stock se verifican al reservar la orden
+    # (orders.services.reservar_orden), no aquí
     producto_id = serializers.IntegerField()
     cantidad = serializers.IntegerField(min_value=1)
 
-    def validate_producto_id(self, value):
-        """Valida que el producto exista."""
-        try:
-            Producto.objects.get(id=value)
-        except Producto.DoesNotExist:
-            raise serializers.ValidationError(f"Producto con ID {value} no existe.")
-        return value
-
 
 class BillingDetailsSerializer(serializers.Serializer):
     """Serializer para validar datos de facturación."""
@@ -118,30 +157,21 @@ class CreateOrderSerializer(serializers.Serializer):
     notes = serializers.CharField(required=False, allow_blank=True)
 
     def validate_items(self, value):
-        """Valida que haya al menos un item en la orden."""
-        if not value:
-            raise serializers.ValidationError("La orden debe tener al menos un item.")
-        return value
-
-    def validate(self, data):
         """
-        Validación adicional de la orden completa.
-        Verifica stock disponible para todos los productos.
+        Valida que haya al menos un item y une las líneas repetidas del
+        mismo producto (sumando cantidades) conservando el orden.
         """
-        items = data.get('items', [])
-
-        # Verificar stock para cada producto
-        for item_data in items:
-            producto = Producto.objects.get(id=item_data['producto_id'])
-            cantidad_solicitada = item_data['cantidad']
-
-            if producto.stock < cantidad_solicitada:
-                raise serializers.ValidationError({
-                    'items': f"Stock insuficiente para {producto.nombre}. "
-                             f"Disponible: {producto.stock}, Solicitado: {cantidad_solicitada}"
-                })
-
-        return data
+        if not value:
+            raise serializers.ValidationError("La orden debe tener al menos un item.")
+        cantidades = {}
+        for item in value:
+            cantidades[item['producto_id']] = (
+                cantidades.get(item['producto_id'], 0) + item['cantidad']
+            )
+        return [
+            {'producto_id': producto_id, 'cantidad': cantidad}
+            for producto_id, cantidad in cantidades.items()
+        ]
 
 
 class ConfirmPaymentSerializer(serializers.Serializer):
@@ -0,0 +1,350 @@
+"""
+Lógica de creación de órdenes compartida por las vistas.
+
+Los productos del carrito se leen con una sola consulta (precio y
+existencia) y el carrito completo se reserva con un solo UPDATE
+condicional sobre Producto.reservado (productos.stock.reservar_stock), que
+nunca deja lo disponible negativo aunque otros checkouts compren lo mismo
+a la vez, sin bloquear filas mientras la orden espera el pago. Los items
+y las reservas se insertan con bulk_create, así que la cantidad de
+consultas no depende del tamaño del carrito.
+
+El stock de una orden sigue su estado:
+- pending / processing: reservado (StockReservation + Producto.reservado)
+- paid / completed: vendido, la reserva se consume (sale del stock)
+- failed / cancelled: la reserva se libera
+
+Las órdenes abiertas creadas por el código original no tomaban stock
+hasta el pago; la migración 0003_stockreservation les crea su reserva.
+Si una orden abierta llega a pagarse sin reservas, vender_ordenes
+descuenta sus items del stock (y cancelarla no devuelve nada), así que
+nunca queda una venta sin descontar ni se devuelve stock que no se tomó.
+
+El checkout tiene dos fases para no retener bloqueos mientras se espera
+al proveedor de pagos:
+
+1. reservar_orden: transacción corta que crea la orden pendiente con sus
+   items y reserva el stock.
+2. crear_payment_intent: llamada a Stripe sin transacción ni bloqueos,
+   con una idempotency key por orden (reintentar no duplica el cobro).
+3. adjuntar_payment_intent: segunda transacción corta que guarda el
+   intent solo si la orden sigue pendiente.
+
+Si el proveedor falla, compensar cancela la orden y libera la reserva; es
+idempotente. Las órdenes abandonadas se cancelan en bloque cuando vencen
+sus reservas (expirar_ordenes, release_expired_orders).
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+import stripe
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from productos.models import Producto
+from productos.stock import (
+    consumir_reserva,
+    descontar_stock,
+    liberar_reserva,
+    reponer_stock,
+    reservar_stock,
+)
+
+from .agregados import agregados_de_items
+from .models import Order, OrderItem, StockReservation
+
+
+# Estados en los que la orden retiene stock reservado (StockReservation)
+ESTADOS_CON_RESERVA = ('pending', 'processing')
+# Estados en los que la reserva ya se convirtió en venta
+ESTADOS_VENDIDOS = ('paid', 'completed')
+# Estados finales que devuelven la reserva
+ESTADOS_QUE_LIBERAN = ('failed', 'cancelled')
+
+
+class ProductosNoEncontrados(Exception):
+    """Algún producto del carrito no existe."""
+
+    def __init__(self, ids):
+        self.ids = sorted(ids)
+        super().__init__(f'Productos inexistentes: {self.ids}')
+
+
+class StockInsuficiente(Exception):
+    """
+    Las cantidades pedidas superan el stock de uno o más productos.
+    `faltantes` es {producto_id: productos.stock.Faltante}.
+    """
+
+    def __init__(self, faltantes):
+        self.faltantes = faltantes
+        detalle = ', '.join(
+            f'{f.nombre} (disponible: {f.disponible})' for f in faltantes.values()
+        )
+        super().__init__(f'Stock insuficiente para {detalle}')
+
+
+def cargar_productos(items):
+    """
+    Lee los productos del carrito (sin el embedding) con una sola
+    consulta. `items` es una lista de {'producto_id', 'cantidad'} sin ids
+    repetidos. Retorna {id: Producto}.
+    """
+    ids = [item['producto_id'] for item in items]
+    productos = Producto.objects.defer('embedding').in_bulk(ids)
+    faltantes = set(ids) - set(productos)
+    if faltantes:
+        raise ProductosNoEncontrados(faltantes)
+    return productos
+
+
+def construir_items(items, productos):
+    """
+    OrderItems sin guardar (precio actual del producto) y el total.
+    Retorna (items, total).
+    """
+    nuevos = []
+    total = Decimal('0.00')
+    for item in items:
+        producto = productos[item['producto_id']]
+        subtotal = producto.precio * item['cantidad']
+        total += subtotal
+        nuevos.append(OrderItem(
+            producto=producto,
+            cantidad=item['cantidad'],
+            precio_unitario=producto.precio,
+            subtotal=subtotal,
+        ))
+    return nuevos, total
+
+
+def guardar_items(order, items):
+    """
+    Inserta los items con un solo bulk_create y los deja en
+    order.items_guardados: OrderSerializer los serializa desde ahí sin
+    volver a consultarlos.
+    """
+    for item in items:
+        item.order = order
+    OrderItem.objects.bulk_create(items)
+    order.items_guardados = items
+    return items
+
+
+def cantidades_de_items(order_ids):
+    """{producto_id: cantidad} sumando los items de varias órdenes."""
+    cantidades = {}
+    items = OrderItem.objects.filter(order_id__in=order_ids)
+    for producto_id, cantidad in items.values_list('producto_id', 'cantidad'):
+        cantidades[producto_id] = cantidades.get(producto_id, 0) + cantidad
+    return cantidades
+
+
+def cantidades_reservadas(order_ids):
+    """{producto_id: cantidad} sumando las reservas de varias órdenes."""
+    cantidades = {}
+    reservas = StockReservation.objects.filter(order_id__in=order_ids)
+    for producto_id, cantidad in reservas.values_list('producto_id', 'cantidad'):
+        cantidades[producto_id] = cantidades.get(producto_id, 0) + cantidad
+    return cantidades
+
+
+def crear_reservas(order, cantidades):
+    """
+    Aparta {producto_id: cantidad} para la orden: un UPDATE condicional
+    sobre Producto.reservado y un INSERT de las StockReservation, que
+    vencen en ORDER_RESERVATION_TTL minutos. Si algún producto no alcanza
+    no aparta nada y lanza StockInsuficiente.
+    """
+    faltantes = reservar_stock(cantidades)
+    if faltantes:
+        raise StockInsuficiente(faltantes)
+    vence = timezone.now() + timedelta(minutes=settings.ORDER_RESERVATION_TTL)
+    StockReservation.objects.bulk_create([
+        StockReservation(order=order, producto_id=pk, cantidad=cantidad, expires_at=vence)
+        for pk, cantidad in cantidades.items()
+    ])
+
+
+def liberar_reservas(order_ids):
+    """
+    Devuelve a lo disponible lo reservado por varias órdenes y elimina sus
+    reservas: una lectura, un UPDATE y un DELETE para todas.
+    """
+    liberar_reserva(cantidades_reservadas(order_ids))
+    StockReservation.objects.filter(order_id__in=order_ids).delete()
+
+
+def vender_ordenes(order_ids):
+    """
+    Convierte en venta el stock de varias órdenes que pasan a pagadas:
+    consume sus reservas y, para las que no tienen ninguna, descuenta sus
+    items del stock (lo que alcance). Retorna {producto_id: Faltante} de
+    lo que no se pudo descontar.
+    """
+    order_ids = list(order_ids)
+    if not order_ids:
+        return {}
+    reservadas, cantidades = set(), {}
+    reservas = StockReservation.objects.filter(order_id__in=order_ids)
+    for order_id, producto_id, cantidad in reservas.values_list('order_id', 'producto_id', 'cantidad'):
+        reservadas.add(order_id)
+        cantidades[producto_id] = cantidades.get(producto_id, 0) + cantidad
+    consumir_reserva(cantidades)
+    reservas.delete()
+    sin_reserva = [pk for pk in order_ids if pk not in reservadas]
+    if not sin_reserva:
+        return {}
+    return descontar_stock(cantidades_de_items(sin_reserva), parcial=True)
+
+
+def _efecto_en_stock(estado):
+    if estado in ESTADOS_CON_RESERVA:
+        return 'reserva'
+    if estado in ESTADOS_VENDIDOS:
+        return 'venta'
+    return None
+
+
+def ajustar_stock_por_estado(order, anterior, estado):
+    """
+    Mueve el stock de una orden cuyo estado se cambia a mano (admin): deshace
+    el efecto del estado anterior (reserva o venta) y aplica el del nuevo.
+    Lanza StockInsuficiente si lo disponible ya no alcanza; en ese caso no
+    cambia nada.
+    """
+    antes, despues = _efecto_en_stock(anterior), _efecto_en_stock(estado)
+    if antes == despues:
+        return
+    with transaction.atomic():
+        if antes == 'reserva' and despues == 'venta':
+            faltantes = vender_ordenes([order.pk])
+            if faltantes:
+                raise StockInsuficiente(faltantes)
+            return
+        if antes == 'reserva':
+            liberar_reservas([order.pk])
+        elif antes == 'venta':
+            reponer_stock(cantidades_de_items([order.pk]))
+
+        if despues == 'reserva':
+            crear_reservas(order, cantidades_de_items([order.pk]))
+        elif despues == 'venta':
+            faltantes = descontar_stock(cantidades_de_items([order.pk]))
+            if faltantes:
+                raise StockInsuficiente(faltantes)
+
+
+def reservar_orden(user, items, billing_details, notes=''):
+    """
+    Fase 1: crea la orden pendiente (sin payment intent) con sus items y
+    reserva el stock del carrito.
+    Lanza ProductosNoEncontrados o StockInsuficiente.
+    """
+    with transaction.atomic():
+        productos = cargar_productos(items)
+        nuevos, total = construir_items(items, productos)
+        agregados = agregados_de_items(nuevos)
+        order = Order.objects.create(
+            user=user,
+            total_amount=total,
+            item_count=agregados.item_count,
+            units=agregados.units,
+            status='pending',
+            billing_name=billing_details['name'],
+            billing_email=billing_details['email'],
+            billing_phone=billing_details['phone'],
+            billing_address=billing_details['address'],
+            billing_city=billing_details['city'],
+            billing_country=billing_details['country'],
+            notes=notes,
+        )
+        crear_reservas(order, {item['producto_id']: item['cantidad'] for item in items})
+        guardar_items(order, nuevos)
+    return order
+
+
+def crear_payment_intent(order):
+    """
+    Fase 2: crea el PaymentIntent en Stripe. Debe llamarse fuera de
+    cualquier transacción. La idempotency key hace que un reintento para
+    la misma orden retorne el mismo intent.
+    """
+    return stripe.PaymentIntent.create(
+        amount=int(order.total_amount * 100),  # Convertir a centavos
+        currency='usd',
+        metadata={
+            'order_id': order.pk,
+            'user_id': order.user_id,
+            'user_email': order.user.email,
+        },
+        description=f'Orden para {order.billing_name}',
+        idempotency_key=f'order-{order.pk}-payment-intent',
+    )
+
+
+def adjuntar_payment_intent(order, payment_intent):
+    """
+    Fase 3: guarda el intent en la orden si sigue pendiente. Retorna False
+    si mientras tanto fue compensada (por ejemplo, por vencimiento).
+    """
+    actualizadas = Order.objects.filter(
+        pk=order.pk, status='pending', stripe_payment_intent_id__isnull=True
+    ).update(stripe_payment_intent_id=payment_intent.id, updated_at=timezone.now())
+    if actualizadas:
+        order.stripe_payment_intent_id = payment_intent.id
+    return bool(actualizadas)
+
+
+def compensar(order, estado='failed'):
+    """
+    Pasa la orden a un estado que libera la reserva y la devuelve a lo
+    disponible. Solo actúa si la orden todavía retenía stock, así que
+    llamarla dos veces (o en paralelo con otro proceso) no libera dos veces.
+    Retorna True si compensó.
+    """
+    with transaction.atomic():
+        actualizadas = Order.objects.filter(
+            pk=order.pk, status__in=ESTADOS_CON_RESERVA
+        ).update(status=estado, updated_at=timezone.now())
+        if actualizadas:
+            liberar_reservas([order.pk])
+    if actualizadas:
+        order.status = estado
+    return bool(actualizadas)
+
+
+def ordenes_vencidas(ahora=None):
+    """
+    Órdenes pendientes con alguna reserva vencida, como (id, payment
+    intent) ordenadas por id.
+    """
+    ahora = ahora or timezone.now()
+    return (
+        Order.objects.filter(status='pending', reservations__expires_at__lte=ahora)
+        .values_list('id', 'stripe_payment_intent_id')
+        .distinct()
+        .order_by('id')
+    )
+
+
+def expirar_ordenes(order_ids):
+    """
+    Cancela en bloque las órdenes que siguen pendientes y libera sus
+    reservas: un UPDATE de estados y un UPDATE de stock para todas.
+    Retorna los ids cancelados.
+    """
+    with transaction.atomic():
+        pendientes = list(
+            Order.objects.select_for_update()
+            .filter(pk__in=order_ids, status='pending')
+            .values_list('id', flat=True)
+        )
+        if pendientes:
+            Order.objects.filter(pk__in=pendientes).update(
+                status='cancelled', updated_at=timezone.now()
+            )
+            liberar_reservas(pendientes)
+    return pendientes
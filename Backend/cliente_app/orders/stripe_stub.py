@@ -0,0 +1,111 @@
+"""
+Servidor HTTP local que imita la API de PaymentIntents de Stripe.
+
+Sirve para pruebas de carga del checkout sin red: responde con una
+latencia configurable, respeta el header Idempotency-Key (misma clave =
+mismo intent) y admite crear, consultar y cancelar intents.
+
+    with ServidorStripeStub(latencia=0.2) as servidor:
+        stripe.PaymentIntent.create(amount=100, currency='usd')
+        servidor.creados  # intents distintos creados
+"""
+
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import stripe
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def responder(self, codigo, cuerpo):
+        datos = json.dumps(cuerpo).encode()
+        self.send_response(codigo)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def do_POST(self):
+        servidor = self.server.stub
+        largo = int(self.headers.get('Content-Length') or 0)
+        parametros = {k: v[0] for k, v in parse_qs(self.rfile.read(largo).decode()).items()}
+        time.sleep(servidor.latencia)
+
+        partes = self.path.strip('/').split('/')
+        if partes == ['v1', 'payment_intents']:
+            self.responder(200, servidor.crear(parametros, self.headers.get('Idempotency-Key')))
+        elif len(partes) == 4 and partes[3] == 'cancel' and partes[2] in servidor.intents:
+            intent = servidor.intents[partes[2]]
+            intent['status'] = 'canceled'
+            self.responder(200, intent)
+        else:
+            self.responder(404, {'error': {'type': 'invalid_request_error', 'message': 'No such intent'}})
+
+    def do_GET(self):
+        servidor = self.server.stub
+        time.sleep(servidor.latencia)
+        partes = self.path.split('?')[0].strip('/').split('/')
+        if len(partes) == 3 and partes[2] in servidor.intents:
+            self.responder(200, servidor.intents[partes[2]])
+        else:
+            self.responder(404, {'error': {'type': 'invalid_request_error', 'message': 'No such intent'}})
+
+
+class ServidorStripeStub:
+    """
+    Levanta el servidor en un puerto libre de 127.0.0.1 y apunta el SDK de
+    Stripe hacia él mientras dura el bloque `with`.
+    """
+
+    def __init__(self, latencia=0.0):
+        self.latencia = latencia
+        self.intents = {}
+        self._por_clave = {}
+        self._lock = threading.Lock()
+        self._contador = itertools.count(1)
+
+    @property
+    def creados(self):
+        return len(self.intents)
+
+    def crear(self, parametros, clave=None):
+        with self._lock:
+            if clave and clave in self._por_clave:
+                return self.intents[self._por_clave[clave]]
+            pk = f'pi_stub_{next(self._contador)}'
+            intent = {
+                'id': pk,
+                'object': 'payment_intent',
+                'amount': int(parametros.get('amount', 0)),
+                'currency': parametros.get('currency', 'usd'),
+                'status': 'requires_payment_method',
+                'client_secret': f'{pk}_secret',
+            }
+            self.intents[pk] = intent
+            if clave:
+                self._por_clave[clave] = pk
+            return intent
+
+    def __enter__(self):
+        self._http = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._http.daemon_threads = True
+        self._http.stub = self
+        self._hilo = threading.Thread(target=self._http.serve_forever, daemon=True)
+        self._hilo.start()
+        self._anterior = (stripe.api_base, stripe.api_key)
+        stripe.api_base = f'http://127.0.0.1:{self._http.server_address[1]}'
+        stripe.api_key = 'sk_test_stub'
+        return self
+
+    def __exit__(self, *exc):
+        stripe.api_base, stripe.api_key = self._anterior
+        self._http.shutdown()
+        self._http.server_close()
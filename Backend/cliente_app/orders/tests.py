@@ -1,3 +1,750 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import stripe
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from categorias.models import Categoria
+from cliente_app.paginators import EstimatedCountPaginator, filas_estimadas
+from productos.models import Producto
+from .agregados import inconsistencias
+from .idempotency import huella
+from .models import IdempotencyKey, Order, OrderItem, StockReservation, StripeEvent
+from .services import StockInsuficiente, ajustar_stock_por_estado, compensar
+from .webhooks import procesar_eventos
+
+
+BILLING = {
+    'name': 'Ana Pérez',
+    'email': 'ana@example.com',
+    'phone': '555',
+    'address': 'Calle 1',
+    'city': 'Lima',
+    'country': 'PE',
+}
+
+
+def payment_intent(**kwargs):
+    return SimpleNamespace(id='pi_test', client_secret='secret_test')
+
+
+WEBHOOK_SECRET = 'whsec_test'
+
+
+def evento_stripe(event_id, tipo, intent_id='pi_test'):
+    """Payload JSON de un evento de PaymentIntent."""
+    return json.dumps({
+        'id': event_id,
+        'object': 'event',
+        'type': tipo,
+        'data': {'object': {'id': intent_id, 'object': 'payment_intent'}},
+    })
+
+
+def firmar(payload, secreto=WEBHOOK_SECRET):
+    """Header Stripe-Signature válido para el payload."""
+    marca = int(time.time())
+    firma = stripe.WebhookSignature._compute_signature(f'{marca}.{payload}', secreto)
+    return f't={marca},v1={firma}'
+
+
+@mock.patch('orders.views.stripe.PaymentIntent.create', side_effect=payment_intent)
+class CreateOrderTests(TestCase):
+    """Pruebas de POST /api/orders/create_order/."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('ana', 'ana@example.com', 'x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        categoria = Categoria.objects.create(nombre='Abarrotes')
+        self.productos = Producto.objects.bulk_create([
+            Producto(nombre=f'Producto {i}', precio=2, stock=10, categoria=categoria)
+            for i in range(20)
+        ])
+
+    def crear(self, items):
+        return self.client.post(
+            '/api/orders/create_order/',
+            {'items': items, 'billing_details': BILLING},
+            format='json',
+        )
+
+    def consultas(self, cantidad):
+        items = [{'producto_id': p.pk, 'cantidad': 1} for p in self.productos[:cantidad]]
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.crear(items)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(response.data['items']), cantidad)
+        return len(contexto.captured_queries)
+
+    def test_consultas_constantes_segun_tamano_del_carrito(self, _):
+        self.assertEqual(self.consultas(1), self.consultas(20))
+        # SAVEPOINT, SELECT productos, INSERT orden, UPDATE condicional de
+        # lo reservado (en su propio savepoint), INSERT reservas, INSERT
+        # items, RELEASE y UPDATE con el payment intent (el perfil del
+        # usuario ya quedó en caché en las llamadas anteriores)
+        with self.assertNumQueries(10):
+            self.crear([{'producto_id': p.pk, 'cantidad': 2} for p in self.productos])
+
+    def test_crea_orden_con_total_e_items(self, _):
+        a, b = self.productos[:2]
+        response = self.crear([
+            {'producto_id': a.pk, 'cantidad': 2},
+            {'producto_id': b.pk, 'cantidad': 1},
+            {'producto_id': a.pk, 'cantidad': 1},
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['client_secret'], 'secret_test')
+
+        order = Order.objects.get()
+        self.assertEqual(order.total_amount, 8)
+        self.assertEqual((order.item_count, order.units), (2, 4))
+        self.assertEqual(inconsistencias(), {})
+        self.assertEqual(order.stripe_payment_intent_id, 'pi_test')
+        self.assertEqual(
+            sorted(OrderItem.objects.values_list('producto_id', 'cantidad', 'subtotal')),
+            [(a.pk, 3, 6), (b.pk, 1, 2)],
+        )
+
+    def test_stock_insuficiente(self, _):
+        response = self.crear([{'producto_id': self.productos[0].pk, 'cantidad': 11}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Stock insuficiente', response.data['error'])
+        self.assertEqual(response.data['faltantes'], [
+            {'producto_id': self.productos[0].pk, 'solicitado': 11, 'disponible': 10}
+        ])
+        self.assertFalse(Order.objects.exists())
+
+    def test_producto_inexistente(self, _):
+        response = self.crear([{'producto_id': 999999, 'cantidad': 1}])
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Order.objects.exists())
+
+    def test_stock_se_reserva_al_crear(self, _):
+        producto = self.productos[0]
+        self.crear([{'producto_id': producto.pk, 'cantidad': 4}])
+        producto.refresh_from_db()
+        self.assertEqual((producto.stock, producto.reservado), (10, 4))
+        reserva = StockReservation.objects.get()
+        self.assertEqual((reserva.producto_id, reserva.cantidad), (producto.pk, 4))
+        self.assertGreater(reserva.expires_at, timezone.now())
+
+    def test_reservas_pendientes_no_sobrevenden(self, _):
+        producto = self.productos[0]
+        for _ in range(3):
+            self.crear([{'producto_id': producto.pk, 'cantidad': 4}])
+        producto.refresh_from_db()
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(producto.disponible, 2)
+
+    def test_stripe_se_llama_sin_transaccion_y_con_idempotency_key(self, create):
+        profundidad = len(connection.atomic_blocks)
+        dentro = []
+
+        def verificar(**kwargs):
+            dentro.append(len(connection.atomic_blocks) - profundidad)
+            return payment_intent(**kwargs)
+
+        create.side_effect = verificar
+        self.crear([{'producto_id': self.productos[0].pk, 'cantidad': 1}])
+        self.assertEqual(dentro, [0])
+        order = Order.objects.get()
+        self.assertEqual(
+            create.call_args.kwargs['idempotency_key'], f'order-{order.pk}-payment-intent'
+        )
+
+    def test_error_de_stripe_compensa_la_reserva(self, create):
+        create.side_effect = stripe.error.APIConnectionError('sin conexión')
+        producto = self.productos[0]
+        response = self.crear([{'producto_id': producto.pk, 'cantidad': 3}])
+        self.assertEqual(response.status_code, 400)
+
+        producto.refresh_from_db()
+        self.assertEqual(producto.stock, 10)
+        self.assertEqual(Order.objects.get().status, 'failed')
+
+    def test_reserva_vencida_durante_el_pago(self, create):
+        def vencer(**kwargs):
+            Order.objects.update(status='cancelled')
+            return payment_intent(**kwargs)
+
+        create.side_effect = vencer
+        with mock.patch('orders.views.stripe.PaymentIntent.cancel') as cancel:
+            response = self.crear([{'producto_id': self.productos[0].pk, 'cantidad': 1}])
+        self.assertEqual(response.status_code, 409)
+        cancel.assert_called_once_with('pi_test')
+        self.assertIsNone(Order.objects.get().stripe_payment_intent_id)
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class ReservaStockTests(TestCase):
+    """Pruebas del webhook de Stripe y de la devolución del stock reservado."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('luis', 'luis@example.com', 'x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        categoria = Categoria.objects.create(nombre='Lácteos')
+        self.producto = Producto.objects.create(
+            nombre='Queso', precio=5, stock=10, categoria=categoria
+        )
+        self.order = self.crear_orden('pi_test')
+
+    def crear_orden(self, intent_id):
+        def crear(**kwargs):
+            return SimpleNamespace(id=intent_id, client_secret='secret_test')
+
+        with mock.patch('orders.views.stripe.PaymentIntent.create', side_effect=crear):
+            response = self.client.post('/api/orders/create_order/', {
+                'items': [{'producto_id': self.producto.pk, 'cantidad': 4}],
+                'billing_details': BILLING,
+            }, format='json')
+        return Order.objects.get(pk=response.data['id'])
+
+    def stock(self):
+        self.producto.refresh_from_db()
+        return self.producto.stock
+
+    def disponible(self):
+        self.producto.refresh_from_db()
+        return self.producto.disponible
+
+    def webhook(self, payload, firma=None):
+        return self.client.post(
+            '/api/stripe/webhook/', payload, content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=firma or firmar(payload),
+        )
+
+    def recibir(self, event_id, tipo, intent_id='pi_test'):
+        response = self.webhook(evento_stripe(event_id, tipo, intent_id))
+        self.assertEqual(response.status_code, 200)
+
+    def confirmar(self):
+        return self.client.post(
+            '/api/orders/confirm_payment/', {'payment_intent_id': 'pi_test'}, format='json'
+        )
+
+    def test_firma_invalida(self):
+        payload = evento_stripe('evt_1', 'payment_intent.succeeded')
+        response = self.webhook(payload, firmar(payload, 'whsec_otro'))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_evento_repetido_se_guarda_una_vez(self):
+        self.recibir('evt_1', 'payment_intent.succeeded')
+        self.recibir('evt_1', 'payment_intent.succeeded')
+        self.assertEqual(StripeEvent.objects.get().payment_intent_id, 'pi_test')
+
+    def test_pago_exitoso_no_descuenta_dos_veces(self):
+        self.assertEqual((self.stock(), self.disponible()), (10, 6))
+        self.recibir('evt_1', 'payment_intent.succeeded')
+        self.assertEqual(procesar_eventos(), (1, 1))
+        self.assertEqual(procesar_eventos(), (0, 0))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+        self.assertEqual((self.stock(), self.disponible()), (6, 6))
+        self.assertFalse(self.order.reservations.exists())
+
+    def test_pago_fallido_devuelve_stock_una_vez(self):
+        self.recibir('evt_1', 'payment_intent.canceled')
+        procesar_eventos()
+        self.recibir('evt_2', 'payment_intent.canceled')
+        self.recibir('evt_3', 'payment_intent.succeeded')
+        with self.assertLogs('orders.webhooks', 'ERROR'):
+            procesar_eventos()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'cancelled')
+        self.assertEqual((self.stock(), self.disponible()), (10, 10))
+
+    def test_pago_de_orden_cancelada_queda_para_revision(self):
+        # La reserva venció y luego el cliente terminó de pagar
+        self.order.reservations.update(expires_at=timezone.now() - timedelta(minutes=1))
+        with mock.patch('orders.management.commands.release_expired_orders'
+                        '.stripe.PaymentIntent.cancel'):
+            call_command('release_expired_orders', stdout=StringIO())
+        self.recibir('evt_1', 'payment_intent.succeeded')
+        with self.assertLogs('orders.webhooks', 'ERROR') as logs:
+            self.assertEqual(procesar_eventos(), (1, 0))
+        self.assertIn(f'#{self.order.pk}', logs.output[0])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'cancelled')
+        self.assertEqual((self.stock(), self.disponible()), (10, 10))
+        evento = StripeEvent.objects.get()
+        self.assertTrue(evento.requires_review)
+        self.assertIsNotNone(evento.processed_at)
+
+    def test_eventos_en_lote_con_consultas_constantes(self):
+        Producto.objects.filter(pk=self.producto.pk).update(stock=100)
+
+        def consultas(cantidad, prefijo):
+            for i in range(cantidad):
+                intent_id = f'pi_{prefijo}_{i}'
+                self.crear_orden(intent_id)
+                self.recibir(f'evt_{prefijo}_{i}', 'payment_intent.payment_failed', intent_id)
+            with CaptureQueriesContext(connection) as contexto:
+                self.assertEqual(procesar_eventos(), (cantidad, cantidad))
+            return len(contexto.captured_queries)
+
+        self.assertEqual(consultas(1, 'a'), consultas(3, 'b'))
+        self.assertEqual((self.stock(), self.disponible()), (100, 96))
+
+    def test_pago_de_orden_sin_reserva_descuenta_sus_items(self):
+        # Orden abierta que no tomó stock al crearse
+        self.order.reservations.all().delete()
+        Producto.objects.filter(pk=self.producto.pk).update(reservado=0)
+        self.recibir('evt_1', 'payment_intent.succeeded')
+        procesar_eventos()
+        self.assertEqual((self.stock(), self.disponible()), (6, 6))
+
+    def test_confirm_payment_no_consulta_stripe(self):
+        self.recibir('evt_1', 'payment_intent.succeeded')
+        procesar_eventos()
+        with mock.patch('orders.views.stripe.PaymentIntent.retrieve') as retrieve:
+            response = self.confirmar()
+        retrieve.assert_not_called()
+        self.assertEqual(response.data['status'], 'paid')
+
+    def test_process_stripe_events(self):
+        self.recibir('evt_1', 'payment_intent.processing')
+        self.recibir('evt_2', 'payment_intent.succeeded')
+        call_command('process_stripe_events', once=True, batch_size=1, stdout=StringIO())
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+        self.assertFalse(StripeEvent.objects.filter(processed_at__isnull=True).exists())
+
+    def test_cambio_de_estado_manual_mueve_el_stock(self):
+        ajustar_stock_por_estado(self.order, 'pending', 'cancelled')
+        self.assertEqual(self.stock(), 10)
+        ajustar_stock_por_estado(self.order, 'cancelled', 'paid')
+        self.assertEqual(self.stock(), 6)
+
+        ajustar_stock_por_estado(self.order, 'paid', 'failed')
+        Producto.objects.filter(pk=self.producto.pk).update(stock=3)
+        with self.assertRaises(StockInsuficiente):
+            ajustar_stock_por_estado(self.order, 'failed', 'pending')
+        self.assertEqual(self.stock(), 3)
+
+    def test_release_expired_orders(self):
+        vigente = self.crear_orden('pi_vigente')
+        self.order.reservations.update(expires_at=timezone.now() - timedelta(minutes=1))
+        with mock.patch('orders.management.commands.release_expired_orders'
+                        '.stripe.PaymentIntent.cancel') as cancel:
+            call_command('release_expired_orders', stdout=StringIO())
+            call_command('release_expired_orders', stdout=StringIO())
+        cancel.assert_called_once_with('pi_test')
+        self.order.refresh_from_db()
+        vigente.refresh_from_db()
+        self.assertEqual((self.order.status, vigente.status), ('cancelled', 'pending'))
+        self.assertFalse(self.order.reservations.exists())
+        self.assertEqual((self.stock(), self.disponible()), (10, 6))
+
+    def test_release_expired_orders_en_bloque(self):
+        Producto.objects.filter(pk=self.producto.pk).update(stock=100)
+        ordenes = [self.crear_orden(f'pi_{i}') for i in range(4)]
+        # Dos quedaron sin payment intent (el proceso cayó en la fase 2)
+        Order.objects.filter(pk__in=[o.pk for o in ordenes[::2]]).update(
+            stripe_payment_intent_id=None
+        )
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        with mock.patch('orders.management.commands.release_expired_orders'
+                        '.stripe.PaymentIntent.cancel') as cancel:
+            call_command('release_expired_orders', batch_size=2, stdout=StringIO())
+        self.assertEqual(cancel.call_count, 3)
+        self.assertEqual(Order.objects.filter(status='cancelled').count(), 5)
+        self.assertEqual(self.disponible(), 100)
+
+
+class OrderListTests(TestCase):
+    """Pruebas del listado paginado por cursor de GET /api/orders/."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('rosa', 'rosa@example.com', 'x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        categoria = Categoria.objects.create(nombre='Bebidas')
+        self.productos = Producto.objects.bulk_create([
+            Producto(nombre=f'Jugo {i}', precio=3, stock=10, categoria=categoria)
+            for i in range(3)
+        ])
+        otro = User.objects.create_user('otro', 'otro@example.com', 'x')
+        Order.objects.create(user=otro, total_amount=0, **self.billing())
+
+    def billing(self):
+        return {f'billing_{campo}': valor for campo, valor in BILLING.items()}
+
+    def crear_ordenes(self, cantidad, items=1):
+        # Todas en el mismo instante: el id desempata el cursor
+        ahora = timezone.now()
+        ordenes = Order.objects.bulk_create([
+            Order(user=self.user, total_amount=3 * items, item_count=items,
+                  units=items, **self.billing())
+            for _ in range(cantidad)
+        ])
+        Order.objects.filter(pk__in=[o.pk for o in ordenes]).update(created_at=ahora)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, producto=producto, cantidad=1,
+                      precio_unitario=3, subtotal=3)
+            for order in ordenes for producto in self.productos[:items]
+        ])
+        return ordenes
+
+    def test_resumen_sin_items_anidados(self):
+        order = self.crear_ordenes(1, items=3)[0]
+        response = self.client.get('/api/orders/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data['next'])
+        [resumen] = response.data['results']
+        self.assertEqual(resumen['id'], order.pk)
+        self.assertEqual((resumen['item_count'], resumen['units']), (3, 3))
+        self.assertNotIn('items', resumen)
+        self.assertNotIn('user', resumen)
+
+        detalle = self.client.get(f'/api/orders/{order.pk}/')
+        self.assertEqual(len(detalle.data['items']), 3)
+
+    def test_consultas_constantes_por_pagina(self):
+        self.crear_ordenes(30, items=3)
+        # Una sola consulta para la página, sin leer OrderItem
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.client.get('/api/orders/?page_size=25')
+        [consulta] = contexto.captured_queries
+        self.assertNotIn('orders_orderitem', consulta['sql'])
+        self.assertEqual(len(response.data['results']), 25)
+
+    def test_sync_order_aggregates(self):
+        ordenes = self.crear_ordenes(5, items=2)
+        self.assertEqual(inconsistencias(), {})
+        # Órdenes anteriores a las columnas
+        Order.objects.filter(pk__in=[o.pk for o in ordenes[:3]]).update(item_count=0, units=0)
+        self.assertEqual(len(inconsistencias()), 3)
+
+        with self.assertRaises(CommandError):
+            call_command('sync_order_aggregates', check=True, stderr=StringIO())
+        salida = StringIO()
+        call_command('sync_order_aggregates', batch_size=2, stdout=salida)
+        self.assertIn('corregidas: 3', salida.getvalue())
+        self.assertEqual(inconsistencias(), {})
+        call_command('sync_order_aggregates', check=True, stdout=StringIO())
+
+    def test_sync_order_aggregates_no_reescribe_el_total(self):
+        order = self.crear_ordenes(1, items=2)[0]
+        Order.objects.filter(pk=order.pk).update(total_amount=99)
+        errores = StringIO()
+        call_command('sync_order_aggregates', stdout=StringIO(), stderr=errores)
+        self.assertIn(f'Orden #{order.pk}', errores.getvalue())
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, 99)
+
+    def test_cursor_recorre_todas_las_ordenes(self):
+        ordenes = self.crear_ordenes(45)
+        vistas = []
+        url = '/api/orders/'
+        while url:
+            response = self.client.get(url)
+            vistas.extend(resumen['id'] for resumen in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(vistas, sorted((o.pk for o in ordenes), reverse=True))
+
+    def test_pagina_anterior(self):
+        self.crear_ordenes(25)
+        primera = self.client.get('/api/orders/?page_size=10')
+        segunda = self.client.get(primera.data['next'])
+        anterior = self.client.get(segunda.data['previous'])
+        self.assertEqual(anterior.data['results'], primera.data['results'])
+        self.assertIsNone(anterior.data['previous'])
+
+    def test_orden_nueva_no_desplaza_la_pagina_siguiente(self):
+        self.crear_ordenes(30)
+        primera = self.client.get('/api/orders/?page_size=10')
+        self.crear_ordenes(1)
+        segunda = self.client.get(primera.data['next'])
+        anteriores = {resumen['id'] for resumen in primera.data['results']}
+        self.assertFalse(anteriores & {resumen['id'] for resumen in segunda.data['results']})
+        self.assertEqual(len(segunda.data['results']), 10)
+
+    def test_fields_en_el_listado(self):
+        self.crear_ordenes(2)
+        response = self.client.get('/api/orders/?fields=id,status')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'status'})
+
+
+class OrderAdminTests(TestCase):
+    """Listados del admin de órdenes e items sobre tablas grandes."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        self.client.force_login(self.admin)
+        self.categoria = Categoria.objects.create(nombre='Limpieza')
+
+    def crear_ordenes(self, cantidad):
+        usuarios = User.objects.bulk_create([
+            User(username=f'cliente{User.objects.count()}_{i}') for i in range(cantidad)
+        ])
+        productos = Producto.objects.bulk_create([
+            Producto(nombre=f'Jabón {i}', precio=1, stock=5, categoria=self.categoria)
+            for i in range(cantidad)
+        ])
+        ordenes = Order.objects.bulk_create([
+            Order(user=usuario, total_amount=1, item_count=1, units=1,
+                  stripe_payment_intent_id=f'pi_{usuario.username}',
+                  billing_name='Cliente', billing_email='c@example.com',
+                  billing_phone='1', billing_address='Calle', billing_city='Lima')
+            for usuario in usuarios
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, producto=producto, cantidad=1, precio_unitario=1, subtotal=1)
+            for order, producto in zip(ordenes, productos)
+        ])
+        return ordenes
+
+    def consultas(self, url):
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return contexto.captured_queries
+
+    def test_listados_con_consultas_constantes(self):
+        for url in ('/admin/orders/order/', '/admin/orders/orderitem/'):
+            with self.subTest(url=url):
+                self.crear_ordenes(2)
+                pocas = len(self.consultas(url))
+                self.crear_ordenes(30)
+                self.assertEqual(len(self.consultas(url)), pocas)
+
+    def test_busqueda_por_id_e_intent_sin_like(self):
+        order = self.crear_ordenes(3)[1]
+        for url in (
+            f'/admin/orders/order/?q={order.pk}',
+            f'/admin/orders/order/?q=%23{order.pk}',
+            f'/admin/orders/order/?q={order.stripe_payment_intent_id}',
+            f'/admin/orders/orderitem/?q={order.pk}',
+        ):
+            with self.subTest(url=url):
+                consultas = self.consultas(url)
+                self.assertFalse(any('LIKE' in c['sql'] for c in consultas))
+                self.assertContains(self.client.get(url), '1 result')
+
+    def test_busqueda_de_texto(self):
+        order = self.crear_ordenes(3)[1]
+        response = self.client.get(f'/admin/orders/order/?q={order.user.username}')
+        self.assertContains(response, '1 result')
+
+    def test_total_estimado_sin_filtros(self):
+        self.crear_ordenes(3)
+        with mock.patch.object(EstimatedCountPaginator, 'umbral', 1), \
+                mock.patch('cliente_app.paginators.filas_estimadas', return_value=5000):
+            sin_filtro = self.consultas('/admin/orders/order/')
+            filtrado = self.client.get('/admin/orders/order/?status__exact=pending')
+        self.assertFalse(any('COUNT(' in c['sql'] for c in sin_filtro))
+        self.assertEqual(filtrado.context['cl'].result_count, 3)
+
+    def test_filas_estimadas_sqlite(self):
+        ordenes = self.crear_ordenes(4)
+        self.assertEqual(filas_estimadas(Order.objects.all()), ordenes[-1].pk)
+
+
+@mock.patch('orders.views.stripe.PaymentIntent.create', side_effect=payment_intent)
+class IdempotencyKeyTests(TestCase):
+    """Pruebas del header Idempotency-Key en create_order."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('eva', 'eva@example.com', 'x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        categoria = Categoria.objects.create(nombre='Bebidas')
+        self.producto = Producto.objects.create(
+            nombre='Jugo', precio=3, stock=10, categoria=categoria
+        )
+
+    def crear(self, clave, cantidad=1, client=None):
+        return (client or self.client).post(
+            '/api/orders/create_order/',
+            {'items': [{'producto_id': self.producto.pk, 'cantidad': cantidad}],
+             'billing_details': BILLING},
+            format='json',
+            HTTP_IDEMPOTENCY_KEY=clave,
+        )
+
+    def test_reintento_devuelve_la_respuesta_guardada(self, create):
+        primera = self.crear('clave-1')
+        with self.assertNumQueries(1):
+            segunda = self.crear('clave-1')
+        self.assertEqual(segunda.status_code, 201)
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+        self.assertEqual(segunda.data, primera.data)
+        self.assertEqual(create.call_count, 1)
+        self.assertEqual(Order.objects.count(), 1)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.reservado, 1)
+
+    def test_otra_peticion_con_la_misma_clave(self, _):
+        self.crear('clave-1')
+        self.assertEqual(self.crear('clave-1', cantidad=2).status_code, 422)
+
+    def test_claves_por_usuario(self, create):
+        otro = User.objects.create_user('leo', 'leo@example.com', 'x')
+        client = APIClient()
+        client.force_authenticate(otro)
+        self.crear('clave-1')
+        self.assertEqual(self.crear('clave-1', client=client).status_code, 201)
+        self.assertEqual(create.call_count, 2)
+
+    def test_error_libera_la_clave(self, create):
+        create.side_effect = stripe.error.APIConnectionError('sin conexión')
+        self.assertEqual(self.crear('clave-1').status_code, 400)
+        create.side_effect = payment_intent
+        self.assertEqual(self.crear('clave-1').status_code, 201)
+
+    def test_clave_vencida_se_reemplaza(self, create):
+        self.crear('clave-1')
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        self.assertNotIn('Idempotent-Replayed', self.crear('clave-1'))
+        self.assertEqual(create.call_count, 2)
+
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        call_command('purge_idempotency_keys', stdout=StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def en_curso(self, clave, lease):
+        """Clave reclamada por una petición que no terminó."""
+        cuerpo = {'items': [{'producto_id': self.producto.pk, 'cantidad': 1}],
+                  'billing_details': BILLING}
+        return IdempotencyKey.objects.create(
+            user=self.user, key=clave, request_hash=huella(cuerpo),
+            locked_until=timezone.now() + timedelta(seconds=lease),
+            expires_at=timezone.now() + timedelta(hours=1),
+        )
+
+    @override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0.05)
+    def test_clave_en_curso_responde_409(self, create):
+        self.en_curso('clave-1', lease=60)
+        self.assertEqual(self.crear('clave-1').status_code, 409)
+        create.assert_not_called()
+
+    def test_clave_abandonada_se_toma(self, create):
+        self.en_curso('clave-1', lease=-1)
+        response = self.crear('clave-1')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+        fila = IdempotencyKey.objects.get()
+        self.assertEqual((fila.status_code, fila.response['id']), (201, response.data['id']))
+        self.assertEqual(self.crear('clave-1')['Idempotent-Replayed'], 'true')
+        self.assertEqual(create.call_count, 1)
+
+
+class IdempotencyKeyConcurrenteTests(TransactionTestCase):
+    """Duplicados simultáneos esperan el resultado de la petición original."""
+
+    def test_duplicados_concurrentes_crean_una_orden(self):
+        user = User.objects.create_user('sol', 'sol@example.com', 'x')
+        categoria = Categoria.objects.create(nombre='Flash sale')
+        producto = Producto.objects.create(nombre='Oferta', precio=1, stock=10, categoria=categoria)
+        llamadas = []
+        lock = threading.Lock()
+
+        def crear_intent(**kwargs):
+            with lock:
+                llamadas.append(kwargs['idempotency_key'])
+            time.sleep(0.3)
+            return payment_intent(**kwargs)
+
+        def enviar(_):
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                response = client.post(
+                    '/api/orders/create_order/',
+                    {'items': [{'producto_id': producto.pk, 'cantidad': 1}],
+                     'billing_details': BILLING},
+                    format='json',
+                    HTTP_IDEMPOTENCY_KEY='reintento',
+                )
+                return response.status_code, response.data['id']
+            finally:
+                connection.close()
+
+        with mock.patch('orders.views.stripe.PaymentIntent.create', side_effect=crear_intent):
+            with ThreadPoolExecutor(max_workers=6) as pool:
+                resultados = list(pool.map(enviar, range(6)))
+
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual({codigo for codigo, _ in resultados}, {201})
+        self.assertEqual(len({order_id for _, order_id in resultados}), 1)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class MigracionReservasTests(TransactionTestCase):
+    """0003_stockreservation aparta el stock de las órdenes abiertas previas."""
+
+    antes = [('orders', '0002_stripeevent')]
+    despues = [('orders', '0003_stockreservation')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.antes)
+        apps = executor.loader.project_state(self.antes).apps
+        Order = apps.get_model('orders', 'Order')
+        OrderItem = apps.get_model('orders', 'OrderItem')
+        # Solo las apps de orders están en su estado anterior
+        user = User.objects.create(username='previo')
+        self.producto_id = Producto.objects.create(
+            nombre='Pan', precio=2, stock=10, categoria=Categoria.objects.create(nombre='Previa')
+        ).pk
+        # Como las creaba el código original: sin tocar el stock
+        self.order_id = Order.objects.create(
+            user_id=user.pk, total_amount=6, status='pending', billing_name='x',
+            billing_email='x@example.com', billing_phone='', billing_address='',
+            billing_city='', stripe_payment_intent_id='pi_previo',
+        ).pk
+        OrderItem.objects.create(
+            order_id=self.order_id, producto_id=self.producto_id, cantidad=3,
+            precio_unitario=2, subtotal=6,
+        )
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def migrar(self, destino):
+        MigrationExecutor(connection).migrate(destino)
+        return Producto.objects.values_list('stock', 'reservado').get(pk=self.producto_id)
+
+    def test_aparta_sin_tocar_el_stock(self):
+        self.assertEqual(self.migrar(self.despues), (10, 3))
+        reservas = StockReservation.objects.values_list('order_id', 'producto_id', 'cantidad')
+        self.assertEqual(list(reservas), [(self.order_id, self.producto_id, 3)])
+
+    def test_pagar_orden_previa_descuenta_una_vez(self):
+        self.migrar(MigrationExecutor(connection).loader.graph.leaf_nodes())
+        StripeEvent.objects.create(
+            event_id='evt_previo', type='payment_intent.succeeded',
+            payment_intent_id='pi_previo', payload={},
+        )
+        self.assertEqual(procesar_eventos(), (1, 1))
+        self.assertEqual(
+            Producto.objects.values_list('stock', 'reservado').get(pk=self.producto_id), (7, 0)
+        )
+
+    def test_cancelar_orden_previa_no_devuelve_stock(self):
+        self.migrar(MigrationExecutor(connection).loader.graph.leaf_nodes())
+        compensar(Order.objects.get(pk=self.order_id), 'cancelled')
+        self.assertEqual(
+            Producto.objects.values_list('stock', 'reservado').get(pk=self.producto_id), (10, 0)
+        )
+
+    def test_revertir_devuelve_lo_reservado(self):
+        self.migrar(self.despues)
+        self.assertEqual(self.migrar(self.antes), (10, 0))
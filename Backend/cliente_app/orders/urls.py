@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import OrderViewSet
+from .views import OrderViewSet, stripe_webhook
 
 # Crear router para el ViewSet
 router = DefaultRouter()
@@ -8,4 +8,5 @@ router.register(r'orders', OrderViewSet, basename='order')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('stripe/webhook/', stripe_webhook, name='stripe-webhook'),
 ]
@@ -1,19 +1,36 @@
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework.decorators import (
+    action,
+    api_view,
+    authentication_classes,
+    permission_classes,
+)
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from django.db import transaction
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from django.db.models import Prefetch
 from django.conf import settings
-from decimal import Decimal
 import stripe
 
-from .models import Order, OrderItem
+from .models import Order
+from .pagination import OrderCursorPagination
 from .serializers import (
     OrderSerializer,
+    OrderSummarySerializer,
     CreateOrderSerializer,
     ConfirmPaymentSerializer,
 )
+from .services import (
+    ProductosNoEncontrados,
+    StockInsuficiente,
+    adjuntar_payment_intent,
+    compensar,
+    crear_payment_intent,
+    reservar_orden,
+)
+from .idempotency import idempotente
+from .webhooks import registrar_evento
 from productos.models import Producto
+from cliente_app.fieldsets import campos_solicitados, columnas_para
 
 
 # Configurar Stripe
@@ -25,36 +42,76 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
     ViewSet para gestionar órdenes de compra.
 
     Endpoints:
-    - GET /api/orders/ - Lista de órdenes del usuario autenticado
+    - GET /api/orders/ - Lista paginada (cursor) de órdenes del usuario autenticado
     - GET /api/orders/{id}/ - Detalle de una orden específica
     - POST /api/orders/create_order/ - Crear nueva orden con Payment Intent
-    - POST /api/orders/confirm_payment/ - Confirmar pago y actualizar orden
+    - POST /api/orders/confirm_payment/ - Consultar el estado del pago de una orden
+
+    El estado de las órdenes lo actualiza el webhook de Stripe
+    (stripe_webhook y el worker process_stripe_events).
     """
 
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OrderCursorPagination
+
+    def get_serializer_class(self):
+        """El listado usa el resumen; el detalle anida usuario e items."""
+        if self.action == 'list':
+            return OrderSummarySerializer
+        return OrderSerializer
 
     def get_queryset(self):
-        """Retorna solo las órdenes del usuario autenticado."""
-        return Order.objects.filter(user=self.request.user).prefetch_related(
-            'items',
-            'items__producto',
-            'items__producto__categoria'
-        )
+        """
+        Retorna solo las órdenes del usuario autenticado.
+
+        En el listado no se carga ninguna relación: item_count y units son
+        columnas de la orden, así que la página es una sola consulta que el
+        índice (user, -created_at, -id) entrega ya ordenada.
+        En el resto de las acciones los items solo se precargan si forman
+        parte de la respuesta (?fields=), y nunca se lee el embedding de
+        los productos.
+        """
+        queryset = Order.objects.filter(user=self.request.user)
+        campos = campos_solicitados(self.request)
+
+        if self.action == 'list':
+            campos = campos or set(OrderSummarySerializer.Meta.fields)
+            # El cursor de la página siguiente se arma con created_at
+            return queryset.only(*columnas_para(Order, campos | {'created_at'}))
+
+        if campos is None or 'user' in campos:
+            queryset = queryset.select_related('user')
+        if campos is None or 'items' in campos:
+            queryset = queryset.prefetch_related(
+                'items',
+                Prefetch(
+                    'items__producto',
+                    queryset=Producto.objects.defer('embedding')
+                ),
+                'items__producto__categoria'
+            )
+        return queryset
 
     @action(detail=False, methods=['post'])
-    @transaction.atomic
+    @idempotente
     def create_order(self, request):
         """
         Crea una nueva orden con integración de Stripe.
 
-        Proceso:
+        Admite el header Idempotency-Key: un reintento con la misma clave
+        recibe la respuesta de la primera petición sin crear otra orden ni
+        otro Payment Intent (ver orders.idempotency).
+
+        Proceso (ver orders.services):
         1. Valida items del carrito y datos de facturación
-        2. Verifica stock de productos
-        3. Calcula el total de la orden
-        4. Crea Payment Intent en Stripe
-        5. Crea la orden y sus items
-        6. Retorna la orden con client_secret para el frontend
+        2. Transacción corta: lee los productos con una sola consulta,
+           descuenta el stock de todo el carrito con un UPDATE condicional
+           y crea la orden y sus items (bulk_create)
+        3. Crea Payment Intent en Stripe, sin bloqueos y con idempotency key
+        4. Guarda el intent en la orden; si Stripe falla, la orden se
+           compensa (failed) y el stock se devuelve
+        5. Retorna la orden con client_secret para el frontend
 
         Request body:
         {
@@ -117,109 +174,77 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
         billing_details.setdefault('country', 'US')
 
         try:
-            # Calcular total y verificar stock
-            total_amount = Decimal('0.00')
-            items_to_create = []
-
-            for item_data in items_data:
-                producto = Producto.objects.select_for_update().get(
-                    id=item_data['producto_id']
-                )
-                cantidad = item_data['cantidad']
-
-                # Verificar stock nuevamente (doble verificación)
-                if producto.stock < cantidad:
-                    return Response(
+            # Fase 1: reservar stock y crear la orden (transacción corta)
+            order = reservar_orden(request.user, items_data, billing_details, notes)
+        except ProductosNoEncontrados:
+            return Response(
+                {'error': 'Uno o más productos no existen'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        except StockInsuficiente as e:
+            return Response(
+                {
+                    'error': str(e),
+                    'faltantes': [
                         {
-                            'error': f'Stock insuficiente para {producto.nombre}. '
-                                   f'Disponible: {producto.stock}'
-                        },
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
-                precio_unitario = producto.precio
-                subtotal = precio_unitario * cantidad
-                total_amount += subtotal
-
-                items_to_create.append({
-                    'producto': producto,
-                    'cantidad': cantidad,
-                    'precio_unitario': precio_unitario,
-                    'subtotal': subtotal,
-                })
-
-            # Crear Payment Intent en Stripe
-            try:
-                payment_intent = stripe.PaymentIntent.create(
-                    amount=int(total_amount * 100),  # Convertir a centavos
-                    currency='usd',
-                    metadata={
-                        'user_id': request.user.id,
-                        'user_email': request.user.email,
-                    },
-                    description=f'Orden para {billing_details["name"]}',
-                )
-            except stripe.error.StripeError as e:
-                return Response(
-                    {'error': f'Error al procesar con Stripe: {str(e)}'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-            # Crear la orden
-            order = Order.objects.create(
-                user=request.user,
-                total_amount=total_amount,
-                status='pending',
-                stripe_payment_intent_id=payment_intent.id,
-                billing_name=billing_details['name'],
-                billing_email=billing_details['email'],
-                billing_phone=billing_details['phone'],
-                billing_address=billing_details['address'],
-                billing_city=billing_details['city'],
-                billing_country=billing_details['country'],
-                notes=notes,
+                            'producto_id': f.producto_id,
+                            'solicitado': f.solicitado,
+                            'disponible': f.disponible,
+                        }
+                        for f in e.faltantes.values()
+                    ],
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception as e:
+            return Response(
+                {'error': f'Error al crear la orden: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-            # Crear items de la orden
-            for item_data in items_to_create:
-                OrderItem.objects.create(
-                    order=order,
-                    producto=item_data['producto'],
-                    cantidad=item_data['cantidad'],
-                    precio_unitario=item_data['precio_unitario'],
-                    subtotal=item_data['subtotal'],
-                )
-
-            # Preparar respuesta con client_secret
-            order_serializer = OrderSerializer(order)
-            response_data = order_serializer.data
-            response_data['client_secret'] = payment_intent.client_secret
-
-            return Response(response_data, status=status.HTTP_201_CREATED)
-
-        except Producto.DoesNotExist:
+        # Fase 2: crear Payment Intent en Stripe sin bloqueos
+        try:
+            payment_intent = crear_payment_intent(order)
+        except stripe.error.StripeError as e:
+            compensar(order, 'failed')
             return Response(
-                {'error': 'Uno o más productos no existen'},
-                status=status.HTTP_404_NOT_FOUND
+                {'error': f'Error al procesar con Stripe: {str(e)}'},
+                status=status.HTTP_400_BAD_REQUEST
             )
         except Exception as e:
+            compensar(order, 'failed')
             return Response(
                 {'error': f'Error al crear la orden: {str(e)}'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+        # Fase 3: guardar el intent si la reserva sigue vigente
+        if not adjuntar_payment_intent(order, payment_intent):
+            try:
+                stripe.PaymentIntent.cancel(payment_intent.id)
+            except stripe.error.StripeError:
+                pass
+            return Response(
+                {'error': 'La reserva de la orden expiró, vuelve a intentarlo'},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        # Preparar respuesta con client_secret
+        order_serializer = OrderSerializer(order)
+        response_data = order_serializer.data
+        response_data['client_secret'] = payment_intent.client_secret
+
+        return Response(response_data, status=status.HTTP_201_CREATED)
+
     @action(detail=False, methods=['post'])
-    @transaction.atomic
     def confirm_payment(self, request):
         """
-        Confirma un pago y actualiza el estado de la orden.
+        Retorna la orden asociada a un Payment Intent con su estado actual.
 
-        Proceso:
-        1. Recibe payment_intent_id
-        2. Verifica el estado del pago con Stripe
-        3. Actualiza el estado de la orden
-        4. Reduce el stock si el pago fue exitoso
-        5. Retorna la orden actualizada
+        Es una lectura local: no consulta a Stripe. El estado lo actualizan
+        los eventos del webhook, así que justo después de confirmar el pago
+        en el frontend la orden puede seguir 'pending' o 'processing' unos
+        segundos, hasta que el worker aplique el evento.
 
         Request body:
         {
@@ -234,58 +259,35 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        payment_intent_id = serializer.validated_data['payment_intent_id']
-
         try:
-            # Buscar la orden
-            order = Order.objects.select_for_update().get(
-                stripe_payment_intent_id=payment_intent_id,
-                user=request.user
+            order = self.get_queryset().get(
+                stripe_payment_intent_id=serializer.validated_data['payment_intent_id']
             )
-
-            # Verificar estado del pago con Stripe
-            try:
-                payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
-            except stripe.error.StripeError as e:
-                return Response(
-                    {'error': f'Error al verificar el pago con Stripe: {str(e)}'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-            # Actualizar estado de la orden según el estado del pago
-            if payment_intent.status == 'succeeded':
-                order.status = 'paid'
-
-                # Reducir stock de productos
-                for item in order.items.all():
-                    producto = Producto.objects.select_for_update().get(
-                        id=item.producto.id
-                    )
-                    producto.stock -= item.cantidad
-                    producto.save()
-
-            elif payment_intent.status == 'processing':
-                order.status = 'processing'
-            elif payment_intent.status == 'requires_payment_method':
-                order.status = 'failed'
-            elif payment_intent.status == 'canceled':
-                order.status = 'cancelled'
-            else:
-                order.status = 'failed'
-
-            order.save()
-
-            # Retornar orden actualizada
-            order_serializer = OrderSerializer(order)
-            return Response(order_serializer.data, status=status.HTTP_200_OK)
-
         except Order.DoesNotExist:
             return Response(
                 {'error': 'Orden no encontrada o no pertenece al usuario'},
                 status=status.HTTP_404_NOT_FOUND
             )
-        except Exception as e:
-            return Response(
-                {'error': f'Error al confirmar el pago: {str(e)}'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+
+        order_serializer = OrderSerializer(order)
+        return Response(order_serializer.data, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def stripe_webhook(request):
+    """
+    Recibe los eventos de Stripe (POST /api/stripe/webhook/).
+
+    Verifica la firma (header Stripe-Signature) y guarda el evento en la
+    bandeja de entrada; el worker process_stripe_events lo aplica después.
+    Un evento repetido responde 200 sin volver a guardarse.
+    """
+    try:
+        registrar_evento(request.body, request.META.get('HTTP_STRIPE_SIGNATURE', ''))
+    except (ValueError, KeyError):
+        return Response({'error': 'Payload inválido'}, status=status.HTTP_400_BAD_REQUEST)
+    except stripe.error.SignatureVerificationError:
+        return Response({'error': 'Firma inválida'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'received': True}, status=status.HTTP_200_OK)
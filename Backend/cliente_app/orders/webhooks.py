@@ -0,0 +1,147 @@
+"""
+Webhook de Stripe: ingesta de eventos y aplicación en lote.
+
+El endpoint solo verifica la firma y guarda el evento crudo en la bandeja
+de entrada (StripeEvent), con un INSERT que ignora event_id repetidos, así
+que responde rápido y los reintentos de Stripe no tienen efecto.
+
+El worker (process_stripe_events) toma los eventos pendientes en bloques y
+por cada bloque, en una sola transacción:
+
+1. Lee y bloquea con una consulta las órdenes de los intents del bloque.
+2. Aplica las transiciones en memoria, en el orden de llegada. Solo las
+   órdenes que todavía retienen stock cambian de estado, así que un evento
+   repetido o fuera de orden (processing después de succeeded) no hace nada.
+3. Guarda los estados con bulk_update y mueve el stock con UPDATE con
+   F() para todo el bloque: las reservas de las órdenes pagadas salen del
+   stock y las de las que fallaron o se cancelaron vuelven a estar
+   disponibles (ver orders.services).
+4. Marca los eventos como procesados.
+
+Un pago exitoso para una orden que ya no retiene stock porque se canceló
+(venció su reserva) o falló no la revive: el cliente fue cobrado pero no
+tiene orden ni stock. El evento se marca requires_review y se registra
+con nivel error para que alguien reembolse el cobro o complete la orden.
+"""
+
+import json
+import logging
+
+import stripe
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Order, StripeEvent
+from .services import (
+    ESTADOS_CON_RESERVA,
+    ESTADOS_QUE_LIBERAN,
+    ESTADOS_VENDIDOS,
+    liberar_reservas,
+    vender_ordenes,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+# Estado de la orden que corresponde a cada evento de PaymentIntent
+ESTADO_POR_EVENTO = {
+    'payment_intent.succeeded': 'paid',
+    'payment_intent.processing': 'processing',
+    'payment_intent.payment_failed': 'failed',
+    'payment_intent.canceled': 'cancelled',
+}
+
+
+def registrar_evento(payload, firma):
+    """
+    Verifica la firma del evento con STRIPE_WEBHOOK_SECRET y lo guarda en
+    la bandeja de entrada; si el event_id ya existía no hace nada.
+    Lanza ValueError (payload inválido) o SignatureVerificationError.
+    """
+    stripe.Webhook.construct_event(payload, firma, settings.STRIPE_WEBHOOK_SECRET)
+    evento = json.loads(payload)
+    objeto = evento.get('data', {}).get('object', {})
+    payment_intent_id = objeto.get('id', '') if objeto.get('object') == 'payment_intent' else ''
+
+    StripeEvent.objects.bulk_create([
+        StripeEvent(
+            event_id=evento['id'],
+            type=evento.get('type', ''),
+            payment_intent_id=payment_intent_id,
+            payload=evento,
+        )
+    ], ignore_conflicts=True)
+
+
+def procesar_eventos(limite=100):
+    """
+    Aplica un bloque de hasta `limite` eventos pendientes.
+    Retorna (eventos procesados, órdenes que cambiaron de estado).
+    """
+    from productos.compras_conjuntas import ESTADOS_PAGADOS, registrar_orden
+
+    ahora = timezone.now()
+    with transaction.atomic():
+        eventos = list(
+            StripeEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True)
+            .only('id', 'event_id', 'type', 'payment_intent_id')
+            .order_by('id')[:limite]
+        )
+        if not eventos:
+            return 0, 0
+
+        intents = {
+            evento.payment_intent_id for evento in eventos
+            if evento.type in ESTADO_POR_EVENTO and evento.payment_intent_id
+        }
+        ordenes = {
+            order.stripe_payment_intent_id: order
+            for order in Order.objects.select_for_update()
+            .filter(stripe_payment_intent_id__in=intents)
+            .only('id', 'status', 'stripe_payment_intent_id', 'updated_at')
+        }
+
+        cambiadas = {}
+        a_revisar = []
+        for evento in eventos:
+            order = ordenes.get(evento.payment_intent_id)
+            estado = ESTADO_POR_EVENTO.get(evento.type)
+            if order is None or estado is None:
+                continue
+            if order.status in ESTADOS_CON_RESERVA and order.status != estado:
+                order.status = estado
+                order.updated_at = ahora
+                cambiadas[order.pk] = order
+            elif estado in ESTADOS_VENDIDOS and order.status in ESTADOS_QUE_LIBERAN:
+                a_revisar.append(evento.pk)
+                logger.error(
+                    'Pago exitoso para la orden #%s, que ya está %s: cobro sin orden '
+                    '(PaymentIntent %s, evento %s); requiere reembolso o revisión',
+                    order.pk, order.status, evento.payment_intent_id, evento.event_id,
+                )
+
+        if cambiadas:
+            Order.objects.bulk_update(cambiadas.values(), ['status', 'updated_at'])
+            faltantes = vender_ordenes([
+                pk for pk, order in cambiadas.items() if order.status in ESTADOS_VENDIDOS
+            ])
+            if faltantes:
+                # Solo órdenes sin reserva: el cobro ya ocurrió, se vende igual
+                logger.error('Órdenes pagadas sin stock suficiente: %s', list(faltantes.values()))
+            liberar_reservas([
+                pk for pk, order in cambiadas.items() if order.status in ESTADOS_QUE_LIBERAN
+            ])
+            # bulk_update no emite post_save: se registran las compras aquí
+            for pk, order in cambiadas.items():
+                if order.status in ESTADOS_PAGADOS:
+                    transaction.on_commit(lambda pk=pk: registrar_orden(pk))
+
+        if a_revisar:
+            StripeEvent.objects.filter(pk__in=a_revisar).update(requires_review=True)
+        StripeEvent.objects.filter(pk__in=[evento.pk for evento in eventos]).update(
+            processed_at=ahora
+        )
+    return len(eventos), len(cambiadas)
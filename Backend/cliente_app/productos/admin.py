@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Producto
+from .models import EmbeddingJob, Producto
 
 # Register your models here.
-admin.site.register(Producto)
\ No newline at end of file
+admin.site.register(Producto)
+
+admin.site.register(EmbeddingJob)
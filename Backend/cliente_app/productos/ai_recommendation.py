@@ -1,15 +1,71 @@
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-
-def recomendar(producto_obj, todos_productos, top_n=4):
-    """Recomienda productos similares usando embeddings."""
-    if not producto_obj.embedding:
-        return []
-
-    producto_vec = np.array(producto_obj.embedding).reshape(1, -1)
-    embeddings = np.array([p.embedding for p in todos_productos])
-    
-    similitudes = cosine_similarity(producto_vec, embeddings)
-    indices_ordenados = np.argsort(similitudes[0])[::-1]  # de mayor a menor
-    recomendados = [todos_productos[i] for i in indices_ordenados if todos_productos[i] != producto_obj][:top_n]
-    return recomendados
+from .ann import get_vector_backend
+from .vecinos import vecinos_por_producto
+
+
+def recomendar(producto_obj, top_n=4, filtros=None):
+    """
+    Recomienda productos similares.
+
+    Usa los vecinos precalculados (ProductoRecomendacion) con una sola
+    consulta indexada; ya combinan embeddings y compras conjuntas según
+    RECOMMENDATION_COPURCHASE_WEIGHT (ver productos.vecinos). Si el
+    producto aún no los tiene, consulta el backend vectorial del worker
+    (exacto o ANN, según RECOMMENDATION_BACKEND). En ningún caso necesita
+    el embedding cargado en la instancia.
+
+    Con filtros (ver vector_index.construir_mascara) siempre se consulta
+    el backend, que los aplica como máscara antes de ordenar, solo por
+    similitud de embeddings.
+    """
+    from .models import Producto
+
+    if not filtros and top_n <= vecinos_por_producto():
+        precalculados = list(
+            Producto.objects.defer('embedding')
+            .filter(recomendado_en__producto_id=producto_obj.pk)
+            .order_by('recomendado_en__posicion')[:top_n]
+        )
+        if precalculados:
+            return precalculados
+
+    resultados = get_vector_backend().similares(
+        producto_obj.pk, top_n=top_n, filtros=filtros
+    )
+    return _cargar(resultados)
+
+
+def _cargar(resultados):
+    """Instancias (sin embedding) de [(id, score), ...] en el mismo orden."""
+    from .models import Producto
+
+    ids = [pk for pk, _ in resultados]
+    productos = Producto.objects.defer('embedding').in_bulk(ids)
+    return [productos[pk] for pk in ids if pk in productos]
+
+
+def recomendar_lote(producto_ids, top_n=4, top_n_agregado=None, filtros=None):
+    """
+    Recomendaciones de varios productos a la vez (carrito, página de
+    categoría): las de cada uno y un conjunto agregado "también te puede
+    gustar". Una sola pasada por el backend vectorial y una sola consulta
+    para cargar todos los productos resultantes.
+
+    Retorna ({producto_id: [Producto, ...]}, [Producto, ...]).
+    """
+    from .models import Producto
+
+    por_producto, agregadas = get_vector_backend().similares_lote(
+        producto_ids, top_n=top_n, top_n_agregado=top_n_agregado, filtros=filtros
+    )
+
+    ids = {pk for resultados in por_producto.values() for pk, _ in resultados}
+    ids.update(pk for pk, _ in agregadas)
+    productos = Producto.objects.defer('embedding').in_bulk(ids)
+
+    def cargar(resultados):
+        return [productos[pk] for pk, _ in resultados if pk in productos]
+
+    return (
+        {pk: cargar(por_producto.get(pk, [])) for pk in producto_ids},
+        cargar(agregadas),
+    )
@@ -0,0 +1,458 @@
+"""
+Búsqueda aproximada de vecinos (ANN) para catálogos grandes.
+
+Implementa un índice IVF (inverted file) en NumPy: k-means esférico
+agrupa los vectores en listas, cada consulta compara primero contra los
+centroides y solo puntúa los vectores de las `nprobe` listas más cercanas.
+Más nprobe = más recall y más latencia.
+
+El índice se construye con `python manage.py build_ann_index`, se publica
+como archivos .npy en un subdirectorio versionado de RECOMMENDATION_ANN_PATH
+y los workers lo abren con memory-map, así que arrancar es instantáneo y las páginas se comparten
+entre procesos. Los cambios posteriores a la construcción se mantienen en
+un delta en memoria que se busca de forma exacta.
+
+Los metadatos de filtrado (categoría, disponible, precio, promoción) no se
+publican con el índice porque cambian mucho más seguido que los vectores:
+el backend los lee de la base de datos con una consulta, alineados con las
+posiciones del IVF, y los refresca con el mismo TTL.
+
+El backend se elige con RECOMMENDATION_BACKEND ('exact' o 'ivf').
+"""
+
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F
+
+from .vector_index import (
+    METADATOS,
+    construir_mascara,
+    embedding_index,
+    normalizar,
+    productos_en_promocion,
+    top_k,
+)
+
+
+ARCHIVOS = ('centroides', 'vectores', 'ids', 'offsets', 'ids_ordenados', 'orden_ids')
+
+
+def _asignar(matriz, centroides, bloque=8192):
+    """Lista (centroide más similar) de cada vector, por bloques."""
+    asignacion = np.empty(matriz.shape[0], dtype=np.int64)
+    for inicio in range(0, matriz.shape[0], bloque):
+        asignacion[inicio:inicio + bloque] = np.argmax(
+            matriz[inicio:inicio + bloque] @ centroides.T, axis=1
+        )
+    return asignacion
+
+
+def kmeans_esferico(matriz, n_listas, iteraciones=10, seed=0):
+    """k-means con similitud coseno sobre vectores ya normalizados."""
+    rng = np.random.default_rng(seed)
+    centroides = matriz[rng.choice(matriz.shape[0], n_listas, replace=False)].copy()
+    for _ in range(iteraciones):
+        asignacion = _asignar(matriz, centroides)
+        orden = np.argsort(asignacion, kind='stable')
+        conteos = np.bincount(asignacion, minlength=n_listas)
+        inicios = np.concatenate(([0], np.cumsum(conteos)[:-1]))
+        no_vacias = conteos > 0
+        sumas = np.add.reduceat(matriz[orden], inicios[no_vacias], axis=0)
+        centroides[no_vacias] = normalizar(sumas)
+        # Las listas vacías se reinician con vectores al azar
+        vacias = np.flatnonzero(~no_vacias)
+        if len(vacias):
+            centroides[vacias] = matriz[rng.choice(matriz.shape[0], len(vacias), replace=False)]
+    return centroides
+
+
+class IVFIndex:
+    """
+    Vectores normalizados agrupados por lista de forma contigua:
+    la lista i ocupa vectores[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, centroides, vectores, ids, offsets, ids_ordenados, orden_ids,
+                 creado_en=None):
+        self.centroides = centroides
+        self.vectores = vectores
+        self.ids = ids
+        self.offsets = offsets
+        # ids_ordenados[i] == ids[orden_ids[i]], para buscar por id con bisección
+        self.ids_ordenados = ids_ordenados
+        self.orden_ids = orden_ids
+        self.creado_en = creado_en or time.time()
+
+    @classmethod
+    def entrenar(cls, ids, matriz, n_listas=None, iteraciones=10, muestra=None, seed=0,
+                 creado_en=None):
+        """
+        Construye el índice a partir de ids y su matriz de embeddings.
+        creado_en es el momento en que se leyeron los datos.
+        """
+        matriz = normalizar(matriz)
+        ids = np.asarray(ids, dtype=np.int64)
+        total = matriz.shape[0]
+        n_listas = min(total, n_listas or max(1, int(4 * np.sqrt(total))))
+
+        # Se entrena sobre una muestra y luego se asignan todos los vectores
+        rng = np.random.default_rng(seed)
+        muestra = min(total, muestra or n_listas * 64)
+        entrenamiento = matriz[rng.choice(total, muestra, replace=False)]
+        centroides = kmeans_esferico(entrenamiento, n_listas, iteraciones, seed)
+
+        asignacion = _asignar(matriz, centroides)
+        orden = np.argsort(asignacion, kind='stable')
+        conteos = np.bincount(asignacion, minlength=n_listas)
+        offsets = np.concatenate(([0], np.cumsum(conteos))).astype(np.int64)
+        ids_por_lista = ids[orden]
+        orden_ids = np.argsort(ids_por_lista, kind='stable')
+        return cls(
+            centroides=centroides.astype(np.float32),
+            vectores=np.ascontiguousarray(matriz[orden]),
+            ids=ids_por_lista,
+            offsets=offsets,
+            ids_ordenados=ids_por_lista[orden_ids],
+            orden_ids=orden_ids,
+            creado_en=creado_en,
+        )
+
+    def guardar(self, directorio):
+        """Guarda un .npy por arreglo, más metadatos en meta.json."""
+        os.makedirs(directorio, exist_ok=True)
+        for nombre in ARCHIVOS:
+            np.save(os.path.join(directorio, f'{nombre}.npy'), getattr(self, nombre))
+        with open(os.path.join(directorio, 'meta.json'), 'w') as archivo:
+            json.dump({
+                'creado_en': self.creado_en,
+                'n_listas': int(self.centroides.shape[0]),
+                'total': int(self.ids.shape[0]),
+            }, archivo)
+
+    @classmethod
+    def cargar(cls, directorio, mmap=True):
+        """Abre un índice guardado; con mmap no se lee a memoria por adelantado."""
+        modo = 'r' if mmap else None
+        arreglos = {
+            nombre: np.load(os.path.join(directorio, f'{nombre}.npy'), mmap_mode=modo)
+            for nombre in ARCHIVOS
+        }
+        with open(os.path.join(directorio, 'meta.json')) as archivo:
+            meta = json.load(archivo)
+        return cls(creado_en=meta['creado_en'], **arreglos)
+
+    def __len__(self):
+        return self.ids.shape[0]
+
+    def posicion(self, pk):
+        """Posición del id en `vectores`, o None (búsqueda binaria)."""
+        i = int(np.searchsorted(self.ids_ordenados, pk))
+        if i < len(self.ids_ordenados) and self.ids_ordenados[i] == pk:
+            return int(self.orden_ids[i])
+        return None
+
+    def publicar(self, ruta):
+        """
+        Guarda el índice en un subdirectorio nuevo de `ruta` y lo marca como
+        vigente reemplazando `actual.json` de forma atómica. Los workers que
+        tienen abierta la versión anterior no se ven afectados.
+        """
+        version = f'v{int(self.creado_en * 1000)}'
+        self.guardar(os.path.join(ruta, version))
+        temporal = os.path.join(ruta, 'actual.json.tmp')
+        with open(temporal, 'w') as archivo:
+            json.dump({'version': version, 'creado_en': self.creado_en}, archivo)
+        os.replace(temporal, os.path.join(ruta, 'actual.json'))
+        return version
+
+    @staticmethod
+    def version_publicada(ruta):
+        """Contenido de actual.json, o None si no hay índice publicado."""
+        try:
+            with open(os.path.join(ruta, 'actual.json')) as archivo:
+                return json.load(archivo)
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def abrir_publicado(cls, ruta):
+        """Abre con memory-map la versión vigente publicada en `ruta`."""
+        actual = cls.version_publicada(ruta)
+        if actual is None:
+            raise FileNotFoundError(f'No hay índice ANN publicado en {ruta}')
+        return cls.cargar(os.path.join(ruta, actual['version']))
+
+    def posiciones(self, ids):
+        """Posiciones en `vectores` de un arreglo de ids (-1 si no están)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        indices = np.searchsorted(self.ids_ordenados, ids)
+        encontrados = indices < len(self.ids_ordenados)
+        encontrados[encontrados] = self.ids_ordenados[indices[encontrados]] == ids[encontrados]
+        resultado = np.full(ids.shape[0], -1, dtype=np.int64)
+        resultado[encontrados] = self.orden_ids[indices[encontrados]]
+        return resultado
+
+    def candidatos(self, consulta, nprobe):
+        """Posiciones de los vectores de las nprobe listas más cercanas."""
+        listas = top_k(self.centroides @ consulta, nprobe)
+        rangos = [(self.offsets[i], self.offsets[i + 1]) for i in np.sort(listas)]
+        return np.concatenate(
+            [np.arange(inicio, fin) for inicio, fin in rangos]
+        ) if rangos else np.empty(0, dtype=np.int64)
+
+
+class IVFBackend:
+    """
+    Backend de recomendaciones sobre un IVFIndex con memory-map, con el
+    mismo contrato que EmbeddingIndex (buscar, similares, vector,
+    actualizar, actualizar_metadatos, eliminar). Los productos cambiados
+    después de construir el índice se guardan en un delta en memoria, que
+    reemplaza su copia IVF y se busca de forma exacta.
+
+    Con filtros, si las listas visitadas no alcanzan top_n resultados se
+    repite la búsqueda con nprobe cuatro veces mayor, hasta recorrer todas.
+    """
+
+    def __init__(self, ruta, nprobe=8, ttl=None):
+        self.ruta = ruta
+        self.nprobe = nprobe
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._ivf = None
+        self._revisado_en = 0.0
+        # pk -> (vector normalizado o None si se eliminó, time.time())
+        self._delta = {}
+        # Metadatos alineados con las posiciones del IVF (None = sin leer)
+        # y los de productos que no están en él
+        self._meta = None
+        self._meta_extra = {}
+        self._meta_leida_en = 0.0
+
+    def cargar(self):
+        """Abre (o reabre, si se reconstruyó) el índice guardado en disco."""
+        ivf = IVFIndex.abrir_publicado(self.ruta)
+        with self._lock:
+            # Se conservan solo los cambios posteriores a la construcción
+            self._delta = {
+                pk: cambio for pk, cambio in self._delta.items()
+                if cambio[1] > ivf.creado_en
+            }
+            self._ivf = ivf
+            self._meta = None
+            self._revisado_en = time.monotonic()
+
+    def _asegurar_cargado(self):
+        with self._lock:
+            if self._ivf is not None:
+                vencido = (
+                    self.ttl is not None
+                    and time.monotonic() - self._revisado_en > self.ttl
+                )
+                if not vencido:
+                    return
+                self._revisado_en = time.monotonic()
+                actual = IVFIndex.version_publicada(self.ruta)
+                if actual is None or actual['creado_en'] == self._ivf.creado_en:
+                    return
+        self.cargar()
+
+    @property
+    def cargado(self):
+        """Si hay metadatos en memoria que actualizar_metadatos debe mantener."""
+        return self._meta is not None
+
+    def __contains__(self, pk):
+        return self.vector(pk) is not None
+
+    def _leer_metadatos(self, ivf):
+        """Lee de la base de datos los metadatos de filtrado de todo el catálogo."""
+        from .models import Producto
+
+        filas = list(
+            Producto.objects.values_list('id', 'categoria_id', F('stock') - F('reservado'), 'precio')
+            .iterator(chunk_size=5000)
+        )
+        promociones = productos_en_promocion()
+        meta = {
+            nombre: np.full(len(ivf), vacio, dtype=dtype)
+            for nombre, (dtype, vacio) in METADATOS.items()
+        }
+        extra = {}
+        if filas:
+            ids, categorias, disponibles, precios = zip(*filas)
+            posiciones = ivf.posiciones(ids)
+            columnas = {
+                'categoria': np.asarray(categorias, dtype=np.int64),
+                'disponible': np.asarray(disponibles, dtype=np.int64),
+                'precio': np.asarray(precios, dtype=np.float64),
+                'promocion': np.isin(ids, list(promociones)),
+            }
+            en_ivf = posiciones >= 0
+            for nombre, valores in columnas.items():
+                meta[nombre][posiciones[en_ivf]] = valores[en_ivf]
+            for i in np.flatnonzero(~en_ivf):
+                extra[ids[i]] = {nombre: valores[i] for nombre, valores in columnas.items()}
+        return meta, extra
+
+    def _metadatos(self):
+        """Metadatos vigentes; se releen al vencer el TTL."""
+        with self._lock:
+            ivf = self._ivf
+            vencido = (
+                self._meta is None
+                or self.ttl is not None and time.monotonic() - self._meta_leida_en > self.ttl
+            )
+            if not vencido:
+                return self._meta, self._meta_extra
+        meta, extra = self._leer_metadatos(ivf)
+        with self._lock:
+            if self._ivf is ivf:
+                self._meta, self._meta_extra = meta, extra
+                self._meta_leida_en = time.monotonic()
+        return meta, extra
+
+    def actualizar(self, pk, embedding, **metadatos):
+        vacio = embedding is None or len(embedding) == 0
+        with self._lock:
+            self._delta[pk] = (None if vacio else normalizar(embedding), time.time())
+        self.actualizar_metadatos(pk, **metadatos)
+
+    def actualizar_metadatos(self, pk, **metadatos):
+        with self._lock:
+            if self._meta is None:
+                # Se leerán completos en la próxima búsqueda filtrada
+                return
+            posicion = self._ivf.posicion(pk)
+            for nombre, valor in metadatos.items():
+                if valor is None:
+                    continue
+                if posicion is None:
+                    self._meta_extra.setdefault(pk, {
+                        nombre: vacio for nombre, (_, vacio) in METADATOS.items()
+                    })[nombre] = valor
+                else:
+                    self._meta[nombre][posicion] = valor
+
+    def eliminar(self, pk):
+        self.actualizar(pk, None)
+
+    def vector(self, pk):
+        self._asegurar_cargado()
+        with self._lock:
+            if pk in self._delta:
+                vector = self._delta[pk][0]
+                return None if vector is None else vector.copy()
+            posicion = self._ivf.posicion(pk)
+            return None if posicion is None else np.array(self._ivf.vectores[posicion])
+
+    def buscar(self, vector, top_n=4, excluir=(), filtros=None):
+        self._asegurar_cargado()
+        consulta = normalizar(vector)
+        meta, extra = self._metadatos() if filtros else (None, None)
+        with self._lock:
+            ivf = self._ivf
+            descartar = set(self._delta) | set(excluir)
+            delta = [
+                (pk, v) for pk, (v, _) in self._delta.items()
+                if v is not None and pk not in excluir
+            ]
+            if delta and filtros:
+                # Metadatos de los productos del delta, en el orden de `delta`
+                posiciones = ivf.posiciones([pk for pk, _ in delta])
+                meta_delta = {
+                    nombre: np.asarray([
+                        meta[nombre][p] if p >= 0 else extra.get(pk, {}).get(nombre, vacio)
+                        for (pk, _), p in zip(delta, posiciones)
+                    ], dtype=dtype)
+                    for nombre, (dtype, vacio) in METADATOS.items()
+                }
+                delta = [d for d, ok in zip(delta, construir_mascara(filtros, meta_delta)) if ok]
+        if consulta.shape[0] != ivf.centroides.shape[1]:
+            return []
+
+        if delta:
+            ids_delta = np.asarray([pk for pk, _ in delta], dtype=np.int64)
+            scores_delta = np.vstack([v for _, v in delta]) @ consulta
+        else:
+            ids_delta = np.empty(0, dtype=np.int64)
+            scores_delta = np.empty(0, dtype=np.float32)
+
+        n_listas = ivf.centroides.shape[0]
+        nprobe = self.nprobe
+        while True:
+            posiciones = ivf.candidatos(consulta, nprobe)
+            ids = ivf.ids[posiciones]
+            scores = ivf.vectores[posiciones] @ consulta
+            if descartar:
+                scores[np.isin(ids, list(descartar))] = -np.inf
+            if filtros:
+                mascara = construir_mascara(
+                    filtros, {nombre: arreglo[posiciones] for nombre, arreglo in meta.items()}
+                )
+                scores[~mascara] = -np.inf
+            ids = np.concatenate([ids, ids_delta])
+            scores = np.concatenate([scores, scores_delta])
+            resultados = [
+                (int(ids[i]), float(scores[i]))
+                for i in top_k(scores, top_n) if np.isfinite(scores[i])
+            ]
+            if len(resultados) >= top_n or not filtros or nprobe >= n_listas:
+                return resultados
+            nprobe = min(n_listas, nprobe * 4)
+
+    def similares(self, pk, top_n=4, filtros=None):
+        vector = self.vector(pk)
+        if vector is None:
+            return []
+        return self.buscar(vector, top_n=top_n, excluir=(pk,), filtros=filtros)
+
+    def similares_lote(self, pks, top_n=4, top_n_agregado=None, filtros=None):
+        """
+        Mismo contrato que EmbeddingIndex.similares_lote. Cada consulta
+        visita sus propias listas, así que aquí es una búsqueda por producto;
+        las agregadas usan el vector medio (mismo orden que la similitud media).
+        """
+        top_n_agregado = top_n if top_n_agregado is None else top_n_agregado
+        vectores = {pk: self.vector(pk) for pk in dict.fromkeys(pks)}
+        vectores = {pk: v for pk, v in vectores.items() if v is not None}
+        if not vectores:
+            return {}, []
+        excluir = tuple(vectores)
+        por_producto = {
+            pk: self.buscar(v, top_n=top_n, excluir=excluir, filtros=filtros)
+            for pk, v in vectores.items()
+        }
+        agregadas = self.buscar(
+            np.mean(list(vectores.values()), axis=0),
+            top_n=top_n_agregado, excluir=excluir, filtros=filtros,
+        )
+        return por_producto, agregadas
+
+
+_backend = None
+
+
+def get_vector_backend():
+    """
+    Backend de búsqueda vectorial configurado en RECOMMENDATION_BACKEND.
+    'exact' (por defecto) usa el índice en memoria; 'ivf' el índice
+    aproximado guardado en RECOMMENDATION_ANN_PATH.
+    """
+    global _backend
+    if getattr(settings, 'RECOMMENDATION_BACKEND', 'exact') != 'ivf':
+        return embedding_index
+    if _backend is None:
+        if IVFIndex.version_publicada(settings.RECOMMENDATION_ANN_PATH) is None:
+            # Aún no se ejecutó build_ann_index
+            return embedding_index
+        _backend = IVFBackend(
+            ruta=settings.RECOMMENDATION_ANN_PATH,
+            nprobe=getattr(settings, 'RECOMMENDATION_IVF_NPROBE', 8),
+            ttl=getattr(settings, 'RECOMMENDATION_INDEX_TTL', 300),
+        )
+    return _backend
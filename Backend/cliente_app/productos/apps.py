@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class ProductosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'productos'
+
+    def ready(self):
+        # Con RECOMMENDATION_BACKEND = 'ivf' el índice ANN se abre con
+        # memory-map al arrancar (no lee los vectores a memoria).
+        from .ann import IVFBackend, get_vector_backend
+
+        backend = get_vector_backend()
+        if isinstance(backend, IVFBackend):
+            backend.cargar()
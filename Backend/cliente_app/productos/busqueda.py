@@ -0,0 +1,398 @@
+"""
+Búsqueda de texto de productos: índice invertido en memoria con BM25.
+
+Reemplaza al SearchFilter, que convertía ?search= en LIKE '%termino%'
+sobre nombre y descripción: sin ranking, sin usar índices y recorriendo
+toda la tabla en cada tecla del buscador.
+
+Cada proceso (worker) mantiene un índice invertido en arreglos NumPy
+(formato CSR): el vocabulario ordenado y, por cada término, los productos
+que lo contienen con su frecuencia. El nombre cuenta PESO_NOMBRE veces y
+la descripción una. Una consulta solo recorre las listas de sus términos
+y no consulta la base de datos.
+
+Análisis del texto (igual para productos y consultas): minúsculas, sin
+tildes, diéresis ni virgulilla (piña -> pina), sin stopwords en español
+y con una raíz liviana que quita género y plural (panes -> pan,
+tortas -> tort, nueces -> nuez).
+
+Consulta: deben aparecer todas las palabras (AND). La última también
+vale como prefijo para el type-ahead ("torta choc" encuentra "Torta de
+chocolate"): se prueban los MAX_EXPANSIONES términos con ese prefijo que
+aparecen en más productos, y puntúan PESO_PREFIJO de una coincidencia
+exacta. El puntaje es BM25:
+
+    score = Σ idf(t) · f·(k1 + 1) / (f + k1·(1 - b + b·longitud / promedio))
+
+Igual que el índice vectorial, se construye de forma perezosa en la
+primera búsqueda, se actualiza con las señales de guardado/borrado de
+Producto y se reconstruye pasado SEARCH_INDEX_TTL segundos para recoger
+los cambios de otros workers (o de bulk_create/update). La reconstrucción
+la hace un solo thread; mientras tanto los demás siguen buscando en el
+índice vencido. Solo la primera carga hace esperar.
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+
+import numpy as np
+from django.conf import settings
+
+from .vector_index import top_k
+
+
+K1 = 1.2
+B = 0.75
+PESO_NOMBRE = 3.0
+PESO_PREFIJO = 0.5
+# Términos que se prueban por prefijo (los que están en más productos)
+MAX_EXPANSIONES = 30
+# Largo mínimo de la última palabra para buscarla como prefijo
+MIN_PREFIJO = 2
+
+STOPWORDS = frozenset('''
+    a al algo algun alguna algunas alguno algunos ante antes como con contra
+    cual cuando de del desde donde durante e el ella ellas ellos en entre era
+    es esa esas ese eso esos esta estas este esto estos fue ha hay la las le
+    les lo los mas me mi mis mucho muy nada ni no nos o os otra otro para pero
+    poco por porque que quien se sea ser si sin sobre son su sus tambien te
+    tiene toda todo todos tu tus un una uno unos y ya
+'''.split())
+
+_PALABRA = re.compile(r'[a-z0-9]+')
+
+
+def plegar(texto):
+    """Minúsculas sin tildes, diéresis ni virgulilla: 'Piña Ácida' -> 'pina acida'."""
+    descompuesto = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def raiz(palabra):
+    """
+    Raíz liviana en español (la de SpanishLightStemmer de Lucene): quita
+    la vocal final de género y los plurales en -s/-es, y -ces -> -z. Las
+    palabras de menos de 5 letras no cambian.
+    """
+    if len(palabra) < 5:
+        return palabra
+    if palabra[-1] in 'aoe':
+        return palabra[:-1]
+    if palabra[-1] == 's':
+        if palabra.endswith('eses'):
+            return palabra[:-2]
+        if palabra.endswith('ces'):
+            return palabra[:-3] + 'z'
+        if palabra[-2] in 'aoe':
+            return palabra[:-2]
+    return palabra
+
+
+def palabras(texto):
+    """Palabras plegadas del texto, sin stopwords."""
+    return [p for p in _PALABRA.findall(plegar(texto or '')) if p not in STOPWORDS]
+
+
+def terminos_de(nombre, descripcion):
+    """{término: frecuencia ponderada} de un producto."""
+    frecuencias = Counter()
+    for palabra in palabras(nombre):
+        frecuencias[raiz(palabra)] += PESO_NOMBRE
+    for palabra in palabras(descripcion):
+        frecuencias[raiz(palabra)] += 1
+    return frecuencias
+
+
+class IndiceBusqueda:
+    """
+    Índice invertido de nombre y descripción de los productos.
+
+    La parte principal está en CSR: el término i del vocabulario ordenado
+    tiene sus filas en docs[offsets[i]:offsets[i + 1]] con frecuencias
+    frec[...]. Los productos agregados o editados después de la carga
+    reciben una fila nueva cuyos términos van a un delta (dict); la fila
+    anterior queda marcada como no viva. Todas las operaciones están
+    protegidas por un lock para poder usarse desde varios threads; las
+    reconstrucciones, por otro (_reconstruccion), que no bloquea las
+    búsquedas.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._reconstruccion = threading.Lock()
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._terminos = []
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._docs = np.empty(0, dtype=np.int32)
+        self._frec = np.empty(0, dtype=np.float32)
+        # Delta: término -> [(fila, frecuencia)], y sus términos nuevos ordenados
+        self._delta = defaultdict(list)
+        self._terminos_delta = []
+        # Por fila
+        self._ids = np.empty(0, dtype=np.int64)
+        self._longitud = np.empty(0, dtype=np.float32)
+        self._vivo = np.empty(0, dtype=np.bool_)
+        self._tamano = 0
+        self._posiciones = {}
+        self._vivos = 0
+        self._longitud_total = 0.0
+        self._cargado = False
+        self._cargado_en = 0.0
+
+    # ------------------------------------------------------------------
+    # Carga
+    # ------------------------------------------------------------------
+
+    def cargar(self, filas):
+        """Reemplaza el contenido del índice con filas (id, nombre, descripcion)."""
+        ids, longitudes = [], []
+        postings = defaultdict(list)
+        for fila, (pk, nombre, descripcion) in enumerate(filas):
+            frecuencias = terminos_de(nombre, descripcion)
+            ids.append(pk)
+            longitudes.append(sum(frecuencias.values()))
+            for termino, frecuencia in frecuencias.items():
+                postings[termino].append((fila, frecuencia))
+
+        terminos = sorted(postings)
+        conteos = np.fromiter((len(postings[t]) for t in terminos), dtype=np.int64, count=len(terminos))
+        offsets = np.zeros(len(terminos) + 1, dtype=np.int64)
+        np.cumsum(conteos, out=offsets[1:])
+        docs = np.empty(offsets[-1], dtype=np.int32)
+        frec = np.empty(offsets[-1], dtype=np.float32)
+        for i, termino in enumerate(terminos):
+            lista = np.asarray(postings[termino], dtype=np.float64)
+            docs[offsets[i]:offsets[i + 1]] = lista[:, 0]
+            frec[offsets[i]:offsets[i + 1]] = lista[:, 1]
+
+        with self._lock:
+            self._reiniciar()
+            self._terminos = terminos
+            self._offsets, self._docs, self._frec = offsets, docs, frec
+            self._ids = np.asarray(ids, dtype=np.int64)
+            self._longitud = np.asarray(longitudes, dtype=np.float32)
+            self._vivo = np.ones(len(ids), dtype=np.bool_)
+            self._tamano = self._vivos = len(ids)
+            self._posiciones = {pk: fila for fila, pk in enumerate(ids)}
+            self._longitud_total = float(self._longitud.sum())
+            self._cargado = True
+            self._cargado_en = time.monotonic()
+
+    def reconstruir(self):
+        """Carga todos los productos desde la base de datos."""
+        from .models import Producto
+
+        filas = Producto.objects.values_list('id', 'nombre', 'descripcion')
+        self.cargar(filas.iterator(chunk_size=2000))
+
+    def invalidar(self):
+        """Descarta el contenido; se reconstruirá en la próxima búsqueda."""
+        with self._lock:
+            self._reiniciar()
+
+    def _vigente(self):
+        with self._lock:
+            expirado = (
+                self.ttl is not None
+                and time.monotonic() - self._cargado_en > self.ttl
+            )
+            return self._cargado and not expirado
+
+    def _asegurar_cargado(self):
+        if self._vigente():
+            return
+        # Vencido: si otro thread ya lo reconstruye se busca en el actual.
+        # Sin cargar no hay nada que usar: se espera a quien lo carga.
+        if not self._reconstruccion.acquire(blocking=not self._cargado):
+            return
+        try:
+            if not self._vigente():
+                self.reconstruir()
+        finally:
+            self._reconstruccion.release()
+
+    @property
+    def cargado(self):
+        return self._cargado
+
+    def __len__(self):
+        return self._vivos
+
+    def __contains__(self, pk):
+        return pk in self._posiciones
+
+    # ------------------------------------------------------------------
+    # Actualizaciones incrementales
+    # ------------------------------------------------------------------
+
+    def actualizar(self, pk, nombre, descripcion):
+        """Inserta o reemplaza el texto indexado de un producto."""
+        frecuencias = terminos_de(nombre, descripcion)
+        with self._lock:
+            if not self._cargado:
+                # Se construirá completo en la primera búsqueda
+                return
+            self.eliminar(pk)
+            fila = self._tamano
+            self._reservar(fila + 1)
+            longitud = sum(frecuencias.values())
+            self._ids[fila] = pk
+            self._longitud[fila] = longitud
+            self._vivo[fila] = True
+            self._tamano += 1
+            self._vivos += 1
+            self._longitud_total += longitud
+            self._posiciones[pk] = fila
+            for termino, frecuencia in frecuencias.items():
+                if termino not in self._delta and self._indice_de(termino) is None:
+                    insort(self._terminos_delta, termino)
+                self._delta[termino].append((fila, frecuencia))
+
+    def eliminar(self, pk):
+        """Quita un producto: su fila deja de estar viva."""
+        with self._lock:
+            fila = self._posiciones.pop(pk, None)
+            if fila is None:
+                return
+            self._vivo[fila] = False
+            self._vivos -= 1
+            self._longitud_total -= float(self._longitud[fila])
+
+    def _reservar(self, filas):
+        """Crece los arreglos por fila duplicándolos (amortizado O(1))."""
+        capacidad = len(self._ids)
+        if filas <= capacidad:
+            return
+        nueva = max(filas, capacidad * 2, 16)
+        for nombre in ('_ids', '_longitud', '_vivo'):
+            arreglo = getattr(self, nombre)
+            ampliado = np.zeros(nueva, dtype=arreglo.dtype)
+            ampliado[:self._tamano] = arreglo[:self._tamano]
+            setattr(self, nombre, ampliado)
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    def _indice_de(self, termino):
+        i = bisect_left(self._terminos, termino)
+        if i < len(self._terminos) and self._terminos[i] == termino:
+            return i
+        return None
+
+    def _postings(self, termino):
+        """(filas, frecuencias) vivas de un término."""
+        i = self._indice_de(termino)
+        if i is None:
+            docs = np.empty(0, dtype=np.int32)
+            frec = np.empty(0, dtype=np.float32)
+        else:
+            docs = self._docs[self._offsets[i]:self._offsets[i + 1]]
+            frec = self._frec[self._offsets[i]:self._offsets[i + 1]]
+        delta = self._delta.get(termino)
+        if delta:
+            extra = np.asarray(delta, dtype=np.float64)
+            docs = np.concatenate([docs, extra[:, 0].astype(np.int32)])
+            frec = np.concatenate([frec, extra[:, 1].astype(np.float32)])
+        vivos = self._vivo[docs]
+        return docs[vivos], frec[vivos]
+
+    def _expansiones(self, prefijo):
+        """Términos que empiezan con `prefijo`, los de más filas primero."""
+        fin = prefijo + '\uffff'
+        inicio, final = bisect_left(self._terminos, prefijo), bisect_left(self._terminos, fin)
+        candidatos = self._terminos[inicio:final]
+        conteos = list(np.diff(self._offsets[inicio:final + 1]))
+        for termino in self._terminos_delta[
+            bisect_left(self._terminos_delta, prefijo):bisect_left(self._terminos_delta, fin)
+        ]:
+            candidatos.append(termino)
+            conteos.append(len(self._delta[termino]))
+        if len(candidatos) > MAX_EXPANSIONES:
+            mejores = top_k(np.asarray(conteos, dtype=np.float64), MAX_EXPANSIONES)
+            candidatos = [candidatos[i] for i in mejores]
+        return candidatos
+
+    def grupos(self, consulta):
+        """
+        [{término: peso}] por palabra de la consulta: su raíz y, para la
+        última palabra, los términos que empiezan con ella.
+        """
+        lista = palabras(consulta)
+        grupos, vistos = [], set()
+        for i, palabra in enumerate(lista):
+            grupo = {raiz(palabra): 1.0}
+            ultima = i == len(lista) - 1
+            if ultima and len(palabra) >= MIN_PREFIJO:
+                for termino in self._expansiones(palabra):
+                    grupo.setdefault(termino, PESO_PREFIJO)
+            if set(grupo) <= vistos:
+                continue
+            vistos.update(grupo)
+            grupos.append(grupo)
+        return grupos
+
+    def buscar(self, consulta, limite=None, ids=None):
+        """
+        [(producto_id, score)] de los productos que contienen todas las
+        palabras de la consulta, de mayor a menor score (a igual score,
+        por id). `limite` se queda con los mejores; `ids` restringe la
+        búsqueda a esos productos.
+        """
+        self._asegurar_cargado()
+        with self._lock:
+            grupos = self.grupos(consulta)
+            if not grupos or not self._vivos:
+                return []
+            tamano = self._tamano
+            n = self._vivos
+            promedio = self._longitud_total / n or 1.0
+            normalizacion = K1 * (1 - B + B * self._longitud[:tamano] / promedio)
+
+            scores = np.zeros(tamano, dtype=np.float64)
+            coincidencias = np.zeros(tamano, dtype=np.int32)
+            for grupo in grupos:
+                en_grupo = np.zeros(tamano, dtype=np.bool_)
+                for termino, peso in grupo.items():
+                    docs, frec = self._postings(termino)
+                    if not len(docs):
+                        continue
+                    df = len(docs)
+                    idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+                    scores[docs] += idf * peso * frec * (K1 + 1) / (frec + normalizacion[docs])
+                    en_grupo[docs] = True
+                coincidencias += en_grupo
+
+            candidatas = coincidencias == len(grupos)
+            if ids is not None:
+                candidatas &= np.isin(self._ids[:tamano], np.fromiter(ids, dtype=np.int64))
+            filas = np.flatnonzero(candidatas)
+            if limite is not None and len(filas) > limite:
+                filas = filas[top_k(scores[filas], limite)]
+            orden = np.lexsort((self._ids[filas], -scores[filas]))
+            filas = filas[orden]
+            return [(int(self._ids[f]), float(scores[f])) for f in filas]
+
+
+def ordenar_por_ranking(queryset, ranking):
+    """
+    Lista de las filas del queryset con los ids del ranking, en ese orden.
+    in_bulk las lee en lotes que respetan el límite de parámetros de la
+    base de datos; el orden se arma en Python, sin un CASE por fila.
+    """
+    ids = [pk for pk, _ in ranking]
+    filas = queryset.in_bulk(ids)
+    return [filas[pk] for pk in ids if pk in filas]
+
+
+# Índice compartido por todos los requests del worker
+indice_busqueda = IndiceBusqueda(
+    ttl=getattr(settings, 'SEARCH_INDEX_TTL', 300)
+)
@@ -0,0 +1,201 @@
+"""
+Búsqueda híbrida de productos: léxica (BM25) + semántica (embeddings).
+
+/api/productos/search/?q= combina dos rankings:
+
+- léxico: el índice invertido de productos.busqueda (palabras, raíces y
+  prefijos de la consulta);
+- semántico: similitud coseno entre el embedding de la consulta y los
+  embeddings de los productos, con el backend vectorial del worker
+  (productos.ann.get_vector_backend, exacto o IVF).
+
+y los fusiona con reciprocal-rank fusion (RRF):
+
+    score(p) = Σ 1 / (RRF_K + posición de p en cada ranking)
+
+que no necesita que los puntajes de BM25 y del coseno estén en la misma
+escala. Un producto que aparece arriba en los dos gana a uno que solo
+aparece en uno.
+
+El embedding de la consulta lo calcula el codificador configurado en
+SEARCH_QUERY_ENCODER (ruta a una clase con la interfaz de
+productos.embeddings; tiene que producir vectores del mismo espacio que
+los productos). Si no está configurado se usa EMBEDDING_PROVIDER, pero
+solo si es local (SentenceTransformerEmbeddingProvider, Hashing...): con
+uno remoto cada consulta nueva esperaría una llamada a la red, así que
+la búsqueda queda solo léxica y se avisa una vez por worker, en la
+primera búsqueda. Con el proveedor por defecto (OpenAI) la parte
+semántica se activa con
+SEARCH_QUERY_ENCODER = 'productos.embeddings.OpenAIEmbeddingProvider':
+un codificador remoto configurado a propósito se crea con
+SEARCH_QUERY_TIMEOUT segundos de espera y sin reintentos. Los embeddings de las consultas se guardan
+en un LRU por worker de SEARCH_QUERY_CACHE_SIZE entradas: las consultas
+repetidas no llaman al codificador.
+
+Si el codificador falla, la búsqueda sigue solo con el ranking léxico.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+from .ann import get_vector_backend
+from .busqueda import indice_busqueda
+from .embeddings import get_embedding_provider
+
+
+logger = logging.getLogger(__name__)
+
+RRF_K = 60
+# Candidatos que se piden a cada ranking antes de fusionar
+CANDIDATOS = 100
+
+
+class CacheLRU:
+    """Diccionario acotado que descarta lo usado hace más tiempo."""
+
+    def __init__(self, capacidad):
+        self.capacidad = capacidad
+        self.aciertos = 0
+        self.fallos = 0
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            valor = self._datos.get(clave)
+            if valor is None:
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def set(self, clave, valor):
+        if self.capacidad <= 0:
+            return
+        with self._lock:
+            self._datos[clave] = valor
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.capacidad:
+                self._datos.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self.aciertos = self.fallos = 0
+
+    def __len__(self):
+        return len(self._datos)
+
+
+embeddings_de_consultas = CacheLRU(getattr(settings, 'SEARCH_QUERY_CACHE_SIZE', 1024))
+
+_codificador = None
+_avisado_solo_lexica = False
+
+
+def get_query_encoder():
+    """
+    Codificador de consultas (por proceso): SEARCH_QUERY_ENCODER con
+    SEARCH_QUERY_ENCODER_OPTIONS, o el proveedor de embeddings de los
+    productos si no está configurado y es local. None si no hay ninguno.
+    """
+    global _codificador
+    ruta = getattr(settings, 'SEARCH_QUERY_ENCODER', '')
+    if not ruta:
+        proveedor = get_embedding_provider()
+        return proveedor if proveedor.local else None
+    opciones = getattr(settings, 'SEARCH_QUERY_ENCODER_OPTIONS', {})
+    timeout = getattr(settings, 'SEARCH_QUERY_TIMEOUT', 2.0)
+    clave = (ruta, tuple(sorted(opciones.items())), timeout)
+    if _codificador is None or _codificador[0] != clave:
+        clase = import_string(ruta)
+        if not clase.local:
+            opciones = {'timeout': timeout, 'max_retries': 0, **opciones}
+        _codificador = (clave, clase(**opciones))
+    return _codificador[1]
+
+
+def avisar_solo_lexica():
+    """Avisa, una vez por proceso, que la búsqueda no tiene codificador."""
+    global _avisado_solo_lexica
+    if _avisado_solo_lexica:
+        return
+    _avisado_solo_lexica = True
+    logger.warning(
+        'EMBEDDING_PROVIDER es remoto y no hay SEARCH_QUERY_ENCODER: '
+        '/api/productos/search/ usa solo el ranking léxico. Para la parte '
+        "semántica configura SEARCH_QUERY_ENCODER='%s' (el mismo modelo de "
+        'los productos)', settings.EMBEDDING_PROVIDER,
+    )
+
+
+def embedding_de_consulta(consulta):
+    """
+    Embedding (float32) de la consulta, del LRU o del codificador; None
+    si no hay codificador.
+    """
+    codificador = get_query_encoder()
+    if codificador is None:
+        return None
+    clave = (codificador.nombre, ' '.join(consulta.lower().split()))
+    vector = embeddings_de_consultas.get(clave)
+    if vector is None:
+        vector = np.asarray(codificador.embed([clave[1]])[0], dtype=np.float32)
+        vector.setflags(write=False)
+        embeddings_de_consultas.set(clave, vector)
+    return vector
+
+
+def fusionar(rankings, k=RRF_K):
+    """
+    Reciprocal-rank fusion de varios [(id, score)] ordenados. Retorna
+    [(id, score_rrf)] de mayor a menor (a igual score, por id).
+    """
+    puntajes = {}
+    for ranking in rankings:
+        for posicion, (pk, _) in enumerate(ranking, start=1):
+            puntajes[pk] = puntajes.get(pk, 0.0) + 1.0 / (k + posicion)
+    mejores = sorted(puntajes, key=lambda pk: (-puntajes[pk], pk))
+    return [(pk, puntajes[pk]) for pk in mejores]
+
+
+def ids_filtrados(filtros):
+    """Ids de los productos que cumplen los filtros, o None sin filtros."""
+    from .models import Producto
+
+    if not filtros:
+        return None
+    productos = Producto.objects.all()
+    if filtros.get('categoria') is not None:
+        productos = productos.filter(categoria_id=filtros['categoria'])
+    if filtros.get('en_stock'):
+        # Igual que la máscara del índice vectorial: lo reservado no cuenta
+        productos = productos.filter(stock__gt=F('reservado'))
+    return productos.values_list('pk', flat=True)
+
+
+def buscar_hibrido(consulta, top_n=20, filtros=None):
+    """
+    [(id, score_rrf)] de los top_n productos para la consulta. `filtros`
+    admite categoria y en_stock (ver vector_index.construir_mascara).
+    """
+    lexico = indice_busqueda.buscar(consulta, limite=CANDIDATOS, ids=ids_filtrados(filtros))
+    try:
+        vector = embedding_de_consulta(consulta)
+    except Exception:
+        logger.warning('No se pudo calcular el embedding de la consulta', exc_info=True)
+        vector = None
+    else:
+        if vector is None:
+            avisar_solo_lexica()
+    semantico = []
+    if vector is not None:
+        semantico = get_vector_backend().buscar(vector, top_n=CANDIDATOS, filtros=filtros)
+    return fusionar([lexico, semantico])[:top_n]
@@ -0,0 +1,256 @@
+"""
+Filtrado colaborativo por compras conjuntas (OrderItem agrupados por orden).
+
+La tabla CoCompra guarda, para cada par de productos, en cuántas órdenes
+pagadas aparecen juntos. Se actualiza de forma incremental cuando una
+orden pasa a pagada (señal en orders.models) y se puede reconstruir por
+completo con `python manage.py refresh_copurchases`, que arma la matriz
+de incidencia orden x producto y calcula X.T @ X como matriz dispersa.
+
+La tabla se carga en una matriz dispersa CSR normalizada (similitud
+coseno: c_ab / sqrt(n_a * n_b)) que se recarga pasado
+RECOMMENDATION_INDEX_TTL. La combinación con la similitud de embeddings
+(según RECOMMENDATION_COPURCHASE_WEIGHT) se hace al precalcular los
+vecinos (productos.vecinos), no en cada petición: refresh_copurchases
+recalcula los vecinos al terminar, y las órdenes pagadas después entran
+en el siguiente precálculo.
+"""
+
+import threading
+import time
+
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from scipy import sparse
+
+from .vector_index import top_k
+
+
+# Estados de orden cuyas compras cuentan
+ESTADOS_PAGADOS = ('paid', 'completed')
+
+LOTE_INSERCION = 5000
+
+
+def peso_co_compras():
+    """Peso de las compras conjuntas en el score híbrido (0 = desactivado)."""
+    return getattr(settings, 'RECOMMENDATION_COPURCHASE_WEIGHT', 0.3)
+
+
+def registrar_orden(order_id):
+    """
+    Suma una orden pagada a los conteos de sus pares de productos.
+    Es idempotente: una orden ya registrada no se vuelve a contar.
+    Retorna True si la orden se contabilizó.
+    """
+    from .models import CoCompra, CoCompraOrden
+
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    with transaction.atomic():
+        _, creada = CoCompraOrden.objects.get_or_create(order_id=order_id)
+        if not creada:
+            return False
+        productos = sorted(set(
+            OrderItem.objects.filter(order_id=order_id).values_list('producto_id', flat=True)
+        ))
+        # Primero se aseguran las filas y luego se incrementan con F(), así
+        # dos órdenes simultáneas con el mismo par no pierden conteos
+        CoCompra.objects.bulk_create(
+            [CoCompra(producto_id=a, otro_id=b) for a in productos for b in productos],
+            ignore_conflicts=True,
+        )
+        CoCompra.objects.filter(
+            producto_id__in=productos, otro_id__in=productos
+        ).update(ordenes=F('ordenes') + 1)
+    return True
+
+
+def matriz_de_conteos(ordenes, productos):
+    """
+    Conteos de co-ocurrencia a partir de pares (orden, producto) sin
+    repetir. Retorna (ids de producto, matriz dispersa COO de conteos).
+    """
+    ordenes = np.asarray(ordenes, dtype=np.int64)
+    productos = np.asarray(productos, dtype=np.int64)
+    if not len(ordenes):
+        return np.empty(0, dtype=np.int64), sparse.coo_matrix((0, 0), dtype=np.int64)
+    _, filas = np.unique(ordenes, return_inverse=True)
+    ids, columnas = np.unique(productos, return_inverse=True)
+    incidencia = sparse.csr_matrix(
+        (np.ones(len(filas), dtype=np.int64), (filas, columnas)),
+        shape=(filas.max() + 1, len(ids)),
+    )
+    return ids, (incidencia.T @ incidencia).tocoo()
+
+
+def reconstruir_todo():
+    """
+    Recalcula CoCompra desde cero con todas las órdenes pagadas.
+    Retorna (órdenes, pares guardados).
+    """
+    from .models import CoCompra, CoCompraOrden
+
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    filas = list(
+        OrderItem.objects.filter(order__status__in=ESTADOS_PAGADOS)
+        .values_list('order_id', 'producto_id').distinct().order_by()
+        .iterator(chunk_size=20000)
+    )
+    ordenes, productos = zip(*filas) if filas else ((), ())
+    ids, conteos = matriz_de_conteos(ordenes, productos)
+    registradas = sorted(set(ordenes))
+
+    with transaction.atomic():
+        CoCompra.objects.all().delete()
+        CoCompraOrden.objects.all().delete()
+        pendientes = []
+        for a, b, n in zip(conteos.row, conteos.col, conteos.data):
+            pendientes.append(CoCompra(producto_id=int(ids[a]), otro_id=int(ids[b]), ordenes=int(n)))
+            if len(pendientes) >= LOTE_INSERCION:
+                CoCompra.objects.bulk_create(pendientes)
+                pendientes = []
+        CoCompra.objects.bulk_create(pendientes)
+        CoCompraOrden.objects.bulk_create(
+            [CoCompraOrden(order_id=pk) for pk in registradas], batch_size=LOTE_INSERCION
+        )
+    return len(registradas), conteos.nnz
+
+
+class MatrizCoCompras:
+    """
+    Similitud por compras conjuntas en una matriz CSR, con el mapeo id de
+    producto -> fila. Solo se guardan los pares con al menos una compra,
+    así que ocupa O(pares) y no O(productos²). Las reconstrucciones van
+    por su propio lock (_reconstruccion), que no bloquea las consultas.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._reconstruccion = threading.Lock()
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._ids = np.empty(0, dtype=np.int64)
+        self._posiciones = {}
+        self._matriz = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self._cargado = False
+        self._cargado_en = 0.0
+
+    def cargar(self, filas):
+        """Reemplaza el contenido con ternas (producto, otro, ordenes)."""
+        filas = list(filas)
+        productos, otros, ordenes = (
+            (np.asarray(c) for c in zip(*filas)) if filas else (np.empty(0),) * 3
+        )
+        ids = np.unique(np.concatenate([productos, otros]).astype(np.int64))
+        a = np.searchsorted(ids, productos)
+        b = np.searchsorted(ids, otros)
+        conteos = sparse.csr_matrix(
+            (np.asarray(ordenes, dtype=np.float32), (a, b)), shape=(len(ids), len(ids))
+        )
+        # Similitud coseno sobre los vectores de órdenes de cada producto
+        diagonal = conteos.diagonal()
+        normas = np.sqrt(np.where(diagonal > 0, diagonal, 1)).astype(np.float32)
+        inversas = sparse.diags(1 / normas)
+        matriz = (inversas @ conteos @ inversas).tocsr()
+        matriz.setdiag(0)
+        matriz.eliminate_zeros()
+
+        with self._lock:
+            self._ids = ids
+            self._posiciones = {int(pk): i for i, pk in enumerate(ids)}
+            self._matriz = matriz
+            self._cargado = True
+            self._cargado_en = time.monotonic()
+
+    def reconstruir(self):
+        """Carga la tabla CoCompra desde la base de datos."""
+        from .models import CoCompra
+
+        self.cargar(
+            CoCompra.objects.values_list('producto_id', 'otro_id', 'ordenes')
+            .iterator(chunk_size=20000)
+        )
+
+    def invalidar(self):
+        """Descarta el contenido; se recargará en la próxima consulta."""
+        with self._lock:
+            self._reiniciar()
+
+    def _vigente(self):
+        with self._lock:
+            expirado = (
+                self.ttl is not None
+                and time.monotonic() - self._cargado_en > self.ttl
+            )
+            return self._cargado and not expirado
+
+    def _asegurar_cargado(self):
+        if self._vigente():
+            return
+        # Igual que productos.busqueda.IndiceBusqueda: un solo thread
+        # reconstruye, los demás siguen con la matriz vencida; solo la
+        # primera carga hace esperar
+        if not self._reconstruccion.acquire(blocking=not self._cargado):
+            return
+        try:
+            if not self._vigente():
+                self.reconstruir()
+        finally:
+            self._reconstruccion.release()
+
+    def _fila(self, pk):
+        """(ids, scores) de los productos comprados junto con pk."""
+        self._asegurar_cargado()
+        with self._lock:
+            posicion = self._posiciones.get(pk)
+            if posicion is None:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            inicio, fin = self._matriz.indptr[posicion], self._matriz.indptr[posicion + 1]
+            return (
+                self._ids[self._matriz.indices[inicio:fin]],
+                self._matriz.data[inicio:fin].copy(),
+            )
+
+    def __contains__(self, pk):
+        return len(self._fila(pk)[0]) > 0
+
+    def alineada(self, ids):
+        """
+        Similitudes entre los productos `ids` como CSR de
+        len(ids) x len(ids), en ese orden (filas y columnas de otro índice).
+        Los productos sin compras quedan en cero.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        self._asegurar_cargado()
+        with self._lock:
+            propios, matriz = self._ids, self._matriz.tocoo()
+        # Fila en `ids` de cada producto de la matriz, o -1
+        orden = np.argsort(ids, kind='stable')
+        posiciones = np.searchsorted(ids[orden], propios)
+        posiciones = np.minimum(posiciones, max(len(ids) - 1, 0))
+        destino = np.full(len(propios), -1, dtype=np.int64)
+        if len(ids):
+            encontrados = ids[orden][posiciones] == propios
+            destino[encontrados] = orden[posiciones[encontrados]]
+        filas, columnas = destino[matriz.row], destino[matriz.col]
+        validas = (filas >= 0) & (columnas >= 0)
+        return sparse.csr_matrix(
+            (matriz.data[validas], (filas[validas], columnas[validas])),
+            shape=(len(ids), len(ids)), dtype=np.float32,
+        )
+
+    def similares(self, pk, top_n=4):
+        """[(id, score), ...] de los productos más comprados junto con pk."""
+        ids, scores = self._fila(pk)
+        return [(int(ids[i]), float(scores[i])) for i in top_k(scores, top_n)]
+
+
+# Matriz compartida por el proceso
+matriz_co_compras = MatrizCoCompras(
+    ttl=getattr(settings, 'RECOMMENDATION_INDEX_TTL', 300)
+)
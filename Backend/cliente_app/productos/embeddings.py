@@ -0,0 +1,168 @@
+"""
+Proveedores de embeddings para los productos.
+
+El proveedor se elige con el setting EMBEDDING_PROVIDER (ruta a la clase)
+y EMBEDDING_PROVIDER_OPTIONS (kwargs del constructor). Todos exponen:
+
+    proveedor.nombre            -> identificador estable del modelo
+    proveedor.embed(textos)     -> ndarray float32 (len(textos), dimension)
+    proveedor.local             -> False si llama a un servicio remoto
+
+Los remotos aceptan además timeout (segundos) y max_retries.
+
+HashingEmbeddingProvider es un sustituto local y determinista (no usa red),
+útil para pruebas y desarrollo sin clave de OpenAI.
+SentenceTransformerEmbeddingProvider corre un modelo local de
+sentence-transformers (dependencia opcional: pip install
+sentence-transformers); sirve también para codificar las consultas de
+búsqueda sin salir a la red (productos.busqueda_hibrida).
+"""
+
+import hashlib
+import re
+
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class OpenAIEmbeddingProvider:
+    """Embeddings remotos con la API de OpenAI (varios textos por request)."""
+
+    local = False
+
+    def __init__(self, model='text-embedding-3-small', api_key=None, timeout=30.0, max_retries=2):
+        self.model = model
+        self.api_key = api_key or getattr(settings, 'OPENAI_API_KEY', None)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._client = None
+
+    @property
+    def nombre(self):
+        return f'openai:{self.model}'
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(
+                api_key=self.api_key, timeout=self.timeout, max_retries=self.max_retries
+            )
+        return self._client
+
+    def embed(self, textos):
+        response = self.client.embeddings.create(input=list(textos), model=self.model)
+        datos = sorted(response.data, key=lambda d: d.index)
+        return np.asarray([d.embedding for d in datos], dtype=np.float32)
+
+
+class SentenceTransformerEmbeddingProvider:
+    """Embeddings locales con un modelo de sentence-transformers."""
+
+    local = True
+
+    def __init__(self, model='paraphrase-multilingual-MiniLM-L12-v2', device=None):
+        self.model = model
+        self.device = device
+        self._encoder = None
+
+    @property
+    def nombre(self):
+        return f'sentence-transformers:{self.model}'
+
+    @property
+    def encoder(self):
+        if self._encoder is None:
+            from sentence_transformers import SentenceTransformer
+            self._encoder = SentenceTransformer(self.model, device=self.device)
+        return self._encoder
+
+    def embed(self, textos):
+        return np.asarray(
+            self.encoder.encode(list(textos), normalize_embeddings=True), dtype=np.float32
+        )
+
+
+class HashingEmbeddingProvider:
+    """
+    Vectorizador por hashing (palabras y trigramas de caracteres) con signo.
+    Es determinista entre procesos: usa blake2b en lugar de hash().
+    """
+
+    local = True
+
+    def __init__(self, dimension=256):
+        self.dimension = dimension
+
+    @property
+    def nombre(self):
+        return f'hashing:{self.dimension}'
+
+    def _caracteristicas(self, texto):
+        palabras = TOKEN_RE.findall(texto.lower())
+        for palabra in palabras:
+            yield palabra
+            marcada = f'#{palabra}#'
+            for i in range(len(marcada) - 2):
+                yield marcada[i:i + 3]
+
+    def _vector(self, texto):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for caracteristica in self._caracteristicas(texto):
+            digest = hashlib.blake2b(caracteristica.encode('utf-8'), digest_size=8).digest()
+            valor = int.from_bytes(digest, 'little')
+            signo = 1.0 if valor & 1 else -1.0
+            vector[(valor >> 1) % self.dimension] += signo
+        norma = np.linalg.norm(vector)
+        return vector / norma if norma else vector
+
+    def embed(self, textos):
+        if not textos:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        return np.vstack([self._vector(texto) for texto in textos])
+
+
+_proveedor = None
+
+
+def get_embedding_provider():
+    """Retorna la instancia (por proceso) del proveedor configurado."""
+    global _proveedor
+    ruta = getattr(settings, 'EMBEDDING_PROVIDER', 'productos.embeddings.OpenAIEmbeddingProvider')
+    opciones = getattr(settings, 'EMBEDDING_PROVIDER_OPTIONS', {})
+    clave = (ruta, tuple(sorted(opciones.items())))
+    if _proveedor is None or _proveedor[0] != clave:
+        _proveedor = (clave, import_string(ruta)(**opciones))
+    return _proveedor[1]
+
+
+def texto_para_embedding(producto):
+    """Texto que se envía al modelo de embeddings para un producto."""
+    return f'{producto.nombre} {producto.descripcion}'.strip()
+
+
+def hash_texto(texto, proveedor):
+    """
+    Hash del contenido embebido. Incluye el nombre del proveedor para que
+    cambiar de modelo marque todos los embeddings como desactualizados.
+    """
+    contenido = f'{proveedor.nombre}\n{texto}'.encode('utf-8')
+    return hashlib.sha256(contenido).hexdigest()
+
+
+def asignar_embeddings(productos, proveedor=None):
+    """
+    Calcula los embeddings de varios productos con una sola llamada al
+    proveedor y los asigna en las instancias (no guarda).
+    """
+    proveedor = proveedor or get_embedding_provider()
+    textos = [texto_para_embedding(producto) for producto in productos]
+    vectores = proveedor.embed(textos)
+    for producto, texto, vector in zip(productos, textos, vectores):
+        producto.embedding = vector
+        producto.embedding_hash = hash_texto(texto, proveedor)
+    return productos
@@ -0,0 +1,46 @@
+"""
+Campos de modelo propios de la app de productos.
+"""
+
+import base64
+
+import numpy as np
+from django.db import models
+
+
+class EmbeddingField(models.BinaryField):
+    """
+    Guarda un vector de embedding como bytes float32 (little-endian).
+
+    Al leer desde la base de datos se decodifica con np.frombuffer, sin
+    copiar ni parsear JSON: el valor en Python es un ndarray de solo lectura.
+    Acepta listas, ndarrays o bytes al asignar.
+    """
+
+    dtype = np.dtype('<f4')
+    description = 'Vector float32 almacenado como bytes'
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return np.frombuffer(value, dtype=self.dtype)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, np.ndarray):
+            return value
+        if isinstance(value, str):
+            value = base64.b64decode(value.encode('ascii'))
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return np.frombuffer(value, dtype=self.dtype)
+        return np.asarray(value, dtype=self.dtype)
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, (bytes, bytearray, memoryview)):
+            return value
+        return np.asarray(value, dtype=self.dtype).tobytes()
+
+    def value_to_string(self, obj):
+        value = self.get_prep_value(self.value_from_object(obj))
+        if value is None:
+            return None
+        return base64.b64encode(bytes(value)).decode('ascii')
@@ -0,0 +1,43 @@
+from django.conf import settings
+from rest_framework.filters import BaseFilterBackend
+
+from .busqueda import indice_busqueda, ordenar_por_ranking
+
+
+class BusquedaFilter(BaseFilterBackend):
+    """
+    ?search=: búsqueda de texto con el índice invertido y BM25 del worker
+    (productos.busqueda). Devuelve los SEARCH_MAX_RESULTS productos más
+    relevantes, en orden de relevancia, dentro de lo que dejaron los
+    filtros anteriores (categoria, precio). El listado no se pagina: el
+    límite acota la respuesta.
+
+    En list retorna una lista de filas ya ordenada (ver
+    ordenar_por_ranking), por eso debe ser el último backend de filtros.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        consulta = request.query_params.get(self.search_param, '')
+        if not consulta.strip():
+            return queryset
+        ids = None
+        if queryset.query.where:
+            ids = queryset.values_list('pk', flat=True)
+        ranking = indice_busqueda.buscar(consulta, limite=settings.SEARCH_MAX_RESULTS, ids=ids)
+        if getattr(view, 'action', None) != 'list':
+            # get_object necesita un queryset
+            return queryset.filter(pk__in=[pk for pk, _ in ranking])
+        return ordenar_por_ranking(queryset, ranking)
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': (
+                'Búsqueda de texto en nombre y descripción, por relevancia '
+                f'(como máximo {settings.SEARCH_MAX_RESULTS} productos)'
+            ),
+            'schema': {'type': 'string'},
+        }]
@@ -0,0 +1,136 @@
+"""
+Cola de regeneración de embeddings basada en la tabla EmbeddingJob.
+
+Los requests (admin, API) solo encolan cuando cambia el hash del texto
+embebido; el worker `python manage.py process_embedding_jobs` toma los
+trabajos vencidos, llama al proveedor en un pool de threads y guarda los
+resultados en lote.
+"""
+
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .embeddings import (
+    asignar_embeddings,
+    get_embedding_provider,
+    hash_texto,
+    texto_para_embedding,
+)
+from .vector_index import embedding_index
+
+
+# Tiempo tras el cual un trabajo tomado por un worker caído vuelve a la cola
+LEASE = timedelta(minutes=5)
+
+
+def retraso_coalescencia():
+    """Espera desde la última edición antes de procesar un trabajo."""
+    return timedelta(seconds=getattr(settings, 'EMBEDDING_REFRESH_DELAY', 10))
+
+
+def encolar_si_cambio(producto, proveedor=None):
+    """
+    Encola el producto si su texto ya no corresponde a embedding_hash.
+    Retorna True si se encoló.
+    """
+    proveedor = proveedor or get_embedding_provider()
+    if hash_texto(texto_para_embedding(producto), proveedor) == producto.embedding_hash:
+        return False
+    encolar(producto.pk)
+    return True
+
+
+def encolar(producto_id):
+    """
+    Crea o reutiliza el trabajo del producto. Si ya existía, se incrementa
+    su versión y se pospone, de modo que varias ediciones seguidas se
+    procesan una sola vez.
+    """
+    from .models import EmbeddingJob
+
+    disponible_en = timezone.now() + retraso_coalescencia()
+    cambios = {
+        'version': F('version') + 1,
+        'disponible_en': disponible_en,
+        'tomado_en': None,
+    }
+    if EmbeddingJob.objects.filter(producto_id=producto_id).update(**cambios):
+        return
+    try:
+        with transaction.atomic():
+            EmbeddingJob.objects.create(producto_id=producto_id, disponible_en=disponible_en)
+    except IntegrityError:
+        # Otro request creó el trabajo en paralelo
+        EmbeddingJob.objects.filter(producto_id=producto_id).update(**cambios)
+
+
+def tomar_trabajos(limite):
+    """
+    Marca como tomados hasta `limite` trabajos vencidos y los retorna
+    con su producto cargado (sin el embedding).
+    """
+    from .models import EmbeddingJob
+
+    ahora = timezone.now()
+    with transaction.atomic():
+        trabajos = list(
+            EmbeddingJob.objects
+            .select_for_update(skip_locked=True, of=('self',))
+            .select_related('producto')
+            .defer('producto__embedding')
+            .filter(disponible_en__lte=ahora)
+            .filter(Q(tomado_en__isnull=True) | Q(tomado_en__lt=ahora - LEASE))
+            .order_by('disponible_en')[:limite]
+        )
+        EmbeddingJob.objects.filter(pk__in=[t.pk for t in trabajos]).update(tomado_en=ahora)
+    return trabajos
+
+
+def embeber_lote(trabajos, proveedor=None):
+    """Llama al proveedor para un lote (no toca la base de datos)."""
+    return asignar_embeddings([t.producto for t in trabajos], proveedor)
+
+
+def completar_lote(trabajos):
+    """
+    Guarda los embeddings del lote y elimina los trabajos, salvo los que
+    fueron re-encolados (otra versión) mientras se procesaban. Luego
+    actualiza el índice del worker y las recomendaciones precalculadas
+    de los productos afectados.
+    """
+    from .models import EmbeddingJob, Producto
+    from .vecinos import recomputar_incremental
+
+    if not trabajos:
+        return
+    productos = [t.producto for t in trabajos]
+    with transaction.atomic():
+        Producto.objects.bulk_update(productos, ['embedding', 'embedding_hash'])
+        misma_version = reduce(or_, (Q(pk=t.pk, version=t.version) for t in trabajos))
+        EmbeddingJob.objects.filter(misma_version).delete()
+
+    # bulk_update no dispara señales: se actualiza el índice explícitamente
+    for producto in productos:
+        embedding_index.actualizar(producto.pk, producto.embedding)
+    recomputar_incremental([producto.pk for producto in productos])
+
+
+def fallar_lote(trabajos, error):
+    """Devuelve los trabajos a la cola con backoff exponencial."""
+    from .models import EmbeddingJob
+
+    ahora = timezone.now()
+    for trabajo in trabajos:
+        espera = timedelta(seconds=min(3600, 10 * 2 ** trabajo.intentos))
+        EmbeddingJob.objects.filter(pk=trabajo.pk, version=trabajo.version).update(
+            intentos=F('intentos') + 1,
+            ultimo_error=str(error)[:1000],
+            tomado_en=None,
+            disponible_en=ahora + espera,
+        )
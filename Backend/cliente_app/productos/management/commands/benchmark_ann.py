@@ -0,0 +1,89 @@
+"""
+Management command para comparar el índice ANN (IVF) con la búsqueda exacta.
+
+Genera un catálogo sintético con estructura de clusters (como los
+embeddings reales), publica un índice IVF en un directorio temporal, lo
+abre con memory-map y reporta recall@k y latencia p50/p99 para cada nprobe.
+No toca la base de datos.
+
+Uso:
+    python manage.py benchmark_ann --size 100000 --dim 256 --nprobe 1,4,8,16,32
+"""
+
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from productos.ann import IVFBackend, IVFIndex
+from productos.vector_index import EmbeddingIndex
+
+
+def percentiles_ms(tiempos):
+    tiempos_ms = np.asarray(tiempos) * 1000
+    return np.percentile(tiempos_ms, 50), np.percentile(tiempos_ms, 99)
+
+
+class Command(BaseCommand):
+    help = 'Mide recall@k y latencia del índice IVF frente a la búsqueda exacta'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=100000)
+        parser.add_argument('--dim', type=int, default=256)
+        parser.add_argument('--clusters', type=int, default=500,
+                            help='Clusters del catálogo sintético')
+        parser.add_argument('--ruido', type=float, default=1.5,
+                            help='Dispersión dentro de cada cluster (más = más difícil)')
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--nprobe', default='1,4,8,16,32')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        size, dim, k = options['size'], options['dim'], options['k']
+        centros = rng.standard_normal((options['clusters'], dim))
+        matriz = (
+            centros[rng.integers(0, options['clusters'], size)]
+            + options['ruido'] * rng.standard_normal((size, dim))
+        ).astype(np.float32)
+        ids = np.arange(1, size + 1)
+        consultas = rng.choice(ids, options['queries'], replace=False)
+
+        exacto = EmbeddingIndex()
+        exacto.cargar(zip(ids, matriz))
+        esperados = {}
+        tiempos = []
+        for pk in consultas:
+            inicio = time.perf_counter()
+            esperados[pk] = {i for i, _ in exacto.similares(int(pk), top_n=k)}
+            tiempos.append(time.perf_counter() - inicio)
+        e50, e99 = percentiles_ms(tiempos)
+
+        inicio = time.perf_counter()
+        ivf = IVFIndex.entrenar(ids, matriz)
+        entrenamiento = time.perf_counter() - inicio
+
+        with tempfile.TemporaryDirectory() as ruta:
+            ivf.publicar(ruta)
+            self.stdout.write(
+                f'{size} productos, dim {dim}, {ivf.centroides.shape[0]} listas '
+                f'(entrenamiento {entrenamiento:.1f}s)'
+            )
+            self.stdout.write(f"{'nprobe':>8} {'recall@' + str(k):>10} {'p50':>9} {'p99':>9}")
+            self.stdout.write(f"{'exacto':>8} {1.0:>10.3f} {e50:>7.2f}ms {e99:>7.2f}ms")
+
+            for nprobe in [int(n) for n in options['nprobe'].split(',') if n]:
+                backend = IVFBackend(ruta, nprobe=nprobe)
+                backend.cargar()
+                aciertos = 0
+                tiempos = []
+                for pk in consultas:
+                    inicio = time.perf_counter()
+                    obtenidos = {i for i, _ in backend.similares(int(pk), top_n=k)}
+                    tiempos.append(time.perf_counter() - inicio)
+                    aciertos += len(obtenidos & esperados[pk])
+                p50, p99 = percentiles_ms(tiempos)
+                recall = aciertos / (k * len(consultas))
+                self.stdout.write(f'{nprobe:>8} {recall:>10.3f} {p50:>7.2f}ms {p99:>7.2f}ms')
@@ -0,0 +1,125 @@
+"""
+Management command para medir tamaño de respuesta y tiempo de
+serialización de los endpoints del catálogo.
+
+Crea un catálogo sintético dentro de una transacción que se revierte al
+terminar, así que no deja datos en la base de datos. Por defecto mide
+con el cache del catálogo (cliente_app.response_cache): la primera
+repetición genera la respuesta y las demás la leen del cache. Con
+--sin-cache todas la generan.
+
+Después simula una navegación repetida (--repeticiones cargas de cada
+endpoint sin cambios en el catálogo) con y sin If-None-Match, y compara
+los bytes transferidos y el tiempo de CPU del servidor.
+
+Uso:
+    python manage.py benchmark_catalog --productos 200
+    python manage.py benchmark_catalog --url "/api/productos/?fields=id,nombre"
+    python manage.py benchmark_catalog --sin-cache
+"""
+
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+
+from cliente_app.response_cache import invalidar_catalogo
+from categorias.models import Categoria
+from productos.models import Producto
+
+
+URLS_POR_DEFECTO = [
+    '/api/productos/',
+    '/api/productos/?fields=id,nombre,precio',
+    '/api/categorias/',
+]
+
+
+class Rollback(Exception):
+    """Se lanza para revertir los datos sintéticos."""
+
+
+class Command(BaseCommand):
+    help = 'Mide tamaño y tiempo de respuesta de los endpoints del catálogo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=200)
+        parser.add_argument('--categorias', type=int, default=10)
+        parser.add_argument('--dim', type=int, default=1536,
+                            help='Dimensión de los embeddings sintéticos')
+        parser.add_argument('--repeticiones', type=int, default=10)
+        parser.add_argument('--url', action='append', dest='urls',
+                            help='Endpoint a medir (se puede repetir)')
+        parser.add_argument('--sin-cache', action='store_true',
+                            help='Medir sin el cache del catálogo')
+
+    def handle(self, *args, **options):
+        ajustes = {'CATALOG_CACHE_TTL': 0} if options['sin_cache'] else {}
+        try:
+            with transaction.atomic(), override_settings(**ajustes):
+                self.crear_catalogo(options)
+                urls = options['urls'] or URLS_POR_DEFECTO
+                self.medir(urls, options['repeticiones'])
+                self.medir_navegacion(urls, options['repeticiones'])
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            # Las respuestas guardadas son del catálogo sintético
+            invalidar_catalogo()
+
+    def crear_catalogo(self, options):
+        rng = np.random.default_rng(0)
+        categorias = Categoria.objects.bulk_create([
+            Categoria(nombre=f'Categoría {i}') for i in range(options['categorias'])
+        ])
+        Producto.objects.bulk_create([
+            Producto(
+                nombre=f'Producto {i}',
+                descripcion='Descripción de prueba ' * 5,
+                precio=10 + i % 50,
+                categoria=categorias[i % len(categorias)],
+                stock=i % 7,
+                embedding=rng.standard_normal(options['dim']).astype(np.float32),
+            )
+            for i in range(options['productos'])
+        ], batch_size=500)
+        # bulk_create no envía señales
+        invalidar_catalogo()
+
+    def medir(self, urls, repeticiones):
+        client = Client(SERVER_NAME='localhost')
+        self.stdout.write(f"{'bytes':>10} {'p50':>9} {'p99':>9}  url")
+        for url in urls:
+            tiempos = []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                response = client.get(url)
+                tiempos.append(time.perf_counter() - inicio)
+            tiempos_ms = np.asarray(tiempos) * 1000
+            self.stdout.write(
+                f'{len(response.content):>10} '
+                f'{np.percentile(tiempos_ms, 50):>7.2f}ms '
+                f'{np.percentile(tiempos_ms, 99):>7.2f}ms  {url}'
+            )
+
+    def medir_navegacion(self, urls, repeticiones):
+        client = Client(SERVER_NAME='localhost')
+        self.stdout.write('')
+        self.stdout.write(f"{'modo':<12} {'bytes':>10} {'cpu':>9} {'304':>5}  url")
+        for url in urls:
+            for modo in ('completo', 'condicional'):
+                etag, transferidos, no_modificadas = None, 0, 0
+                inicio = time.process_time()
+                for _ in range(repeticiones):
+                    cabeceras = {'HTTP_IF_NONE_MATCH': etag} if etag and modo == 'condicional' else {}
+                    response = client.get(url, **cabeceras)
+                    transferidos += len(response.content)
+                    no_modificadas += response.status_code == 304
+                    etag = response.get('ETag', etag)
+                cpu_ms = (time.process_time() - inicio) * 1000
+                self.stdout.write(
+                    f'{modo:<12} {transferidos:>10} {cpu_ms:>7.2f}ms {no_modificadas:>5}  {url}'
+                )
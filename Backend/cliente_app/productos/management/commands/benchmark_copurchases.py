@@ -0,0 +1,107 @@
+"""
+Management command para medir la construcción de la matriz de compras
+conjuntas según el volumen de órdenes.
+
+Para cada volumen crea órdenes pagadas sintéticas (con popularidad de
+productos tipo Zipf, como un catálogo real) dentro de una transacción que
+se revierte al terminar, y mide:
+  - reconstrucción completa (lectura de OrderItem, X.T @ X y escritura)
+  - carga de la matriz CSR en memoria de un worker
+  - registro incremental de una orden nueva (promedio)
+
+Uso:
+    python manage.py benchmark_copurchases --ordenes 1000,10000,50000
+"""
+
+import time
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from categorias.models import Categoria
+from orders.models import Order, OrderItem
+from productos.compras_conjuntas import MatrizCoCompras, reconstruir_todo, registrar_orden
+from productos.models import Producto
+
+
+class Rollback(Exception):
+    """Se lanza para revertir los datos sintéticos."""
+
+
+class Command(BaseCommand):
+    help = 'Mide el tiempo de construcción de las compras conjuntas según el volumen de órdenes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ordenes', default='1000,10000,50000',
+                            help='Volúmenes de órdenes separados por coma')
+        parser.add_argument('--productos', type=int, default=2000)
+        parser.add_argument('--items', type=float, default=3.0,
+                            help='Productos distintos promedio por orden')
+        parser.add_argument('--incrementales', type=int, default=200,
+                            help='Órdenes nuevas para medir el registro incremental')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'órdenes':>9} {'items':>9} {'pares':>10} "
+            f"{'completo':>10} {'carga':>9} {'incremental':>12}"
+        )
+        for volumen in (int(v) for v in options['ordenes'].split(',') if v):
+            try:
+                with transaction.atomic():
+                    self.medir(volumen, options)
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def crear_ordenes(self, rng, usuario, productos, cantidad, items):
+        """Órdenes pagadas con productos elegidos con popularidad Zipf."""
+        ordenes = Order.objects.bulk_create([
+            Order(user=usuario, total_amount=0, status='paid', billing_name='Bench',
+                  billing_email='bench@example.com', billing_phone='', billing_address='',
+                  billing_city='')
+            for _ in range(cantidad)
+        ], batch_size=2000)
+        pesos = 1 / np.arange(1, len(productos) + 1)
+        pesos /= pesos.sum()
+        nuevos = []
+        for orden in ordenes:
+            k = min(len(productos), 1 + rng.poisson(items - 1))
+            for i in rng.choice(len(productos), k, replace=False, p=pesos):
+                nuevos.append(OrderItem(order=orden, producto_id=productos[i], cantidad=1,
+                                        precio_unitario=1, subtotal=1))
+        OrderItem.objects.bulk_create(nuevos, batch_size=5000)
+        return ordenes, len(nuevos)
+
+    def medir(self, volumen, options):
+        rng = np.random.default_rng(options['seed'])
+        usuario = User.objects.create(username='benchmark_copurchases')
+        categoria = Categoria.objects.create(nombre='Benchmark')
+        productos = [p.pk for p in Producto.objects.bulk_create([
+            Producto(nombre=f'Producto {i}', precio=1, categoria=categoria)
+            for i in range(options['productos'])
+        ], batch_size=2000)]
+        _, items = self.crear_ordenes(rng, usuario, productos, volumen, options['items'])
+
+        inicio = time.perf_counter()
+        _, pares = reconstruir_todo()
+        completo = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        MatrizCoCompras().reconstruir()
+        carga = time.perf_counter() - inicio
+
+        nuevas, _ = self.crear_ordenes(
+            rng, usuario, productos, options['incrementales'], options['items']
+        )
+        inicio = time.perf_counter()
+        for orden in nuevas:
+            registrar_orden(orden.pk)
+        incremental = (time.perf_counter() - inicio) / max(1, len(nuevas))
+
+        self.stdout.write(
+            f'{volumen:>9} {items:>9} {pares:>10} {completo * 1000:>8.0f}ms '
+            f'{carga * 1000:>7.0f}ms {incremental * 1000:>10.2f}ms'
+        )
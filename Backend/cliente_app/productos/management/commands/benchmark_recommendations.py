@@ -0,0 +1,77 @@
+"""
+Management command para medir la latencia de las recomendaciones.
+
+Compara el camino anterior (matriz nueva + cosine_similarity + argsort
+completo en cada request) con el índice vectorial en memoria
+(matriz float32 normalizada + argpartition) sobre catálogos sintéticos.
+No toca la base de datos.
+
+Uso:
+    python manage.py benchmark_recommendations --sizes 1000,5000,20000
+"""
+
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from sklearn.metrics.pairwise import cosine_similarity
+
+from productos.vector_index import EmbeddingIndex
+
+
+def percentiles(tiempos):
+    """Retorna (p50, p99) en milisegundos."""
+    tiempos_ms = np.asarray(tiempos) * 1000
+    return np.percentile(tiempos_ms, 50), np.percentile(tiempos_ms, 99)
+
+
+class Command(BaseCommand):
+    help = 'Mide p50/p99 de las recomendaciones según el tamaño del catálogo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,5000,20000',
+                            help='Tamaños de catálogo separados por coma')
+        parser.add_argument('--dim', type=int, default=1536,
+                            help='Dimensión de los embeddings')
+        parser.add_argument('--queries', type=int, default=100,
+                            help='Consultas por tamaño')
+        parser.add_argument('--top-n', type=int, default=4)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        top_n = options['top_n']
+        sizes = [int(s) for s in options['sizes'].split(',') if s]
+
+        self.stdout.write(
+            f"{'productos':>10} {'anterior p50':>13} {'anterior p99':>13} "
+            f"{'índice p50':>11} {'índice p99':>11}"
+        )
+
+        for size in sizes:
+            embeddings = rng.standard_normal((size, options['dim']))
+            consultas = rng.integers(0, size, options['queries'])
+
+            # Camino anterior: se recalcula todo en cada request
+            tiempos_anterior = []
+            for i in consultas:
+                inicio = time.perf_counter()
+                matriz = np.array(embeddings)
+                similitudes = cosine_similarity(matriz[i].reshape(1, -1), matriz)
+                np.argsort(similitudes[0])[::-1][:top_n + 1]
+                tiempos_anterior.append(time.perf_counter() - inicio)
+
+            # Índice en memoria: se construye una vez por worker
+            index = EmbeddingIndex()
+            index.cargar(zip(range(size), embeddings))
+            tiempos_indice = []
+            for i in consultas:
+                inicio = time.perf_counter()
+                index.similares(int(i), top_n=top_n)
+                tiempos_indice.append(time.perf_counter() - inicio)
+
+            a50, a99 = percentiles(tiempos_anterior)
+            i50, i99 = percentiles(tiempos_indice)
+            self.stdout.write(
+                f'{size:>10} {a50:>11.2f}ms {a99:>11.2f}ms {i50:>9.2f}ms {i99:>9.2f}ms'
+            )
@@ -0,0 +1,152 @@
+"""
+Management command para medir la búsqueda de texto de productos.
+
+Compara el SearchFilter anterior (icontains sobre nombre y descripción
+por cada palabra) con el índice invertido en memoria y BM25 de
+productos.busqueda sobre un catálogo sintético, y mide las sugerencias
+del buscador (productos.sugerencias). El catálogo se crea dentro de una
+transacción que se revierte al terminar.
+
+Uso:
+    python manage.py benchmark_search --productos 100000
+    python manage.py benchmark_search --productos 20000 --repeticiones 50
+"""
+
+import time
+from functools import reduce
+from operator import and_
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from categorias.models import Categoria
+from productos.busqueda import IndiceBusqueda
+from productos.models import Producto
+from productos.sugerencias import IndiceSugerencias
+
+
+VOCABULARIO = (
+    'torta pastel galleta pan panecillo croissant empanada alfajor brownie '
+    'chocolate vainilla fresa frambuesa limón naranja piña maracuyá coco '
+    'almendra nuez avellana canela miel caramelo dulce leche crema queso '
+    'mantequilla harina integral avena centeno semillas sésamo chía azúcar '
+    'artesanal casero clásico especial tradicional relleno horneado fresco '
+    'suave esponjoso crujiente tostado glaseado bañado cubierto pequeño '
+    'grande familiar porción rebanada unidad caja docena sin gluten vegano'
+).split()
+
+CONSULTAS = [
+    'chocolate',
+    'tortas de chocolate',
+    'piña',
+    'pina coco',
+    'choc',
+    'torta fre',
+    'galletas avena miel',
+    'maracuya',
+]
+
+# Lo que se escribe letra a letra en el buscador
+PREFIJOS = ['t', 'to', 'tor', 'torta', 'torta ch', 'p', 'pi', 'pin', 'mara']
+
+
+class Rollback(Exception):
+    """Se lanza para revertir los datos sintéticos."""
+
+
+def percentiles(tiempos):
+    """Retorna (p50, p99) en milisegundos."""
+    tiempos_ms = np.asarray(tiempos) * 1000
+    return np.percentile(tiempos_ms, 50), np.percentile(tiempos_ms, 99)
+
+
+def buscar_icontains(consulta):
+    """Camino anterior: SearchFilter con search_fields nombre y descripcion."""
+    condiciones = [
+        Q(nombre__icontains=palabra) | Q(descripcion__icontains=palabra)
+        for palabra in consulta.split()
+    ]
+    return list(Producto.objects.filter(reduce(and_, condiciones)).values_list('pk', flat=True))
+
+
+class Command(BaseCommand):
+    help = 'Mide p50/p99 de la búsqueda de productos (icontains vs. índice BM25)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=100000)
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.crear_catalogo(options['productos'], options['seed'])
+                indice = IndiceBusqueda()
+                inicio = time.perf_counter()
+                indice.reconstruir()
+                self.stdout.write(
+                    f'Índice: {len(indice)} productos en {time.perf_counter() - inicio:.2f}s'
+                )
+                self.medir(indice, options['repeticiones'])
+                sugerencias = IndiceSugerencias()
+                inicio = time.perf_counter()
+                sugerencias.reconstruir()
+                self.stdout.write(
+                    f'Sugerencias: {len(sugerencias)} nombres en {time.perf_counter() - inicio:.2f}s'
+                )
+                self.medir_sugerencias(sugerencias, options['repeticiones'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def crear_catalogo(self, cantidad, seed):
+        rng = np.random.default_rng(seed)
+        categoria = Categoria.objects.create(nombre='Benchmark')
+        vocabulario = np.asarray(VOCABULARIO)
+
+        def texto(minimo, maximo):
+            return ' '.join(rng.choice(vocabulario, rng.integers(minimo, maximo)))
+
+        Producto.objects.bulk_create([
+            Producto(
+                nombre=texto(2, 5).capitalize(),
+                descripcion=texto(10, 25),
+                precio=10,
+                categoria=categoria,
+            )
+            for _ in range(cantidad)
+        ], batch_size=5000)
+
+    def medir(self, indice, repeticiones):
+        self.stdout.write(
+            f"{'icontains p50':>14} {'p99':>9} {'índice p50':>11} {'p99':>9} "
+            f"{'coincidencias':>13}  consulta"
+        )
+        for consulta in CONSULTAS:
+            tiempos_anterior, tiempos_indice = [], []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                anteriores = buscar_icontains(consulta)
+                tiempos_anterior.append(time.perf_counter() - inicio)
+                inicio = time.perf_counter()
+                coincidencias = len(indice.buscar(consulta))
+                tiempos_indice.append(time.perf_counter() - inicio)
+            a50, a99 = percentiles(tiempos_anterior)
+            i50, i99 = percentiles(tiempos_indice)
+            self.stdout.write(
+                f'{a50:>12.2f}ms {a99:>7.2f}ms {i50:>9.2f}ms {i99:>7.2f}ms '
+                f'{len(anteriores):>6}/{coincidencias:<6}  {consulta}'
+            )
+
+    def medir_sugerencias(self, sugerencias, repeticiones):
+        self.stdout.write(f"{'p50':>9} {'p99':>9}  prefijo")
+        for prefijo in PREFIJOS:
+            tiempos = []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                sugerencias.sugerir(prefijo)
+                tiempos.append(time.perf_counter() - inicio)
+            p50, p99 = percentiles(tiempos)
+            self.stdout.write(f'{p50:>7.2f}ms {p99:>7.2f}ms  {prefijo}')
@@ -0,0 +1,67 @@
+"""
+Management command para construir el índice ANN (IVF) de recomendaciones.
+
+Lee todos los embeddings, entrena el índice y lo publica en una versión
+nueva dentro de RECOMMENDATION_ANN_PATH. Los workers con
+RECOMMENDATION_BACKEND = 'ivf' lo abren al arrancar y detectan las
+versiones nuevas cada RECOMMENDATION_INDEX_TTL segundos.
+
+Uso:
+    python manage.py build_ann_index
+    python manage.py build_ann_index --listas 1024 --conservar 3
+"""
+
+import os
+import shutil
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from productos.ann import IVFIndex
+from productos.vector_index import EmbeddingIndex
+
+
+class Command(BaseCommand):
+    help = 'Construye y publica el índice ANN (IVF) de embeddings de productos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listas', type=int, default=None,
+                            help='Cantidad de listas IVF (por defecto 4*sqrt(N))')
+        parser.add_argument('--iteraciones', type=int, default=10,
+                            help='Iteraciones de k-means')
+        parser.add_argument('--conservar', type=int, default=2,
+                            help='Versiones anteriores a conservar en disco')
+
+    def handle(self, *args, **options):
+        ruta = str(settings.RECOMMENDATION_ANN_PATH)
+        creado_en = time.time()
+        index = EmbeddingIndex()
+        index.reconstruir()
+        ids, matriz = index.datos()
+        if not len(ids):
+            raise CommandError('No hay productos con embedding.')
+
+        inicio = time.perf_counter()
+        ivf = IVFIndex.entrenar(
+            ids, matriz,
+            n_listas=options['listas'],
+            iteraciones=options['iteraciones'],
+            creado_en=creado_en,
+        )
+        version = ivf.publicar(ruta)
+        self.stdout.write(self.style.SUCCESS(
+            f'Índice {version} publicado: {len(ivf)} productos, '
+            f'{ivf.centroides.shape[0]} listas, {time.perf_counter() - inicio:.1f}s'
+        ))
+        self.limpiar_versiones(ruta, version, options['conservar'])
+
+    def limpiar_versiones(self, ruta, actual, conservar):
+        """Elimina las versiones más antiguas, conservando las últimas."""
+        versiones = sorted(
+            (nombre for nombre in os.listdir(ruta)
+             if nombre.startswith('v') and nombre != actual),
+            key=lambda nombre: int(nombre[1:]),
+        )
+        for nombre in versiones[:max(0, len(versiones) - conservar)]:
+            shutil.rmtree(os.path.join(ruta, nombre), ignore_errors=True)
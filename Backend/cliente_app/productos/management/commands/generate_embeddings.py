@@ -0,0 +1,129 @@
+"""
+Management command para generar embeddings de productos en lote.
+
+Busca los productos sin embedding o con embedding desactualizado (el hash
+del texto no coincide con embedding_hash), agrupa varios textos por
+request al proveedor, ejecuta los requests en paralelo con un máximo de
+--workers y guarda cada lote con bulk_update apenas termina.
+
+Cada lote queda guardado de forma independiente, así que si el comando
+se interrumpe basta con volver a ejecutarlo: solo procesará lo pendiente.
+
+Uso:
+    python manage.py generate_embeddings
+    python manage.py generate_embeddings --batch-size 100 --workers 8
+    python manage.py generate_embeddings --provider productos.embeddings.HashingEmbeddingProvider
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from productos.embeddings import (
+    asignar_embeddings,
+    get_embedding_provider,
+    hash_texto,
+    texto_para_embedding,
+)
+from productos.models import Producto
+from productos.vecinos import recomputar_incremental
+from productos.vector_index import EmbeddingIndex
+
+
+class Command(BaseCommand):
+    help = 'Genera embeddings faltantes o desactualizados en lotes concurrentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=64,
+                            help='Textos por request al proveedor')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Requests simultáneos al proveedor')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Procesar como máximo N productos')
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerar todos los embeddings')
+        parser.add_argument('--provider', default=None,
+                            help='Ruta a la clase del proveedor (por defecto EMBEDDING_PROVIDER)')
+        parser.add_argument('--skip-recommendations', action='store_true',
+                            help='No recalcular las recomendaciones precalculadas')
+
+    def handle(self, *args, **options):
+        if options['provider']:
+            proveedor = import_string(options['provider'])()
+        else:
+            proveedor = get_embedding_provider()
+
+        pendientes = self.buscar_pendientes(proveedor, options['force'], options['limit'])
+        total = len(pendientes)
+        self.stdout.write(f'Proveedor: {proveedor.nombre}')
+        self.stdout.write(f'Productos pendientes: {total}')
+        if not total:
+            self.stdout.write(self.style.SUCCESS('Todos los embeddings están al día.'))
+            return
+
+        tamano = max(1, options['batch_size'])
+        workers = max(1, options['workers'])
+        lotes = iter([pendientes[i:i + tamano] for i in range(0, total, tamano)])
+        procesados = 0
+        fallidos = 0
+        actualizados = []
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            en_curso = {}
+
+            def enviar_siguiente():
+                lote = next(lotes, None)
+                if lote is not None:
+                    en_curso[pool.submit(asignar_embeddings, lote, proveedor)] = lote
+
+            # Máximo 2 lotes en cola por worker para acotar memoria
+            for _ in range(workers * 2):
+                enviar_siguiente()
+
+            while en_curso:
+                terminados, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+                for futuro in terminados:
+                    lote = en_curso.pop(futuro)
+                    try:
+                        futuro.result()
+                    except Exception as e:
+                        fallidos += len(lote)
+                        self.stderr.write(
+                            f'  Error en lote {lote[0].pk}-{lote[-1].pk}: {e}'
+                        )
+                    else:
+                        Producto.objects.bulk_update(lote, ['embedding', 'embedding_hash'])
+                        procesados += len(lote)
+                        actualizados.extend(producto.pk for producto in lote)
+                    self.stdout.write(
+                        f'  Progreso: {procesados + fallidos}/{total} '
+                        f'({100 * (procesados + fallidos) // total}%)'
+                    )
+                    enviar_siguiente()
+
+        self.stdout.write(self.style.SUCCESS(f'Embeddings generados: {procesados}'))
+        if actualizados and not options['skip_recommendations']:
+            index = EmbeddingIndex()
+            index.reconstruir()
+            total = recomputar_incremental(actualizados, index=index)
+            self.stdout.write(f'Recomendaciones recalculadas: {total} productos')
+        if fallidos:
+            raise CommandError(
+                f'{fallidos} productos fallaron; vuelve a ejecutar el comando para reintentarlos.'
+            )
+
+    def buscar_pendientes(self, proveedor, force=False, limit=None):
+        """Productos cuyo embedding falta o no corresponde al texto actual."""
+        productos = Producto.objects.only(
+            'id', 'nombre', 'descripcion', 'embedding_hash'
+        ).order_by('id')
+
+        pendientes = []
+        for producto in productos.iterator(chunk_size=2000):
+            actual = hash_texto(texto_para_embedding(producto), proveedor)
+            if force or producto.embedding_hash != actual:
+                pendientes.append(producto)
+                if limit is not None and len(pendientes) >= limit:
+                    break
+        return pendientes
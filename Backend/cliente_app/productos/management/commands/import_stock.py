@@ -0,0 +1,63 @@
+"""
+Management command para importar movimientos de stock desde un CSV.
+
+El archivo tiene las columnas producto_id y cantidad; una cantidad positiva
+es un ingreso y una negativa una salida. Las filas del mismo producto se
+suman y todo el archivo se aplica con dos UPDATE (ingresos y salidas, ver
+productos.stock). Las salidas que dejarían el stock negativo no se aplican
+y se informan. Como los UPDATE no envían señales, al terminar se invalida
+el cache del catálogo (cliente_app.response_cache).
+
+Uso:
+    python manage.py import_stock movimientos.csv
+    python manage.py import_stock movimientos.csv --todo-o-nada
+"""
+
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from cliente_app.response_cache import invalidar_catalogo
+from productos.stock import descontar_stock, reponer_stock
+
+
+class Command(BaseCommand):
+    help = 'Aplica ingresos y salidas de stock desde un CSV (producto_id,cantidad)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo')
+        parser.add_argument('--todo-o-nada', action='store_true',
+                            help='No aplicar nada si alguna salida no alcanza')
+
+    def handle(self, *args, **options):
+        movimientos = {}
+        try:
+            with open(options['archivo'], newline='', encoding='utf-8') as archivo:
+                for numero, fila in enumerate(csv.DictReader(archivo), start=2):
+                    try:
+                        pk, cantidad = int(fila['producto_id']), int(fila['cantidad'])
+                    except (KeyError, TypeError, ValueError):
+                        raise CommandError(f'Fila {numero} inválida: {fila}')
+                    movimientos[pk] = movimientos.get(pk, 0) + cantidad
+        except OSError as e:
+            raise CommandError(str(e))
+
+        ingresos = {pk: cantidad for pk, cantidad in movimientos.items() if cantidad > 0}
+        salidas = {pk: -cantidad for pk, cantidad in movimientos.items() if cantidad < 0}
+
+        with transaction.atomic():
+            faltantes = descontar_stock(salidas, parcial=not options['todo_o_nada'])
+            if faltantes and options['todo_o_nada']:
+                ingresos = {}
+            repuestos = reponer_stock(ingresos)
+        invalidar_catalogo()
+
+        for faltante in faltantes.values():
+            disponible = 'no existe' if faltante.disponible is None else f'disponible {faltante.disponible}'
+            self.stderr.write(
+                f'Producto {faltante.producto_id}: salida de {faltante.solicitado} '
+                f'no aplicada ({disponible})'
+            )
+        aplicadas = 0 if faltantes and options['todo_o_nada'] else len(salidas) - len(faltantes)
+        self.stdout.write(f'Ingresos aplicados: {repuestos}, salidas aplicadas: {aplicadas}')
@@ -0,0 +1,47 @@
+"""
+Management command para precalcular los vecinos de cada producto.
+
+Sin argumentos recalcula toda la tabla ProductoRecomendacion con
+multiplicaciones por bloques. Con --productos solo recalcula las filas
+afectadas por esos productos (el worker process_embedding_jobs lo hace
+automáticamente tras cada lote).
+
+Uso:
+    python manage.py precompute_recommendations
+    python manage.py precompute_recommendations --productos 4,8,15
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from productos.vecinos import precomputar_todo, recomputar_incremental, vecinos_por_producto
+from productos.vector_index import EmbeddingIndex
+
+
+class Command(BaseCommand):
+    help = 'Precalcula los productos recomendados (top-N vecinos) de cada producto'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-n', type=int, default=None,
+                            help='Vecinos por producto (por defecto RECOMMENDATION_PRECOMPUTED_N)')
+        parser.add_argument('--productos', default=None,
+                            help='IDs separados por coma para un recálculo incremental')
+
+    def handle(self, *args, **options):
+        top_n = options['top_n'] or vecinos_por_producto()
+        index = EmbeddingIndex()
+        index.reconstruir()
+        self.stdout.write(f'Productos con embedding: {len(index)}')
+
+        inicio = time.perf_counter()
+        if options['productos']:
+            ids = [int(pk) for pk in options['productos'].split(',') if pk]
+            total = recomputar_incremental(ids, top_n=top_n, index=index)
+        else:
+            total = precomputar_todo(top_n=top_n, index=index)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Recomendaciones recalculadas para {total} productos '
+            f'en {time.perf_counter() - inicio:.2f}s'
+        ))
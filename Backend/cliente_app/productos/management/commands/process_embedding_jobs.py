@@ -0,0 +1,60 @@
+"""
+Worker que procesa la cola de regeneración de embeddings (EmbeddingJob).
+
+Toma los trabajos vencidos en bloques, llama al proveedor en un pool de
+threads (un request por lote) y guarda los resultados en lote desde el
+thread principal. Los lotes que fallan vuelven a la cola con backoff.
+
+Uso:
+    python manage.py process_embedding_jobs            # corre indefinidamente
+    python manage.py process_embedding_jobs --once     # vacía la cola y termina
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from productos.embeddings import get_embedding_provider
+from productos.jobs import completar_lote, embeber_lote, fallar_lote, tomar_trabajos
+
+
+class Command(BaseCommand):
+    help = 'Procesa la cola de regeneración de embeddings con un pool de workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=32,
+                            help='Productos por request al proveedor')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Requests simultáneos al proveedor')
+        parser.add_argument('--sleep', type=float, default=2.0,
+                            help='Segundos de espera cuando la cola está vacía')
+        parser.add_argument('--once', action='store_true',
+                            help='Procesar los trabajos vencidos y terminar')
+
+    def handle(self, *args, **options):
+        proveedor = get_embedding_provider()
+        tamano = max(1, options['batch_size'])
+        workers = max(1, options['workers'])
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                trabajos = tomar_trabajos(tamano * workers)
+                if not trabajos:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+
+                lotes = [trabajos[i:i + tamano] for i in range(0, len(trabajos), tamano)]
+                futuros = {pool.submit(embeber_lote, lote, proveedor): lote for lote in lotes}
+                for futuro in as_completed(futuros):
+                    lote = futuros[futuro]
+                    try:
+                        futuro.result()
+                    except Exception as e:
+                        fallar_lote(lote, e)
+                        self.stderr.write(f'Error en lote de {len(lote)} productos: {e}')
+                    else:
+                        completar_lote(lote)
+                        self.stdout.write(f'Embeddings actualizados: {len(lote)}')
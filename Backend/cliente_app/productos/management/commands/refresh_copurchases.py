@@ -0,0 +1,52 @@
+"""
+Management command para reconstruir la tabla de compras conjuntas.
+
+La tabla CoCompra se mantiene sola a medida que las órdenes pasan a
+pagadas; este comando la recalcula desde cero a partir de OrderItem (útil
+tras importar órdenes, cambiar estados en lote o la primera vez).
+
+Si RECOMMENDATION_COPURCHASE_WEIGHT > 0 recalcula después los vecinos
+precalculados (ProductoRecomendacion), que guardan el score híbrido: es
+lo que lleva las compras nuevas a /api/productos/{id}/recommend/.
+Conviene correrlo periódicamente (p. ej. cada noche).
+
+Uso:
+    python manage.py refresh_copurchases
+    python manage.py refresh_copurchases --sin-vecinos
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from productos.compras_conjuntas import matriz_co_compras, peso_co_compras, reconstruir_todo
+from productos.vecinos import precomputar_todo
+from productos.vector_index import EmbeddingIndex
+
+
+class Command(BaseCommand):
+    help = 'Recalcula la matriz de compras conjuntas desde las órdenes pagadas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sin-vecinos', action='store_true',
+                            help='No recalcular los vecinos precalculados')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        ordenes, pares = reconstruir_todo()
+        self.stdout.write(self.style.SUCCESS(
+            f'Compras conjuntas recalculadas: {ordenes} órdenes, {pares} pares '
+            f'en {time.perf_counter() - inicio:.2f}s'
+        ))
+        if options['sin_vecinos'] or not peso_co_compras():
+            return
+
+        inicio = time.perf_counter()
+        matriz_co_compras.invalidar()
+        index = EmbeddingIndex()
+        index.reconstruir()
+        total = precomputar_todo(index=index)
+        self.stdout.write(self.style.SUCCESS(
+            f'Recomendaciones recalculadas para {total} productos '
+            f'en {time.perf_counter() - inicio:.2f}s'
+        ))
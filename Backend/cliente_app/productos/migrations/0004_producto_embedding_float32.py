@@ -0,0 +1,66 @@
+# Generated by Django 5.1.3 on 2026-10-17 10:12
+
+import json
+
+import numpy as np
+from django.db import migrations
+
+import productos.fields
+
+
+def json_a_float32(apps, schema_editor):
+    """Convierte los embeddings JSON (listas de floats) a bytes float32."""
+    Producto = apps.get_model('productos', 'Producto')
+    pendientes = []
+    productos = Producto.objects.filter(embedding__isnull=False).only('id', 'embedding')
+    for producto in productos.iterator(chunk_size=500):
+        embedding = producto.embedding
+        if isinstance(embedding, str):
+            embedding = json.loads(embedding)
+        producto.embedding_f32 = np.asarray(embedding, dtype='<f4').tobytes()
+        pendientes.append(producto)
+        if len(pendientes) >= 500:
+            Producto.objects.bulk_update(pendientes, ['embedding_f32'])
+            pendientes = []
+    if pendientes:
+        Producto.objects.bulk_update(pendientes, ['embedding_f32'])
+
+
+def float32_a_json(apps, schema_editor):
+    """Operación inversa: bytes float32 a listas JSON."""
+    Producto = apps.get_model('productos', 'Producto')
+    pendientes = []
+    productos = Producto.objects.filter(embedding_f32__isnull=False).only('id', 'embedding_f32')
+    for producto in productos.iterator(chunk_size=500):
+        producto.embedding = [float(x) for x in producto.embedding_f32]
+        pendientes.append(producto)
+        if len(pendientes) >= 500:
+            Producto.objects.bulk_update(pendientes, ['embedding'])
+            pendientes = []
+    if pendientes:
+        Producto.objects.bulk_update(pendientes, ['embedding'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0003_producto_embedding_producto_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='embedding_f32',
+            field=productos.fields.EmbeddingField(blank=True, null=True),
+        ),
+        migrations.RunPython(json_a_float32, float32_a_json),
+        migrations.RemoveField(
+            model_name='producto',
+            name='embedding',
+        ),
+        migrations.RenameField(
+            model_name='producto',
+            old_name='embedding_f32',
+            new_name='embedding',
+        ),
+    ]
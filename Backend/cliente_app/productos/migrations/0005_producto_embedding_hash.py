@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-17 21:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0004_producto_embedding_float32'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='embedding_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
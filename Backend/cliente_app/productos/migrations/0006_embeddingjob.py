@@ -0,0 +1,31 @@
+# Generated by Django 5.1.3 on 2026-10-17 21:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0005_producto_embedding_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('disponible_en', models.DateTimeField(db_index=True)),
+                ('tomado_en', models.DateTimeField(blank=True, null=True)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('producto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='embedding_job', to='productos.producto')),
+            ],
+            options={
+                'verbose_name': 'Embedding Job',
+                'verbose_name_plural': 'Embedding Jobs',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.3 on 2026-10-17 21:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0006_embeddingjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductoRecomendacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('posicion', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recomendaciones', to='productos.producto')),
+                ('recomendado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recomendado_en', to='productos.producto')),
+            ],
+            options={
+                'verbose_name': 'Recomendación de Producto',
+                'verbose_name_plural': 'Recomendaciones de Productos',
+                'ordering': ['producto', 'posicion'],
+                'constraints': [models.UniqueConstraint(fields=('producto', 'posicion'), name='producto_recomendacion_posicion_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.3 on 2026-10-17 21:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0001_initial'),
+        ('productos', '0007_productorecomendacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoCompraOrden',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='orders.order')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CoCompra',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ordenes', models.PositiveIntegerField(default=0)),
+                ('otro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='productos.producto')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='co_compras', to='productos.producto')),
+            ],
+            options={
+                'verbose_name': 'Compra Conjunta',
+                'verbose_name_plural': 'Compras Conjuntas',
+                'constraints': [models.UniqueConstraint(fields=('producto', 'otro'), name='co_compra_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-17 22:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0008_cocompra'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='reservado',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.3 on 2026-10-17 23:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0009_producto_reservado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
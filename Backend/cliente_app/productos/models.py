@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
 from categorias.models import Categoria
+from .fields import EmbeddingField
 
 class Producto(models.Model):
     nombre = models.CharField(max_length=100)
@@ -8,19 +11,276 @@ class Producto(models.Model):
     categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE, related_name='productos')
     imagen = models.ImageField(upload_to='productos/', blank=True, null=True)  
     stock = models.PositiveIntegerField(default=0)
-    embedding = models.JSONField(null=True, blank=True)
+    # Unidades reservadas por órdenes pendientes (orders.StockReservation);
+    # lo mantiene productos.stock, nunca se edita a mano
+    reservado = models.PositiveIntegerField(default=0, editable=False)
+    embedding = EmbeddingField(null=True, blank=True)
+    embedding_hash = models.CharField(max_length=64, blank=True, editable=False)
+    # Última modificación de lo que muestra el catálogo: lo actualizan save()
+    # y los UPDATE de productos.stock. Da el ETag/Last-Modified
+    # (cliente_app.conditional)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     
     def __str__(self):
         return self.nombre
+
+    @property
+    def disponible(self):
+        """Unidades que se pueden vender: stock menos reservas activas."""
+        return self.stock - self.reservado
     
 
     def generar_embedding(self):
-        """Genera y guarda el embedding usando OpenAI"""
-        texto = f"{self.nombre} {self.descripcion}"
-        response = openai.Embedding.create(
-            input=texto,
-            model="text-embedding-3-small"
-        )
-        self.embedding = response['data'][0]['embedding']
-        self.save()
+        """
+        Genera y guarda el embedding con el proveedor configurado.
+        Para muchos productos usar: python manage.py generate_embeddings
+        """
+        from .embeddings import asignar_embeddings
+
+        asignar_embeddings([self])
+        self.save(update_fields=['embedding', 'embedding_hash'])
+
+
+class ProductoRecomendacion(models.Model):
+    """
+    Vecino precalculado de un producto (top-N por similitud de embeddings).
+    Lo mantiene productos.vecinos; el endpoint recommend solo lo consulta.
+    """
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.CASCADE,
+        related_name='recomendaciones'
+    )
+    recomendado = models.ForeignKey(
+        Producto,
+        on_delete=models.CASCADE,
+        related_name='recomendado_en'
+    )
+    posicion = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['producto', 'posicion']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['producto', 'posicion'],
+                name='producto_recomendacion_posicion_unica'
+            ),
+        ]
+        verbose_name = 'Recomendación de Producto'
+        verbose_name_plural = 'Recomendaciones de Productos'
+
+    def __str__(self):
+        return f'#{self.producto_id} -> #{self.recomendado_id} ({self.posicion})'
+
+
+class CoCompra(models.Model):
+    """
+    Cantidad de órdenes pagadas en las que se compraron juntos dos
+    productos. Se guarda en ambos sentidos y la fila (p, p) cuenta las
+    órdenes pagadas que incluyen a p. La mantiene productos.compras_conjuntas.
+    """
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.CASCADE,
+        related_name='co_compras'
+    )
+    otro = models.ForeignKey(
+        Producto,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    ordenes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['producto', 'otro'],
+                name='co_compra_unica'
+            ),
+        ]
+        verbose_name = 'Compra Conjunta'
+        verbose_name_plural = 'Compras Conjuntas'
+
+    def __str__(self):
+        return f'#{self.producto_id} + #{self.otro_id}: {self.ordenes}'
+
+
+class CoCompraOrden(models.Model):
+    """Orden ya contabilizada en CoCompra; evita contarla dos veces."""
+    order = models.OneToOneField(
+        'orders.Order',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+'
+    )
+
+
+class EmbeddingJob(models.Model):
+    """
+    Trabajo pendiente de regenerar el embedding de un producto.
+
+    Hay como máximo un trabajo por producto: las ediciones seguidas
+    reutilizan la misma fila (se incrementa version y se pospone
+    disponible_en), así una ráfaga de cambios genera un solo request.
+    """
+    producto = models.OneToOneField(
+        Producto,
+        on_delete=models.CASCADE,
+        related_name='embedding_job'
+    )
+    version = models.PositiveIntegerField(default=1)
+    disponible_en = models.DateTimeField(db_index=True)
+    tomado_en = models.DateTimeField(null=True, blank=True)
+    intentos = models.PositiveIntegerField(default=0)
+    ultimo_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Embedding Job'
+        verbose_name_plural = 'Embedding Jobs'
+
+    def __str__(self):
+        return f'Embedding de producto #{self.producto_id} (v{self.version})'
+
+
+# Lo envía productos.stock al confirmarse cada movimiento de stock, con
+# los ids de los productos que cambiaron (`ids`). Los UPDATE del libro de
+# stock no pasan por save(): los índices del worker que guardan datos de
+# stock se actualizan con esta señal en lugar de post_save.
+stock_movido = Signal()
+
+
+# Signals para mantener sincronizado el índice vectorial del worker
+@receiver(post_save, sender=Producto)
+def actualizar_indice_embeddings(sender, instance, update_fields=None, **kwargs):
+    """
+    Actualiza el vector y los metadatos de filtrado (categoría, stock,
+    precio) del producto en el índice una vez confirmada la transacción.
+    """
+    from .ann import get_vector_backend
+    from .vector_index import metadatos_de
+
+    pk, metadatos = instance.pk, metadatos_de(instance)
+    if update_fields is not None and 'embedding' not in update_fields:
+        if not {'categoria', 'stock', 'reservado', 'precio'} & set(update_fields):
+            return
+        transaction.on_commit(lambda: get_vector_backend().actualizar_metadatos(pk, **metadatos))
+        return
+
+    embedding = instance.embedding
+    transaction.on_commit(lambda: get_vector_backend().actualizar(pk, embedding, **metadatos))
+
+
+@receiver(stock_movido)
+def actualizar_disponible_en_indice(sender, ids, **kwargs):
+    """
+    Lleva lo disponible de los productos movidos por productos.stock a
+    los metadatos de filtrado del índice (una consulta; ya confirmado el
+    movimiento). Sin índice cargado no hay nada que mantener.
+    """
+    from .ann import get_vector_backend
+
+    backend = get_vector_backend()
+    if not backend.cargado:
+        return
+    disponibles = Producto.objects.filter(pk__in=ids).values_list(
+        'id', models.F('stock') - models.F('reservado')
+    )
+    for pk, disponible in disponibles:
+        backend.actualizar_metadatos(pk, disponible=disponible)
+
+
+@receiver(post_save, sender=Producto)
+def encolar_embedding_si_cambio(sender, instance, update_fields=None, **kwargs):
+    """
+    Encola la regeneración del embedding cuando cambia el texto embebido.
+    No llama al proveedor: eso lo hace el worker process_embedding_jobs.
+    """
+    if update_fields is not None and not {'nombre', 'descripcion'} & set(update_fields):
+        return
+    from .jobs import encolar_si_cambio
+
+    encolar_si_cambio(instance)
+
+
+@receiver(post_delete, sender=Producto)
+def eliminar_de_indice_embeddings(sender, instance, **kwargs):
+    """
+    Quita el producto eliminado del índice en memoria.
+    """
+    from .ann import get_vector_backend
+
+    pk = instance.pk
+    transaction.on_commit(lambda: get_vector_backend().eliminar(pk))
+
+
+# Signals para mantener sincronizado el índice de búsqueda del worker
+@receiver(post_save, sender=Producto)
+def actualizar_indice_busqueda(sender, instance, update_fields=None, **kwargs):
+    """
+    Reindexa el nombre y la descripción del producto en el índice de
+    búsqueda (productos.busqueda) una vez confirmada la transacción.
+    """
+    if update_fields is not None and not {'nombre', 'descripcion'} & set(update_fields):
+        return
+    from .busqueda import indice_busqueda
+
+    pk, nombre, descripcion = instance.pk, instance.nombre, instance.descripcion
+    transaction.on_commit(lambda: indice_busqueda.actualizar(pk, nombre, descripcion))
+
+
+@receiver(post_delete, sender=Producto)
+def eliminar_de_indice_busqueda(sender, instance, **kwargs):
+    """
+    Quita el producto eliminado del índice de búsqueda.
+    """
+    from .busqueda import indice_busqueda
+
+    pk = instance.pk
+    transaction.on_commit(lambda: indice_busqueda.eliminar(pk))
+
+
+# Signals para mantener sincronizadas las sugerencias del worker
+@receiver(post_save, sender=Producto)
+def actualizar_sugerencias_producto(sender, instance, update_fields=None, **kwargs):
+    """
+    Agrega o renombra el producto en las sugerencias (productos.sugerencias)
+    una vez confirmada la transacción.
+    """
+    if update_fields is not None and 'nombre' not in update_fields:
+        return
+    from .sugerencias import PRODUCTO, indice_sugerencias
+
+    pk, nombre = instance.pk, instance.nombre
+    transaction.on_commit(lambda: indice_sugerencias.actualizar(PRODUCTO, pk, nombre))
+
+
+@receiver(post_delete, sender=Producto)
+def eliminar_de_sugerencias_producto(sender, instance, **kwargs):
+    """
+    Quita el producto eliminado de las sugerencias.
+    """
+    from .sugerencias import PRODUCTO, indice_sugerencias
+
+    pk = instance.pk
+    transaction.on_commit(lambda: indice_sugerencias.eliminar(PRODUCTO, pk))
+
+
+# Campos que no se muestran en el catálogo: guardarlos no lo invalida
+CAMPOS_FUERA_DEL_CATALOGO = {'embedding', 'embedding_hash'}
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+def invalidar_catalogo_producto(sender, instance, update_fields=None, **kwargs):
+    """
+    Invalida las respuestas cacheadas del catálogo
+    (cliente_app.response_cache).
+    """
+    from cliente_app.response_cache import invalidar_al_confirmar
+
+    if update_fields is not None and set(update_fields) <= CAMPOS_FUERA_DEL_CATALOGO:
+        return
+    invalidar_al_confirmar()
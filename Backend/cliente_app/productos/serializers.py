@@ -1,8 +1,83 @@
-
 from rest_framework import serializers
+from cliente_app.fieldsets import SparseFieldsetMixin
 from .models import Producto
 
-class ProductoSerializer(serializers.ModelSerializer):
+class ProductoSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    # stock menos lo reservado por órdenes pendientes
+    disponible = serializers.IntegerField(read_only=True)
+
     class Meta:
         model = Producto
-        fields = '__all__'
\ No newline at end of file
+        # El embedding es un vector binario de uso interno (recomendaciones)
+        exclude = ['embedding', 'embedding_hash']
+
+
+class RecomendacionParamsSerializer(serializers.Serializer):
+    """Parámetros de /api/productos/{id}/recommend/."""
+    top_n = serializers.IntegerField(min_value=1, max_value=50, default=4)
+    categoria = serializers.IntegerField(required=False)
+    misma_categoria = serializers.BooleanField(default=False)
+    in_stock = serializers.BooleanField(default=False)
+    precio_min = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    precio_max = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    # Fracción del precio del producto, ej. 0.2 = ±20 %
+    banda_precio = serializers.FloatField(min_value=0, required=False)
+    en_promocion = serializers.BooleanField(default=False)
+
+    def filtros_para(self, producto):
+        """Filtros del índice vectorial relativos al producto consultado."""
+        datos = self.validated_data
+        filtros = {}
+        if datos.get('misma_categoria'):
+            filtros['categoria'] = producto.categoria_id
+        elif 'categoria' in datos:
+            filtros['categoria'] = datos['categoria']
+        if datos['in_stock']:
+            filtros['en_stock'] = True
+        if datos['en_promocion']:
+            filtros['en_promocion'] = True
+        if 'banda_precio' in datos:
+            precio = float(producto.precio)
+            filtros['precio_min'] = precio * (1 - datos['banda_precio'])
+            filtros['precio_max'] = precio * (1 + datos['banda_precio'])
+        if 'precio_min' in datos:
+            filtros['precio_min'] = max(filtros.get('precio_min', 0), float(datos['precio_min']))
+        if 'precio_max' in datos:
+            filtros['precio_max'] = min(
+                filtros.get('precio_max', float('inf')), float(datos['precio_max'])
+            )
+        return filtros
+
+
+class BusquedaHibridaParamsSerializer(serializers.Serializer):
+    """Parámetros de /api/productos/search/."""
+    q = serializers.CharField(max_length=200)
+    top_n = serializers.IntegerField(min_value=1, max_value=50, default=20)
+    categoria = serializers.IntegerField(required=False)
+    in_stock = serializers.BooleanField(default=False)
+
+    def filtros(self):
+        datos = self.validated_data
+        filtros = {}
+        if 'categoria' in datos:
+            filtros['categoria'] = datos['categoria']
+        if datos['in_stock']:
+            filtros['en_stock'] = True
+        return filtros
+
+
+class SugerenciasParamsSerializer(serializers.Serializer):
+    """Parámetros de /api/productos/suggest/."""
+    q = serializers.CharField(max_length=100)
+    top_n = serializers.IntegerField(min_value=1, max_value=20, default=8)
+
+
+class RecomendacionLoteSerializer(RecomendacionParamsSerializer):
+    """Cuerpo de POST /api/productos/recommend/."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), min_length=1, max_length=100
+    )
+    top_n_agregado = serializers.IntegerField(min_value=1, max_value=50, required=False)
+    # Los filtros relativos a un producto no aplican a un lote
+    misma_categoria = None
+    banda_precio = None
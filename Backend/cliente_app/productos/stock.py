@@ -0,0 +1,176 @@
+"""
+Movimientos de stock de productos.
+
+Cada producto lleva dos contadores: `stock` (unidades físicas) y
+`reservado` (unidades apartadas por órdenes pendientes, ver
+orders.StockReservation). Lo que se puede vender es
+`disponible = stock - reservado`, que se lee de la misma fila sin sumar
+reservas.
+
+Todas las escrituras (checkout, pagos, devoluciones, admin e
+importaciones) pasan por aquí y se aplican con un solo UPDATE con F()
+para todos los productos del movimiento, sin leer antes las filas ni
+reescribir el resto de las columnas (en particular el embedding); solo
+se actualiza también updated_at, del que sale el ETag del catálogo. Los
+movimientos que reducen lo disponible llevan la condición en el WHERE:
+
+    UPDATE productos_producto
+       SET reservado = reservado + CASE id WHEN 1 THEN 2 WHEN 7 THEN 1 END
+     WHERE id IN (1, 7)
+       AND stock >= reservado + CASE id WHEN 1 THEN 2 WHEN 7 THEN 1 END
+
+así que lo disponible nunca queda negativo aunque muchos procesos compren
+el mismo producto a la vez. Si algún producto no alcanza, el movimiento se
+deshace (o, con parcial=True, se aplica solo a los que alcanzan) y se
+informan los faltantes por producto.
+
+Como los UPDATE no envían post_save, cada movimiento aplicado envía
+productos.models.stock_movido con los ids afectados al confirmarse la
+transacción (si se revierte, no se envía).
+"""
+
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .models import Producto, stock_movido
+
+
+# disponible es None si el producto no existe
+Faltante = namedtuple('Faltante', ['producto_id', 'nombre', 'solicitado', 'disponible'])
+
+
+def _por_producto(cantidades):
+    """CASE id WHEN ... THEN cantidad END para un {producto_id: cantidad}."""
+    return Case(
+        *[When(pk=pk, then=Value(cantidad)) for pk, cantidad in cantidades.items()],
+        output_field=IntegerField(),
+    )
+
+
+def _positivas(cantidades):
+    return {pk: cantidad for pk, cantidad in cantidades.items() if cantidad > 0}
+
+
+def _avisar_al_confirmar(ids):
+    """Envía stock_movido con los ids al confirmar la transacción en curso."""
+    ids = frozenset(ids)
+    if ids:
+        transaction.on_commit(lambda: stock_movido.send(sender=Producto, ids=ids))
+
+
+class _Revertir(Exception):
+    """Deshace el savepoint de un movimiento que no alcanzó para todo."""
+
+
+def _mover_si_alcanza(cantidades, campo, signo, parcial):
+    """
+    Suma signo·cantidad a `campo` solo donde lo disponible alcanza para
+    la cantidad. Retorna {producto_id: Faltante}.
+    """
+    cantidades = _positivas(cantidades)
+    faltantes = {}
+    movidos = ()
+    while cantidades:
+        cantidad = _por_producto(cantidades)
+        try:
+            with transaction.atomic():
+                actualizados = Producto.objects.filter(
+                    pk__in=cantidades, stock__gte=F('reservado') + cantidad
+                ).update(**{campo: F(campo) + signo * cantidad, 'updated_at': timezone.now()})
+                if actualizados == len(cantidades):
+                    movidos = cantidades
+                    break
+                raise _Revertir
+        except _Revertir:
+            pass
+        # Si entre el UPDATE y la lectura se liberó stock, se reintenta
+        nuevos = faltantes_de(cantidades)
+        faltantes.update(nuevos)
+        if nuevos and not parcial:
+            break
+        cantidades = {pk: c for pk, c in cantidades.items() if pk not in nuevos}
+    _avisar_al_confirmar(movidos)
+    return faltantes
+
+
+def faltantes_de(cantidades):
+    """
+    Faltantes de {producto_id: cantidad} según lo disponible ahora, con
+    una sola consulta.
+    """
+    faltantes = {
+        pk: Faltante(pk, None, cantidad, None) for pk, cantidad in cantidades.items()
+    }
+    for pk, nombre, stock, reservado in Producto.objects.filter(
+        pk__in=cantidades
+    ).values_list('id', 'nombre', 'stock', 'reservado'):
+        disponible = stock - reservado
+        if disponible >= cantidades[pk]:
+            del faltantes[pk]
+        else:
+            faltantes[pk] = Faltante(pk, nombre, cantidades[pk], disponible)
+    return faltantes
+
+
+def reservar_stock(cantidades, parcial=False):
+    """
+    Aparta {producto_id: cantidad} de lo disponible (suma a `reservado`)
+    con un solo UPDATE condicional. Por defecto no aparta nada si algún
+    producto no alcanza. Retorna {producto_id: Faltante}, vacío si se
+    aplicó todo.
+    """
+    return _mover_si_alcanza(cantidades, 'reservado', 1, parcial)
+
+
+def descontar_stock(cantidades, parcial=False):
+    """
+    Saca {producto_id: cantidad} del stock sin reserva previa (ventas
+    directas, salidas de una importación), sin tocar lo reservado por
+    otras órdenes. Mismas reglas y retorno que reservar_stock.
+    """
+    return _mover_si_alcanza(cantidades, 'stock', -1, parcial)
+
+
+def liberar_reserva(cantidades):
+    """Devuelve a lo disponible {producto_id: cantidad} reservados."""
+    cantidades = _positivas(cantidades)
+    if not cantidades:
+        return 0
+    actualizados = Producto.objects.filter(pk__in=cantidades).update(
+        reservado=F('reservado') - _por_producto(cantidades), updated_at=timezone.now()
+    )
+    _avisar_al_confirmar(cantidades)
+    return actualizados
+
+
+def consumir_reserva(cantidades):
+    """
+    Convierte {producto_id: cantidad} reservados en venta: resta la
+    cantidad del stock y de lo reservado en el mismo UPDATE, así que lo
+    disponible no cambia.
+    """
+    cantidades = _positivas(cantidades)
+    if not cantidades:
+        return 0
+    cantidad = _por_producto(cantidades)
+    actualizados = Producto.objects.filter(pk__in=cantidades).update(
+        stock=F('stock') - cantidad, reservado=F('reservado') - cantidad,
+        updated_at=timezone.now()
+    )
+    _avisar_al_confirmar(cantidades)
+    return actualizados
+
+
+def reponer_stock(cantidades):
+    """Suma {producto_id: cantidad} al stock con un solo UPDATE."""
+    cantidades = _positivas(cantidades)
+    if not cantidades:
+        return 0
+    actualizados = Producto.objects.filter(pk__in=cantidades).update(
+        stock=F('stock') + _por_producto(cantidades), updated_at=timezone.now()
+    )
+    _avisar_al_confirmar(cantidades)
+    return actualizados
@@ -0,0 +1,287 @@
+"""
+Sugerencias para el buscador (type-ahead): /api/productos/suggest/?q=
+
+Cada proceso (worker) mantiene en memoria los nombres de los productos y
+de las categorías como un arreglo ordenado de claves plegadas (ver
+productos.busqueda.plegar). Un nombre tiene una clave por cada palabra
+desde la que se puede empezar a escribirlo ("Torta de chocolate" ->
+"torta de chocolate", "chocolate"), salvo las stopwords. Una consulta es
+un rango del arreglo que se encuentra con bisect; de ese rango se toman
+los más populares con NumPy. No consulta la base de datos.
+
+Popularidad: cantidad de OrderItem de órdenes pagadas de cada producto;
+la de una categoría es la suma de la de sus productos. A igual
+popularidad van primero los nombres que empiezan con la consulta.
+
+Igual que el índice de búsqueda, se construye de forma perezosa en la
+primera consulta, las señales de Producto y Categoria agregan, renombran
+o quitan entradas sin reconstruir, y se reconstruye pasado
+SUGGEST_INDEX_TTL segundos: así se recogen las ventas nuevas, los
+cambios de otros workers y los de bulk_create/update. La reconstrucción
+la hace un solo thread mientras los demás siguen sugiriendo con el
+índice vencido.
+"""
+
+import threading
+import time
+from bisect import bisect_left, insort
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count
+
+from .busqueda import _PALABRA, STOPWORDS, plegar
+from .vector_index import top_k
+
+
+PRODUCTO = 'producto'
+CATEGORIA = 'categoria'
+LIMITE_SUGERENCIAS = 8
+# Candidatos que se ordenan por cada sugerencia pedida: un mismo nombre
+# puede coincidir con varias de sus claves
+CANDIDATOS_POR_SUGERENCIA = 4
+
+
+def normalizar(texto):
+    """Palabras plegadas separadas por un espacio: 'Piña  Ácida' -> 'pina acida'."""
+    return ' '.join(_PALABRA.findall(plegar(texto or '')))
+
+
+def claves_de(nombre):
+    """[(clave, empieza_el_nombre)] desde las que se sugiere un nombre."""
+    lista = _PALABRA.findall(plegar(nombre or ''))
+    claves = []
+    for i, palabra in enumerate(lista):
+        if i and palabra in STOPWORDS:
+            continue
+        claves.append((' '.join(lista[i:]), i == 0))
+    return claves
+
+
+class IndiceSugerencias:
+    """
+    Nombres de productos y categorías ordenados por prefijo.
+
+    Cada nombre es una entrada (tipo, id, nombre, popularidad). Las claves
+    de la carga están en un arreglo ordenado (_claves, con su entrada y si
+    empiezan el nombre en arreglos NumPy paralelos); las de las entradas
+    agregadas o renombradas después van a un delta ordenado y la entrada
+    anterior queda marcada como no viva. Todas las operaciones están
+    protegidas por un lock para poder usarse desde varios threads; las
+    reconstrucciones, por otro (_reconstruccion), que no bloquea las
+    consultas.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._reconstruccion = threading.Lock()
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._claves = []
+        self._entrada_clave = np.empty(0, dtype=np.int32)
+        self._inicio_clave = np.empty(0, dtype=np.bool_)
+        # Delta: [(clave, entrada, empieza_el_nombre)] ordenado
+        self._delta = []
+        # Por entrada
+        self._tipos = []
+        self._ids = []
+        self._nombres = []
+        self._popularidad = np.empty(0, dtype=np.float64)
+        self._vivo = np.empty(0, dtype=np.bool_)
+        self._tamano = 0
+        self._posiciones = {}
+        self._cargado = False
+        self._cargado_en = 0.0
+
+    # ------------------------------------------------------------------
+    # Carga
+    # ------------------------------------------------------------------
+
+    def cargar(self, productos, categorias, ventas):
+        """
+        Reemplaza el contenido. `productos` son filas (id, nombre,
+        categoria_id), `categorias` filas (id, nombre) y `ventas` un dict
+        producto_id -> popularidad.
+        """
+        entradas = []
+        por_categoria = {}
+        for pk, nombre, categoria_id in productos:
+            popularidad = ventas.get(pk, 0)
+            por_categoria[categoria_id] = por_categoria.get(categoria_id, 0) + popularidad
+            entradas.append((PRODUCTO, pk, nombre, popularidad))
+        for pk, nombre in categorias:
+            entradas.append((CATEGORIA, pk, nombre, por_categoria.get(pk, 0)))
+
+        claves = []
+        for entrada, (_, _, nombre, _) in enumerate(entradas):
+            for clave, inicio in claves_de(nombre):
+                claves.append((clave, entrada, inicio))
+        claves.sort()
+
+        with self._lock:
+            self._reiniciar()
+            self._claves = [clave for clave, _, _ in claves]
+            self._entrada_clave = np.fromiter((e for _, e, _ in claves), dtype=np.int32, count=len(claves))
+            self._inicio_clave = np.fromiter((i for _, _, i in claves), dtype=np.bool_, count=len(claves))
+            self._tipos = [tipo for tipo, _, _, _ in entradas]
+            self._ids = [pk for _, pk, _, _ in entradas]
+            self._nombres = [nombre for _, _, nombre, _ in entradas]
+            self._popularidad = np.asarray([p for _, _, _, p in entradas], dtype=np.float64)
+            self._vivo = np.ones(len(entradas), dtype=np.bool_)
+            self._tamano = len(entradas)
+            self._posiciones = {(tipo, pk): e for e, (tipo, pk, _, _) in enumerate(entradas)}
+            self._cargado = True
+            self._cargado_en = time.monotonic()
+
+    def reconstruir(self):
+        """Carga productos, categorías y ventas desde la base de datos."""
+        from categorias.models import Categoria
+        from orders.models import OrderItem
+
+        from .compras_conjuntas import ESTADOS_PAGADOS
+        from .models import Producto
+
+        ventas = dict(
+            OrderItem.objects.filter(order__status__in=ESTADOS_PAGADOS)
+            .values('producto_id')
+            .annotate(n=Count('id'))
+            .values_list('producto_id', 'n')
+        )
+        productos = Producto.objects.values_list('id', 'nombre', 'categoria_id')
+        categorias = Categoria.objects.values_list('id', 'nombre')
+        self.cargar(productos.iterator(chunk_size=2000), categorias, ventas)
+
+    def invalidar(self):
+        """Descarta el contenido; se reconstruirá en la próxima consulta."""
+        with self._lock:
+            self._reiniciar()
+
+    def _vigente(self):
+        with self._lock:
+            expirado = (
+                self.ttl is not None
+                and time.monotonic() - self._cargado_en > self.ttl
+            )
+            return self._cargado and not expirado
+
+    def _asegurar_cargado(self):
+        if self._vigente():
+            return
+        # Igual que IndiceBusqueda: un solo thread reconstruye y solo la
+        # primera carga hace esperar
+        if not self._reconstruccion.acquire(blocking=not self._cargado):
+            return
+        try:
+            if not self._vigente():
+                self.reconstruir()
+        finally:
+            self._reconstruccion.release()
+
+    @property
+    def cargado(self):
+        return self._cargado
+
+    def __len__(self):
+        return len(self._posiciones)
+
+    def __contains__(self, tipo_y_pk):
+        return tipo_y_pk in self._posiciones
+
+    # ------------------------------------------------------------------
+    # Actualizaciones incrementales
+    # ------------------------------------------------------------------
+
+    def actualizar(self, tipo, pk, nombre):
+        """
+        Agrega o renombra una entrada. Conserva su popularidad: las ventas
+        nuevas se recogen al reconstruir.
+        """
+        with self._lock:
+            if not self._cargado:
+                # Se construirá completo en la primera consulta
+                return
+            anterior = self._posiciones.get((tipo, pk))
+            if anterior is not None and self._nombres[anterior] == nombre:
+                return
+            popularidad = self._popularidad[anterior] if anterior is not None else 0.0
+            self.eliminar(tipo, pk)
+            entrada = self._tamano
+            self._reservar(entrada + 1)
+            self._tipos.append(tipo)
+            self._ids.append(pk)
+            self._nombres.append(nombre)
+            self._popularidad[entrada] = popularidad
+            self._vivo[entrada] = True
+            self._tamano += 1
+            self._posiciones[(tipo, pk)] = entrada
+            for clave, inicio in claves_de(nombre):
+                insort(self._delta, (clave, entrada, inicio))
+
+    def eliminar(self, tipo, pk):
+        """Quita una entrada: deja de estar viva."""
+        with self._lock:
+            entrada = self._posiciones.pop((tipo, pk), None)
+            if entrada is not None:
+                self._vivo[entrada] = False
+
+    def _reservar(self, entradas):
+        """Crece los arreglos por entrada duplicándolos (amortizado O(1))."""
+        capacidad = len(self._vivo)
+        if entradas <= capacidad:
+            return
+        nueva = max(entradas, capacidad * 2, 16)
+        for nombre in ('_popularidad', '_vivo'):
+            arreglo = getattr(self, nombre)
+            ampliado = np.zeros(nueva, dtype=arreglo.dtype)
+            ampliado[:self._tamano] = arreglo[:self._tamano]
+            setattr(self, nombre, ampliado)
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    def sugerir(self, consulta, limite=LIMITE_SUGERENCIAS):
+        """
+        [{'tipo', 'id', 'nombre'}] de los nombres con una palabra que
+        empieza con la consulta, de más a menos popular.
+        """
+        prefijo = normalizar(consulta)
+        if not prefijo or limite <= 0:
+            return []
+        fin = prefijo + '\uffff'
+        self._asegurar_cargado()
+        with self._lock:
+            inicio, final = bisect_left(self._claves, prefijo), bisect_left(self._claves, fin)
+            entradas = self._entrada_clave[inicio:final]
+            empieza = self._inicio_clave[inicio:final]
+            delta = self._delta[bisect_left(self._delta, (prefijo,)):bisect_left(self._delta, (fin,))]
+            if delta:
+                entradas = np.concatenate([entradas, np.fromiter((e for _, e, _ in delta), dtype=np.int32)])
+                empieza = np.concatenate([empieza, np.fromiter((i for _, _, i in delta), dtype=np.bool_)])
+            vivas = self._vivo[entradas]
+            entradas, empieza = entradas[vivas], empieza[vivas]
+            # La popularidad manda; empezar el nombre desempata
+            puntajes = self._popularidad[entradas] * 2 + empieza
+            mejores = entradas[top_k(puntajes, limite * CANDIDATOS_POR_SUGERENCIA)]
+
+            sugerencias, vistas = [], set()
+            for entrada in mejores.tolist():
+                if entrada in vistas:
+                    continue
+                vistas.add(entrada)
+                sugerencias.append({
+                    'tipo': self._tipos[entrada],
+                    'id': self._ids[entrada],
+                    'nombre': self._nombres[entrada],
+                })
+                if len(sugerencias) == limite:
+                    break
+            return sugerencias
+
+
+# Índice compartido por todos los requests del worker
+indice_sugerencias = IndiceSugerencias(
+    ttl=getattr(settings, 'SUGGEST_INDEX_TTL', 300)
+)
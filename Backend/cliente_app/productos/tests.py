@@ -1,3 +1,984 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from django.contrib.auth.models import User
+
+from categorias.models import Categoria
+from cliente_app.response_cache import invalidar_catalogo
+from orders.models import Order, OrderItem
+from promocion.models import Promocion
+from .ann import IVFBackend, IVFIndex
+from .busqueda import IndiceBusqueda, indice_busqueda, palabras, raiz
+from .busqueda_hibrida import (
+    CacheLRU, embeddings_de_consultas, fusionar, get_query_encoder,
+)
+from .compras_conjuntas import MatrizCoCompras, matriz_co_compras, reconstruir_todo, registrar_orden
+from .embeddings import HashingEmbeddingProvider, OpenAIEmbeddingProvider
+from .models import CoCompra, EmbeddingJob, Producto, ProductoRecomendacion, stock_movido
+from .vecinos import precomputar_todo, recomputar_incremental
+from .serializers import ProductoSerializer
+from .sugerencias import CATEGORIA, PRODUCTO, IndiceSugerencias, indice_sugerencias
+from .stock import consumir_reserva, descontar_stock, liberar_reserva, reponer_stock, reservar_stock
+from .vector_index import EmbeddingIndex, embedding_index
+
+
+class EmbeddingIndexTests(TestCase):
+    """Pruebas del índice vectorial en memoria."""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectores = rng.standard_normal((50, 8))
+        self.index = EmbeddingIndex()
+        self.index.cargar(zip(range(1, 51), self.vectores))
+
+    def fuerza_bruta(self, pk, top_n):
+        matriz = self.vectores / np.linalg.norm(self.vectores, axis=1, keepdims=True)
+        scores = matriz @ matriz[pk - 1]
+        scores[pk - 1] = -np.inf
+        return [int(i) + 1 for i in np.argsort(-scores)[:top_n]]
+
+    def test_similares_coincide_con_fuerza_bruta(self):
+        for pk in (1, 17, 50):
+            ids = [i for i, _ in self.index.similares(pk, top_n=5)]
+            self.assertEqual(ids, self.fuerza_bruta(pk, 5))
+
+    def test_lote_equivale_a_consultas_individuales(self):
+        por_producto, agregadas = self.index.similares_lote([3, 7, 3], top_n=4)
+        self.assertEqual(list(por_producto), [3, 7])
+        for pk in (3, 7):
+            esperados = [i for i in self.fuerza_bruta(pk, 6) if i not in (3, 7)][:4]
+            self.assertEqual([i for i, _ in por_producto[pk]], esperados)
+
+        matriz = self.vectores / np.linalg.norm(self.vectores, axis=1, keepdims=True)
+        media = (matriz @ matriz[2] + matriz @ matriz[6]) / 2
+        media[[2, 6]] = -np.inf
+        self.assertEqual([i for i, _ in agregadas], list(np.argsort(-media)[:4] + 1))
+
+    def test_reconstruccion_vencida_en_un_solo_thread(self):
+        index = EmbeddingIndex(ttl=60)
+        index.cargar(zip(range(1, 51), self.vectores))
+        index._cargado_en -= 120
+        empezo, seguir = threading.Event(), threading.Event()
+        reconstrucciones = []
+
+        def reconstruir():
+            reconstrucciones.append(1)
+            empezo.set()
+            seguir.wait(5)
+            index.cargar(zip(range(1, 3), self.vectores))
+
+        with mock.patch.object(index, 'reconstruir', reconstruir), ThreadPoolExecutor(1) as pool:
+            primera = pool.submit(index.similares, 1, 5)
+            self.assertTrue(empezo.wait(5))
+            # Mientras tanto se consulta la matriz vencida
+            self.assertEqual(len(index.similares(1, top_n=5)), 5)
+            seguir.set()
+            self.assertEqual([i for i, _ in primera.result()], [2])
+        self.assertEqual(len(reconstrucciones), 1)
+
+    def test_actualizar_y_eliminar(self):
+        self.index.actualizar(99, self.vectores[0])
+        self.assertEqual(len(self.index), 51)
+        self.assertEqual(self.index.similares(1, top_n=1)[0][0], 99)
+
+        self.index.eliminar(99)
+        self.index.eliminar(1)
+        self.assertEqual(len(self.index), 49)
+        self.assertNotIn(1, self.index)
+        ids = [i for i, _ in self.index.similares(50, top_n=49)]
+        self.assertCountEqual(ids, range(2, 50))
+
+
+class IVFBackendTests(TestCase):
+    """Pruebas del índice aproximado (IVF) con memory-map."""
+
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.vectores = rng.standard_normal((200, 8))
+        self.exacto = EmbeddingIndex()
+        self.exacto.cargar(zip(range(1, 201), self.vectores))
+        self.directorio = tempfile.TemporaryDirectory()
+        IVFIndex.entrenar(range(1, 201), self.vectores, n_listas=8).publicar(self.directorio.name)
+
+    def tearDown(self):
+        self.directorio.cleanup()
+
+    def test_todas_las_listas_equivale_a_exacto(self):
+        backend = IVFBackend(self.directorio.name, nprobe=8)
+        for pk in (1, 50, 200):
+            self.assertEqual(
+                [i for i, _ in backend.similares(pk, top_n=5)],
+                [i for i, _ in self.exacto.similares(pk, top_n=5)],
+            )
+
+    def test_delta_reemplaza_y_elimina(self):
+        backend = IVFBackend(self.directorio.name, nprobe=8)
+        backend.actualizar(500, self.vectores[9])
+        self.assertEqual(backend.similares(10, top_n=1)[0][0], 500)
+
+        backend.eliminar(500)
+        backend.eliminar(1)
+        self.assertNotIn(1, backend)
+        ids = [i for i, _ in backend.similares(2, top_n=200)]
+        self.assertNotIn(1, ids)
+        self.assertNotIn(500, ids)
+
+    def test_lote_con_todas_las_listas_equivale_a_exacto(self):
+        backend = IVFBackend(self.directorio.name, nprobe=8)
+        ivf = backend.similares_lote([5, 9], top_n=3)
+        exacto = self.exacto.similares_lote([5, 9], top_n=3)
+        self.assertEqual(
+            {pk: [i for i, _ in r] for pk, r in ivf[0].items()},
+            {pk: [i for i, _ in r] for pk, r in exacto[0].items()},
+        )
+        self.assertEqual([i for i, _ in ivf[1]], [i for i, _ in exacto[1]])
+
+    def test_filtros_amplian_nprobe_hasta_completar(self):
+        categoria = Categoria.objects.create(nombre='Filtradas')
+        # Solo los ids múltiplos de 10 tienen stock
+        stocks = [int(pk % 10 == 0) for pk in range(1, 201)]
+        Producto.objects.bulk_create([
+            Producto(id=pk, nombre=f'P{pk}', precio=1, categoria=categoria, stock=stock)
+            for pk, stock in zip(range(1, 201), stocks)
+        ])
+        self.exacto.cargar(
+            (pk, v, categoria.pk, stock, 1)
+            for pk, v, stock in zip(range(1, 201), self.vectores, stocks)
+        )
+        filtros = {'en_stock': True}
+        # Con una sola lista no hay 5 candidatos con stock: se amplía nprobe
+        ids = [i for i, _ in IVFBackend(self.directorio.name, nprobe=1).similares(3, 5, filtros)]
+        self.assertEqual(len(ids), 5)
+        self.assertTrue(all(i % 10 == 0 for i in ids))
+        # Recorriendo todas las listas coincide con el índice exacto
+        self.assertEqual(
+            [i for i, _ in IVFBackend(self.directorio.name, nprobe=8).similares(3, 5, filtros)],
+            [i for i, _ in self.exacto.similares(3, top_n=5, filtros=filtros)],
+        )
+
+
+class EmbeddingFieldTests(TestCase):
+    """Pruebas del almacenamiento binario de embeddings."""
+
+    def test_guarda_float32_y_no_se_serializa(self):
+        categoria = Categoria.objects.create(nombre='Galletas')
+        producto = Producto.objects.create(
+            nombre='Avena', precio=3, categoria=categoria, embedding=[0.5, 1.25, -2.0]
+        )
+        producto.refresh_from_db()
+
+        self.assertEqual(producto.embedding.dtype, np.float32)
+        np.testing.assert_array_equal(producto.embedding, [0.5, 1.25, -2.0])
+        self.assertNotIn('embedding', ProductoSerializer(producto).data)
+
+
+class ProductoListTests(TestCase):
+    """Pruebas del listado de productos."""
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre='Tortas')
+        Producto.objects.create(
+            nombre='Tres leches', precio=12, categoria=categoria, embedding=[1.0, 2.0]
+        )
+
+    def test_sparse_fieldset(self):
+        response = APIClient().get('/api/productos/?fields=id,nombre')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data[0]), {'id', 'nombre'})
+
+    def test_listado_no_lee_embedding(self):
+        # ETag + productos
+        with self.assertNumQueries(2) as contexto:
+            APIClient().get('/api/productos/')
+        self.assertNotIn('."embedding"', contexto.captured_queries[1]['sql'])
+
+
+class BusquedaTests(TestCase):
+    """Pruebas de la búsqueda de texto (?search=) con BM25."""
+
+    def setUp(self):
+        indice_busqueda.invalidar()
+        self.pasteles = Categoria.objects.create(nombre='Pasteles')
+        self.panes = Categoria.objects.create(nombre='Panes')
+        self.torta = Producto.objects.create(
+            nombre='Torta de chocolate', descripcion='Bizcocho húmedo con ganache',
+            precio=20, categoria=self.pasteles
+        )
+        self.brownie = Producto.objects.create(
+            nombre='Brownie', descripcion='Cuadrado de chocolate con nueces',
+            precio=5, categoria=self.pasteles
+        )
+        self.pina = Producto.objects.create(
+            nombre='Pan de piña', descripcion='Relleno de piña', precio=3, categoria=self.panes
+        )
+
+    def tearDown(self):
+        indice_busqueda.invalidar()
+
+    def buscar(self, consulta, **params):
+        response = APIClient().get('/api/productos/', {'search': consulta, **params})
+        self.assertEqual(response.status_code, 200)
+        return [p['id'] for p in response.data]
+
+    def test_analisis(self):
+        self.assertEqual(palabras('Tortas de Piña ÁCIDA'), ['tortas', 'pina', 'acida'])
+        self.assertEqual(
+            [raiz(p) for p in ('tortas', 'panes', 'nueces', 'chocolate', 'pan')],
+            ['tort', 'pan', 'nuez', 'chocolat', 'pan'],
+        )
+
+    def test_nombre_pesa_mas_que_descripcion(self):
+        self.assertEqual(self.buscar('chocolate'), [self.torta.pk, self.brownie.pk])
+
+    def test_tildes_y_plurales(self):
+        self.assertEqual(self.buscar('PINA'), [self.pina.pk])
+        self.assertEqual(self.buscar('tortas'), [self.torta.pk])
+        self.assertEqual(self.buscar('nuez'), [self.brownie.pk])
+
+    def test_todas_las_palabras(self):
+        self.assertEqual(self.buscar('chocolate nueces'), [self.brownie.pk])
+        self.assertEqual(self.buscar('chocolate piña'), [])
+
+    def test_prefijo_en_la_ultima_palabra(self):
+        self.assertEqual(self.buscar('torta choc'), [self.torta.pk])
+        self.assertEqual(self.buscar('bizc'), [self.torta.pk])
+        # Solo la última palabra es prefijo
+        self.assertEqual(self.buscar('bizc humedo'), [])
+
+    def test_respeta_otros_filtros(self):
+        self.assertEqual(self.buscar('chocolate', categoria=self.panes.pk), [])
+        self.assertEqual(self.buscar('de', categoria=self.panes.pk), [])
+        self.assertEqual(self.buscar('piña', categoria=self.panes.pk), [self.pina.pk])
+
+    def test_limite_de_resultados(self):
+        Producto.objects.bulk_create(
+            Producto(nombre=f'Torta {i}', precio=1, categoria=self.pasteles) for i in range(120)
+        )
+        indice_busqueda.invalidar()
+        self.assertEqual(len(self.buscar('torta')), 121)
+        with override_settings(SEARCH_MAX_RESULTS=50):
+            invalidar_catalogo()
+            self.assertEqual(len(self.buscar('torta')), 50)
+
+    def test_lee_las_filas_en_lotes(self):
+        Producto.objects.bulk_create(
+            Producto(nombre=f'Torta {i}', precio=1, categoria=self.pasteles) for i in range(30)
+        )
+        indice_busqueda.invalidar()
+        esperado = [pk for pk, _ in indice_busqueda.buscar('torta')]
+        # Sin un CASE por fila: cada consulta queda bajo el límite de
+        # parámetros (el ETag y tres lotes de 10 más uno de 1)
+        with mock.patch.object(connection.features, 'max_query_params', 10):
+            with self.assertNumQueries(5):
+                self.assertEqual(self.buscar('torta', fields='id'), esperado)
+
+    def test_sin_consultas_al_buscar(self):
+        self.buscar('chocolate')
+        with self.assertNumQueries(0):
+            indice_busqueda.buscar('torta')
+
+    def test_se_mantiene_al_guardar_y_eliminar(self):
+        self.buscar('chocolate')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.brownie.nombre = 'Brownie de avellanas'
+            self.brownie.descripcion = 'Cuadrado con nueces'
+            self.brownie.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.torta.delete()
+        self.assertEqual(indice_busqueda.buscar('chocolate'), [])
+        self.assertEqual([pk for pk, _ in indice_busqueda.buscar('avellana')], [self.brownie.pk])
+
+    def test_reconstruccion_vencida_en_un_solo_thread(self):
+        indice = IndiceBusqueda(ttl=60)
+        indice.cargar([(1, 'Pan', '')])
+        indice._cargado_en -= 120
+        empezo, seguir = threading.Event(), threading.Event()
+        reconstrucciones = []
+
+        def reconstruir():
+            reconstrucciones.append(1)
+            empezo.set()
+            seguir.wait(5)
+            indice.cargar([(1, 'Pan', ''), (2, 'Pan integral', '')])
+
+        with mock.patch.object(indice, 'reconstruir', reconstruir), ThreadPoolExecutor(1) as pool:
+            primera = pool.submit(indice.buscar, 'pan')
+            self.assertTrue(empezo.wait(5))
+            # Mientras tanto se responde con el índice vencido
+            self.assertEqual([pk for pk, _ in indice.buscar('pan')], [1])
+            seguir.set()
+            self.assertEqual(len(primera.result()), 2)
+        self.assertEqual(len(reconstrucciones), 1)
+
+    def test_bm25(self):
+        indice = IndiceBusqueda()
+        indice.cargar([
+            (1, 'Pan', 'pan pan pan'),
+            (2, 'Pan', ''),
+            (3, 'Torta', 'con pan'),
+            (4, 'Galleta', ''),
+        ])
+        ranking = indice.buscar('pan')
+        self.assertEqual([pk for pk, _ in ranking], [1, 2, 3])
+        # Documento 2: f = 3 (nombre), longitud 3; longitudes 6, 3, 4, 3
+        n, df, promedio = 4, 3, 4
+        idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+        esperado = idf * 3 * 2.2 / (3 + 1.2 * (1 - 0.75 + 0.75 * 3 / promedio))
+        self.assertAlmostEqual(dict(ranking)[2], esperado, places=5)
+
+
+@override_settings(
+    EMBEDDING_PROVIDER='productos.embeddings.HashingEmbeddingProvider',
+    SEARCH_QUERY_ENCODER='',
+)
+class BusquedaHibridaTests(TestCase):
+    """Pruebas de /api/productos/search/ (BM25 + embeddings con RRF)."""
+
+    def setUp(self):
+        indice_busqueda.invalidar()
+        embedding_index.invalidar()
+        embeddings_de_consultas.limpiar()
+        self.categoria = Categoria.objects.create(nombre='Dulces')
+        proveedor = HashingEmbeddingProvider()
+        self.productos = {}
+        for nombre, descripcion, stock in (
+            ('Torta de chocolate', 'Bizcocho con cacao', 2),
+            ('Galletas de chocolate', 'Con chispas', 0),
+            ('Pan de maíz', 'Horneado en casa', 4),
+        ):
+            self.productos[nombre] = Producto.objects.create(
+                nombre=nombre, descripcion=descripcion, precio=5, stock=stock,
+                categoria=self.categoria,
+                embedding=proveedor.embed([f'{nombre} {descripcion}'])[0],
+            )
+
+    def tearDown(self):
+        indice_busqueda.invalidar()
+        embedding_index.invalidar()
+        embeddings_de_consultas.limpiar()
+
+    def buscar(self, **params):
+        response = APIClient().get('/api/productos/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return [p['nombre'] for p in response.data]
+
+    def test_fusionar(self):
+        fusion = fusionar([[(1, 9.0), (2, 5.0)], [(2, 0.9), (3, 0.8)]], k=60)
+        self.assertEqual([pk for pk, _ in fusion], [2, 1, 3])
+        self.assertAlmostEqual(dict(fusion)[2], 1 / 62 + 1 / 61)
+
+    def test_combina_lexico_y_semantico(self):
+        resultados = self.buscar(q='torta chocolate')
+        self.assertEqual(resultados[0], 'Torta de chocolate')
+        # "chocolatoso" no está en el índice léxico: la encuentra el embedding
+        self.assertIn('Torta de chocolate', self.buscar(q='chocolatoso', top_n=2))
+
+    def test_filtros(self):
+        self.assertNotIn('Galletas de chocolate', self.buscar(q='chocolate', in_stock='true'))
+        otra = Categoria.objects.create(nombre='Otra')
+        self.assertEqual(self.buscar(q='chocolate', categoria=otra.pk), [])
+
+    def test_en_stock_descuenta_lo_reservado(self):
+        # Con los índices ya cargados: la reserva no envía post_save
+        self.assertIn('Torta de chocolate', self.buscar(q='chocolatoso', in_stock='true'))
+        with self.captureOnCommitCallbacks(execute=True):
+            reservar_stock({self.productos['Torta de chocolate'].pk: 2})
+        # Léxico y semántico ("chocolatoso" solo lo encuentra el embedding)
+        self.assertNotIn('Torta de chocolate', self.buscar(q='torta', in_stock='true'))
+        self.assertNotIn('Torta de chocolate', self.buscar(q='chocolatoso', in_stock='true'))
+
+    def test_lru_evita_el_codificador(self):
+        with mock.patch.object(
+            HashingEmbeddingProvider, 'embed', autospec=True,
+            side_effect=HashingEmbeddingProvider.embed,
+        ) as embed:
+            self.buscar(q='Torta chocolate')
+            self.buscar(q='  torta   CHOCOLATE')
+        self.assertEqual(embed.call_count, 1)
+        self.assertEqual(embeddings_de_consultas.aciertos, 1)
+
+    def test_sin_codificador_sigue_con_lexico(self):
+        with mock.patch.object(HashingEmbeddingProvider, 'embed', side_effect=RuntimeError):
+            with self.assertLogs('productos.busqueda_hibrida', 'WARNING'):
+                resultados = self.buscar(q='maíz')
+        self.assertEqual(resultados, ['Pan de maíz'])
+
+    @override_settings(EMBEDDING_PROVIDER='productos.embeddings.OpenAIEmbeddingProvider')
+    @mock.patch('productos.busqueda_hibrida._avisado_solo_lexica', False)
+    def test_proveedor_remoto_deja_solo_el_lexico(self):
+        self.assertIsNone(get_query_encoder())
+        with mock.patch.object(OpenAIEmbeddingProvider, 'embed') as embed:
+            # Se avisa una sola vez, en la primera búsqueda
+            with self.assertLogs('productos.busqueda_hibrida', 'WARNING') as avisos:
+                self.assertEqual(self.buscar(q='maíz'), ['Pan de maíz'])
+                self.buscar(q='torta')
+        embed.assert_not_called()
+        self.assertEqual(len(avisos.records), 1)
+        self.assertIn(
+            "SEARCH_QUERY_ENCODER='productos.embeddings.OpenAIEmbeddingProvider'", avisos.output[0]
+        )
+
+    @override_settings(
+        SEARCH_QUERY_ENCODER='productos.embeddings.OpenAIEmbeddingProvider',
+        SEARCH_QUERY_TIMEOUT=1.5,
+    )
+    def test_codificador_remoto_con_timeout(self):
+        codificador = get_query_encoder()
+        self.assertEqual((codificador.timeout, codificador.max_retries), (1.5, 0))
+
+    def test_requiere_q(self):
+        response = APIClient().get('/api/productos/search/')
+        self.assertEqual(response.status_code, 400)
+
+    def test_cache_lru(self):
+        cache = CacheLRU(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+
+
+class SugerenciasTests(TestCase):
+    """Pruebas de /api/productos/suggest/ (type-ahead en memoria)."""
+
+    def setUp(self):
+        indice_sugerencias.invalidar()
+        self.usuario = User.objects.create(username='comprador')
+        self.pasteles = Categoria.objects.create(nombre='Pasteles')
+        self.torta = Producto.objects.create(nombre='Torta de chocolate', precio=20, categoria=self.pasteles)
+        self.tarta = Producto.objects.create(nombre='Tarta de manzana', precio=15, categoria=self.pasteles)
+        self.pina = Producto.objects.create(nombre='Pan de piña', precio=3, categoria=self.pasteles)
+
+    def tearDown(self):
+        indice_sugerencias.invalidar()
+
+    def vender(self, producto, veces, status='paid'):
+        for _ in range(veces):
+            orden = Order.objects.create(
+                user=self.usuario, total_amount=0, status=status, billing_name='x',
+                billing_email='x@example.com', billing_phone='', billing_address='',
+                billing_city='',
+            )
+            OrderItem.objects.create(order=orden, producto=producto, cantidad=1)
+
+    def sugerir(self, **params):
+        response = APIClient().get('/api/productos/suggest/', params)
+        self.assertEqual(response.status_code, 200)
+        return [(s['tipo'], s['nombre']) for s in response.data]
+
+    def test_prefijo_de_cualquier_palabra_sin_tildes(self):
+        self.assertEqual(self.sugerir(q='PIN'), [(PRODUCTO, 'Pan de piña')])
+        self.assertEqual(self.sugerir(q='torta de ch'), [(PRODUCTO, 'Torta de chocolate')])
+        # Las stopwords no son el comienzo de una sugerencia
+        self.assertEqual(self.sugerir(q='de'), [])
+
+    def test_incluye_categorias(self):
+        self.assertEqual(self.sugerir(q='past'), [(CATEGORIA, 'Pasteles')])
+
+    def test_ordena_por_ventas_pagadas(self):
+        self.vender(self.tarta, 2)
+        self.vender(self.torta, 1)
+        self.vender(self.torta, 3, status='cancelled')
+        self.assertEqual(
+            self.sugerir(q='t'),
+            [(PRODUCTO, 'Tarta de manzana'), (PRODUCTO, 'Torta de chocolate')],
+        )
+        # La categoría suma las ventas de sus productos
+        self.assertEqual(self.sugerir(q='p')[0], (CATEGORIA, 'Pasteles'))
+
+    def test_top_n(self):
+        self.assertEqual(len(self.sugerir(q='p', top_n=1)), 1)
+        response = APIClient().get('/api/productos/suggest/', {'q': 'p', 'top_n': 50})
+        self.assertEqual(response.status_code, 400)
+
+    def test_requiere_q(self):
+        response = APIClient().get('/api/productos/suggest/')
+        self.assertEqual(response.status_code, 400)
+
+    def test_sin_consultas_a_la_base(self):
+        self.sugerir(q='t')
+        token = Token.objects.create(user=self.usuario)
+        cliente = APIClient()
+        cliente.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        with self.assertNumQueries(0):
+            response = cliente.get('/api/productos/suggest/', {'q': 'torta'})
+        self.assertEqual(response.data, [{'tipo': PRODUCTO, 'id': self.torta.pk, 'nombre': 'Torta de chocolate'}])
+
+    def test_actualizacion_incremental(self):
+        self.vender(self.torta, 2)
+        self.sugerir(q='t')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.torta.nombre = 'Queque de chocolate'
+            self.torta.save()
+            Producto.objects.create(nombre='Trufas', precio=1, categoria=self.pasteles)
+            self.pina.delete()
+            Categoria.objects.create(nombre='Tés')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.sugerir(q='torta'), [])
+            # Conserva las ventas al renombrar
+            self.assertEqual(self.sugerir(q='q'), [(PRODUCTO, 'Queque de chocolate')])
+            self.assertEqual(self.sugerir(q='pan'), [])
+            self.assertEqual(
+                set(self.sugerir(q='t')),
+                {(PRODUCTO, 'Tarta de manzana'), (PRODUCTO, 'Trufas'), (CATEGORIA, 'Tés')},
+            )
+
+    def test_reconstruccion_vencida_en_un_solo_thread(self):
+        indice = IndiceSugerencias(ttl=60)
+        indice.cargar([(1, 'Torta', 1)], [], {})
+        indice._cargado_en -= 120
+        empezo, seguir = threading.Event(), threading.Event()
+        reconstrucciones = []
+
+        def reconstruir():
+            reconstrucciones.append(1)
+            empezo.set()
+            seguir.wait(5)
+            indice.cargar([(1, 'Torta', 1), (2, 'Tarta', 1)], [], {})
+
+        with mock.patch.object(indice, 'reconstruir', reconstruir), ThreadPoolExecutor(1) as pool:
+            primera = pool.submit(indice.sugerir, 't')
+            self.assertTrue(empezo.wait(5))
+            # Mientras tanto se sugiere con el índice vencido
+            self.assertEqual([s['id'] for s in indice.sugerir('t')], [1])
+            seguir.set()
+            self.assertEqual(len(primera.result()), 2)
+        self.assertEqual(len(reconstrucciones), 1)
+
+
+@override_settings(EMBEDDING_PROVIDER='productos.embeddings.HashingEmbeddingProvider')
+class GenerateEmbeddingsCommandTests(TestCase):
+    """Pruebas del comando generate_embeddings con el proveedor local."""
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre='Panes')
+        for i in range(5):
+            Producto.objects.create(nombre=f'Pan {i}', precio=1, categoria=categoria)
+
+    def generar(self):
+        salida = StringIO()
+        call_command('generate_embeddings', batch_size=2, workers=2, stdout=salida)
+        return salida.getvalue()
+
+    def test_genera_solo_pendientes(self):
+        self.assertIn('Productos pendientes: 5', self.generar())
+        self.assertFalse(Producto.objects.filter(embedding__isnull=True).exists())
+        self.assertIn('Productos pendientes: 0', self.generar())
+
+        producto = Producto.objects.first()
+        producto.descripcion = 'Integral con semillas'
+        producto.save()
+        self.assertIn('Productos pendientes: 1', self.generar())
+
+    def test_proveedor_local_es_determinista(self):
+        self.generar()
+        producto = Producto.objects.get(nombre='Pan 0')
+        esperado = HashingEmbeddingProvider().embed(['Pan 0'])[0]
+        np.testing.assert_allclose(producto.embedding, esperado)
+
+
+@override_settings(
+    EMBEDDING_PROVIDER='productos.embeddings.HashingEmbeddingProvider',
+    EMBEDDING_REFRESH_DELAY=0,
+)
+class EmbeddingJobTests(TestCase):
+    """Pruebas de la cola de regeneración de embeddings."""
+
+    def setUp(self):
+        self.categoria = Categoria.objects.create(nombre='Postres')
+
+    def test_ediciones_seguidas_generan_un_solo_trabajo(self):
+        producto = Producto.objects.create(nombre='Flan', precio=4, categoria=self.categoria)
+        for descripcion in ('Casero', 'Casero con caramelo', 'De vainilla'):
+            producto.descripcion = descripcion
+            producto.save()
+
+        self.assertEqual(EmbeddingJob.objects.count(), 1)
+        self.assertEqual(EmbeddingJob.objects.get().version, 4)
+
+    def test_worker_procesa_y_no_reencola(self):
+        producto = Producto.objects.create(nombre='Flan', precio=4, categoria=self.categoria)
+        call_command('process_embedding_jobs', once=True, stdout=StringIO())
+
+        producto.refresh_from_db()
+        self.assertIsNotNone(producto.embedding)
+        self.assertFalse(EmbeddingJob.objects.exists())
+
+        # Guardar sin cambiar el texto no encola nada
+        producto.precio = 5
+        producto.save()
+        self.assertFalse(EmbeddingJob.objects.exists())
+
+
+class VecinosPrecalculadosTests(TestCase):
+    """Pruebas de la tabla de vecinos precalculados."""
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        categoria = Categoria.objects.create(nombre='Bebidas')
+        self.productos = [
+            Producto.objects.create(
+                nombre=f'Bebida {i}', precio=2, categoria=categoria,
+                embedding=rng.standard_normal(6),
+            )
+            for i in range(30)
+        ]
+        self.index = EmbeddingIndex()
+        self.index.reconstruir()
+
+    def tabla(self):
+        return list(ProductoRecomendacion.objects.values_list(
+            'producto_id', 'posicion', 'recomendado_id'
+        ))
+
+    def test_precalculo_coincide_con_el_indice(self):
+        precomputar_todo(top_n=3, index=self.index)
+        for producto in self.productos[:5]:
+            esperado = [pk for pk, _ in self.index.similares(producto.pk, top_n=3)]
+            guardado = list(
+                producto.recomendaciones.values_list('recomendado_id', flat=True)
+            )
+            self.assertEqual(guardado, esperado)
+
+    def test_incremental_equivale_a_recalculo_completo(self):
+        precomputar_todo(top_n=3, index=self.index)
+        cambiado = self.productos[7]
+        cambiado.embedding = self.productos[3].embedding
+        cambiado.save()
+        self.index.actualizar(cambiado.pk, cambiado.embedding)
+
+        recomputar_incremental([cambiado.pk], top_n=3, index=self.index)
+        incremental = self.tabla()
+        precomputar_todo(top_n=3, index=self.index)
+        self.assertCountEqual(incremental, self.tabla())
+
+
+class RecommendEndpointTests(TestCase):
+    """Pruebas del endpoint /api/productos/{id}/recommend/."""
+
+    def setUp(self):
+        embedding_index.invalidar()
+        categoria = Categoria.objects.create(nombre='Pasteles')
+        self.base = Producto.objects.create(
+            nombre='Chocolate', precio=10, categoria=categoria, embedding=[1.0, 0.0, 0.0]
+        )
+        self.cercano = Producto.objects.create(
+            nombre='Brownie', precio=8, categoria=categoria, embedding=[0.9, 0.1, 0.0]
+        )
+        self.lejano = Producto.objects.create(
+            nombre='Limón', precio=9, categoria=categoria, embedding=[0.0, 0.0, 1.0]
+        )
+        Producto.objects.create(nombre='Sin embedding', precio=5, categoria=categoria)
+
+    def tearDown(self):
+        embedding_index.invalidar()
+
+    def test_recommend_ordena_por_similitud(self):
+        response = APIClient().get(f'/api/productos/{self.base.pk}/recommend/')
+        self.assertEqual(response.status_code, 200)
+        ids = [p['id'] for p in response.data]
+        self.assertEqual(ids, [self.cercano.pk, self.lejano.pk])
+
+    def recomendados(self, consulta):
+        response = APIClient().get(f'/api/productos/{self.base.pk}/recommend/?{consulta}')
+        self.assertEqual(response.status_code, 200)
+        return [p['id'] for p in response.data]
+
+    def test_filtros_de_stock_categoria_y_precio(self):
+        Producto.objects.filter(pk=self.lejano.pk).update(stock=3)
+        otra = Categoria.objects.create(nombre='Helados')
+        helado = Producto.objects.create(
+            nombre='Helado', precio=10, categoria=otra, stock=1, embedding=[1.0, 0.05, 0.0]
+        )
+
+        self.assertEqual(self.recomendados('in_stock=true'), [helado.pk, self.lejano.pk])
+        self.assertEqual(
+            self.recomendados('misma_categoria=true'), [self.cercano.pk, self.lejano.pk]
+        )
+        self.assertEqual(self.recomendados(f'categoria={otra.pk}'), [helado.pk])
+        self.assertEqual(self.recomendados('banda_precio=0.1'), [helado.pk, self.lejano.pk])
+        self.assertEqual(self.recomendados('top_n=1'), [helado.pk])
+
+    def test_en_stock_sigue_las_reservas(self):
+        Producto.objects.filter(pk__in=[self.cercano.pk, self.lejano.pk]).update(stock=2)
+        self.assertEqual(self.recomendados('in_stock=true'), [self.cercano.pk, self.lejano.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            reservar_stock({self.cercano.pk: 2})
+        self.assertEqual(self.recomendados('in_stock=true'), [self.lejano.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            liberar_reserva({self.cercano.pk: 1})
+        self.assertEqual(self.recomendados('in_stock=true'), [self.cercano.pk, self.lejano.pk])
+
+    def test_recommend_lote(self):
+        response = APIClient().post(
+            '/api/productos/recommend/',
+            {'ids': [self.base.pk, self.lejano.pk], 'top_n': 2},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(r['producto'], [p['id'] for p in r['recomendados']])
+             for r in response.data['recomendaciones']],
+            [(self.base.pk, [self.cercano.pk]), (self.lejano.pk, [self.cercano.pk])],
+        )
+        self.assertEqual(
+            [p['id'] for p in response.data['tambien_te_puede_gustar']], [self.cercano.pk]
+        )
+
+    def test_recommend_lote_valida_ids(self):
+        response = APIClient().post('/api/productos/recommend/', {'ids': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_parametros_invalidos(self):
+        response = APIClient().get(f'/api/productos/{self.base.pk}/recommend/?top_n=0')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('top_n', response.data)
+
+    def test_promocion_actualiza_el_indice(self):
+        self.assertEqual(self.recomendados('en_promocion=true'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            promocion = Promocion.objects.create(producto=self.lejano, descuento=10)
+        self.assertEqual(self.recomendados('en_promocion=true'), [self.lejano.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            promocion.delete()
+        self.assertEqual(self.recomendados('en_promocion=true'), [])
+
+
+class ComprasConjuntasTests(TestCase):
+    """Pruebas del filtrado colaborativo por compras conjuntas."""
+
+    def setUp(self):
+        matriz_co_compras.invalidar()
+        embedding_index.invalidar()
+        self.usuario = User.objects.create(username='comprador')
+        categoria = Categoria.objects.create(nombre='Desayunos')
+        self.cafe, self.leche, self.pan, self.te = [
+            Producto.objects.create(nombre=nombre, precio=2, categoria=categoria,
+                                    embedding=embedding)
+            for nombre, embedding in [
+                ('Café', [1.0, 0.0]), ('Leche', [0.0, 1.0]),
+                ('Pan', [0.6, 0.8]), ('Té', [0.95, 0.3]),
+            ]
+        ]
+
+    def tearDown(self):
+        matriz_co_compras.invalidar()
+        embedding_index.invalidar()
+
+    def orden(self, *productos, status='pending'):
+        orden = Order.objects.create(
+            user=self.usuario, total_amount=0, status=status, billing_name='x',
+            billing_email='x@example.com', billing_phone='', billing_address='',
+            billing_city='',
+        )
+        for producto in productos:
+            OrderItem.objects.create(order=orden, producto=producto, cantidad=1)
+        return orden
+
+    def conteos(self):
+        return set(CoCompra.objects.values_list('producto_id', 'otro_id', 'ordenes'))
+
+    def test_pagar_registra_una_sola_vez(self):
+        orden = self.orden(self.cafe, self.leche)
+        with self.captureOnCommitCallbacks(execute=True):
+            orden.status = 'paid'
+            orden.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            orden.status = 'completed'
+            orden.save()
+        self.assertFalse(registrar_orden(orden.pk))
+
+        a, b = self.cafe.pk, self.leche.pk
+        self.assertEqual(self.conteos(), {(a, a, 1), (a, b, 1), (b, a, 1), (b, b, 1)})
+
+    def test_incremental_equivale_a_reconstruccion(self):
+        for productos in [(self.cafe, self.leche), (self.cafe, self.leche, self.pan), (self.pan,)]:
+            registrar_orden(self.orden(*productos, status='paid').pk)
+        self.orden(self.cafe, self.te)  # pendiente: no cuenta
+        incremental = self.conteos()
+
+        self.assertEqual(reconstruir_todo(), (3, 9))
+        self.assertEqual(self.conteos(), incremental)
+
+    def test_similitud_coseno_de_compras(self):
+        matriz = MatrizCoCompras()
+        # café: 4 órdenes, leche: 1, pan: 2; café+leche 1, café+pan 2
+        matriz.cargar([(1, 1, 4), (2, 2, 1), (3, 3, 2), (1, 2, 1), (2, 1, 1), (1, 3, 2), (3, 1, 2)])
+        similares = matriz.similares(1, top_n=5)
+        self.assertEqual([pk for pk, _ in similares], [3, 2])
+        np.testing.assert_allclose([s for _, s in similares], [2 / np.sqrt(8), 1 / 2], rtol=1e-6)
+        self.assertNotIn(4, matriz)
+
+    def test_reconstruccion_vencida_en_un_solo_thread(self):
+        matriz = MatrizCoCompras(ttl=60)
+        matriz.cargar([(1, 1, 1), (2, 2, 1), (1, 2, 1), (2, 1, 1)])
+        matriz._cargado_en -= 120
+        empezo, seguir = threading.Event(), threading.Event()
+        reconstrucciones = []
+
+        def reconstruir():
+            reconstrucciones.append(1)
+            empezo.set()
+            seguir.wait(5)
+            matriz.cargar([(1, 1, 1), (3, 3, 1), (1, 3, 1), (3, 1, 1)])
+
+        with mock.patch.object(matriz, 'reconstruir', reconstruir), ThreadPoolExecutor(1) as pool:
+            primera = pool.submit(matriz.similares, 1)
+            self.assertTrue(empezo.wait(5))
+            # Mientras tanto se consulta la matriz vencida
+            self.assertEqual([pk for pk, _ in matriz.similares(1)], [2])
+            seguir.set()
+            self.assertEqual([pk for pk, _ in primera.result()], [3])
+        self.assertEqual(len(reconstrucciones), 1)
+
+    def test_recommend_hibrido(self):
+        # Por embeddings la leche es lo menos parecido al café; con las
+        # compras conjuntas pasa al primer lugar
+        for _ in range(3):
+            registrar_orden(self.orden(self.cafe, self.leche, status='paid').pk)
+        url = f'/api/productos/{self.cafe.pk}/recommend/?top_n=2'
+
+        with self.settings(RECOMMENDATION_COPURCHASE_WEIGHT=0):
+            precomputar_todo()
+            ids = [p['id'] for p in APIClient().get(url).data]
+        self.assertEqual(ids, [self.te.pk, self.pan.pk])
+
+        with self.settings(RECOMMENDATION_COPURCHASE_WEIGHT=0.5):
+            call_command('refresh_copurchases', stdout=StringIO())
+            # El producto y sus vecinos precalculados, como sin compras
+            with self.assertNumQueries(2):
+                ids = [p['id'] for p in APIClient().get(url).data]
+        self.assertEqual(ids, [self.leche.pk, self.te.pk])
+        score = ProductoRecomendacion.objects.get(
+            producto=self.cafe, recomendado=self.leche
+        ).score
+        self.assertAlmostEqual(score, 0.5, places=5)
+
+    def test_incremental_con_compras_equivale_a_completo(self):
+        for _ in range(2):
+            registrar_orden(self.orden(self.cafe, self.pan, status='paid').pk)
+
+        def tabla():
+            return set(ProductoRecomendacion.objects.values_list(
+                'producto_id', 'recomendado_id', 'posicion'
+            ))
+
+        with self.settings(RECOMMENDATION_COPURCHASE_WEIGHT=0.5):
+            precomputar_todo(top_n=2)
+            Producto.objects.filter(pk=self.te.pk).update(embedding=[0.0, 1.0])
+            embedding_index.invalidar()
+            recomputar_incremental([self.te.pk], top_n=2)
+            incremental = tabla()
+            precomputar_todo(top_n=2)
+        self.assertEqual(incremental, tabla())
+
+
+class StockTests(TestCase):
+    """Pruebas de los movimientos de stock con UPDATE condicional."""
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre='Panadería')
+        self.pan, self.torta = Producto.objects.bulk_create([
+            Producto(nombre='Pan', precio=1, stock=5, categoria=categoria),
+            Producto(nombre='Torta', precio=9, stock=1, categoria=categoria),
+        ])
+
+    def stocks(self):
+        return dict(Producto.objects.values_list('nombre', 'stock'))
+
+    def test_descuenta_todo_con_un_update(self):
+        # SAVEPOINT, UPDATE y RELEASE
+        with self.assertNumQueries(3):
+            faltantes = descontar_stock({self.pan.pk: 2, self.torta.pk: 1})
+        self.assertEqual(faltantes, {})
+        self.assertEqual(self.stocks(), {'Pan': 3, 'Torta': 0})
+
+    def test_faltante_no_descuenta_nada(self):
+        faltantes = descontar_stock({self.pan.pk: 2, self.torta.pk: 3, 999999: 1})
+        self.assertEqual(set(faltantes), {self.torta.pk, 999999})
+        self.assertEqual(faltantes[self.torta.pk].disponible, 1)
+        self.assertIsNone(faltantes[999999].disponible)
+        self.assertEqual(self.stocks(), {'Pan': 5, 'Torta': 1})
+
+    def test_parcial_descuenta_los_que_alcanzan(self):
+        faltantes = descontar_stock({self.pan.pk: 2, self.torta.pk: 3}, parcial=True)
+        self.assertEqual(list(faltantes), [self.torta.pk])
+        self.assertEqual(self.stocks(), {'Pan': 3, 'Torta': 1})
+
+    def test_reservas_restan_de_lo_disponible(self):
+        self.assertEqual(reservar_stock({self.pan.pk: 4}), {})
+        faltantes = descontar_stock({self.pan.pk: 2})
+        self.assertEqual(faltantes[self.pan.pk].disponible, 1)
+        consumir_reserva({self.pan.pk: 4})
+        self.pan.refresh_from_db()
+        self.assertEqual((self.pan.stock, self.pan.reservado), (1, 0))
+
+    def test_avisa_los_movidos_al_confirmar(self):
+        avisos = []
+
+        def recibir(sender, ids, **kwargs):
+            avisos.append(ids)
+
+        stock_movido.connect(recibir)
+        self.addCleanup(stock_movido.disconnect, recibir)
+        with self.captureOnCommitCallbacks(execute=True):
+            reservar_stock({self.pan.pk: 1})
+            self.assertEqual(avisos, [])
+            descontar_stock({self.pan.pk: 1, self.torta.pk: 3}, parcial=True)
+            descontar_stock({self.torta.pk: 3})
+            liberar_reserva({self.pan.pk: 1})
+            consumir_reserva({})
+            reponer_stock({self.torta.pk: 1})
+        self.assertEqual(avisos, [{self.pan.pk}, {self.pan.pk}, {self.pan.pk}, {self.torta.pk}])
+
+    def test_reponer(self):
+        reponer_stock({self.pan.pk: 1, self.torta.pk: 4})
+        self.assertEqual(self.stocks(), {'Pan': 6, 'Torta': 5})
+
+    def test_import_stock(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as archivo:
+            archivo.write(
+                f'producto_id,cantidad\n{self.pan.pk},10\n{self.pan.pk},-3\n{self.torta.pk},-2\n'
+            )
+        self.addCleanup(os.remove, archivo.name)
+        errores = StringIO()
+        call_command('import_stock', archivo.name, stdout=StringIO(), stderr=errores)
+        self.assertEqual(self.stocks(), {'Pan': 12, 'Torta': 1})
+        self.assertIn(f'Producto {self.torta.pk}', errores.getvalue())
+
+
+class StockConcurrenteTests(TransactionTestCase):
+    """Muchos hilos descontando el mismo producto a la vez."""
+
+    def test_stock_nunca_queda_negativo(self):
+        categoria = Categoria.objects.create(nombre='Ofertas')
+        producto = Producto.objects.create(
+            nombre='Último modelo', precio=100, stock=25, categoria=categoria
+        )
+
+        def comprar(_):
+            try:
+                return not descontar_stock({producto.pk: 1})
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            resultados = list(pool.map(comprar, range(60)))
+
+        producto.refresh_from_db()
+        self.assertEqual(resultados.count(True), 25)
+        self.assertEqual(producto.stock, 0)
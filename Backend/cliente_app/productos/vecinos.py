@@ -0,0 +1,202 @@
+"""
+Precálculo de vecinos más cercanos (tabla ProductoRecomendacion).
+
+El catálogo cambia mucho menos de lo que se consultan las páginas de
+producto, así que los top-N vecinos de cada producto se calculan por
+adelantado con multiplicaciones matriciales por bloques sobre el índice
+vectorial, y el endpoint recommend solo hace una consulta indexada.
+
+Cuando cambian algunos embeddings solo se recalculan las filas afectadas:
+las de los productos cambiados, las que los contenían como vecino y las
+en las que un producto cambiado supera ahora al último vecino guardado.
+
+Con RECOMMENDATION_COPURCHASE_WEIGHT > 0 el score guardado es el híbrido
+
+    (1 - peso) * coseno(embeddings) + peso * coseno(compras conjuntas)
+
+con la matriz de productos.compras_conjuntas alineada a las filas del
+índice, así que el endpoint sigue siendo una sola consulta también para
+los productos con compras conjuntas.
+"""
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min
+
+from .vector_index import embedding_index, top_n_por_fila
+
+
+# Máximo de scores float32 por bloque de la multiplicación (~64 MB)
+MAX_ELEMENTOS_BLOQUE = 2 ** 24
+
+LOTE_INSERCION = 5000
+
+
+def vecinos_por_producto():
+    """Cantidad de vecinos que se guardan por producto."""
+    return getattr(settings, 'RECOMMENDATION_PRECOMPUTED_N', 10)
+
+
+def compras_alineadas(ids):
+    """
+    (peso, similitudes por compras conjuntas alineadas a `ids`), o
+    (0, None) si el peso es 0.
+    """
+    from .compras_conjuntas import matriz_co_compras, peso_co_compras
+
+    peso = peso_co_compras()
+    if not peso:
+        return 0.0, None
+    return peso, matriz_co_compras.alineada(ids)
+
+
+def _combinar(similitudes, compras, peso):
+    """Score híbrido (en el lugar) de un bloque de similitudes de embeddings."""
+    similitudes *= 1 - peso
+    similitudes += peso * compras.toarray()
+    return similitudes
+
+
+def calcular_vecinos(matriz, filas, top_n, compras=None, peso=0.0):
+    """
+    Calcula los top_n vecinos de las filas indicadas contra toda la matriz,
+    por bloques para acotar la memoria. Con `compras` (CSR alineada a las
+    filas de la matriz) el score es el híbrido con ese peso. Retorna
+    (vecinos, scores), ambos de forma (len(filas), top_n), con posiciones
+    de fila en `vecinos`.
+    """
+    total = matriz.shape[0]
+    top_n = max(0, min(top_n, total - 1))
+    vecinos = np.empty((len(filas), top_n), dtype=np.int64)
+    scores = np.empty((len(filas), top_n), dtype=np.float32)
+    if top_n == 0:
+        return vecinos, scores
+
+    tamano_bloque = max(1, MAX_ELEMENTOS_BLOQUE // total)
+    for inicio in range(0, len(filas), tamano_bloque):
+        bloque = filas[inicio:inicio + tamano_bloque]
+        similitudes = matriz[bloque] @ matriz.T
+        if compras is not None:
+            _combinar(similitudes, compras[bloque], peso)
+        # Un producto no se recomienda a sí mismo
+        similitudes[np.arange(len(bloque)), bloque] = -np.inf
+        mejores = top_n_por_fila(similitudes, top_n)
+        vecinos[inicio:inicio + len(bloque)] = mejores
+        scores[inicio:inicio + len(bloque)] = np.take_along_axis(similitudes, mejores, axis=1)
+    return vecinos, scores
+
+
+def _guardar(ids, filas, vecinos, scores):
+    """Reemplaza en la tabla las recomendaciones de las filas indicadas."""
+    from .models import ProductoRecomendacion
+
+    productos = [int(ids[f]) for f in filas]
+    ProductoRecomendacion.objects.filter(producto_id__in=productos).delete()
+
+    pendientes = []
+    for producto_id, fila_vecinos, fila_scores in zip(productos, vecinos, scores):
+        for posicion, (vecino, score) in enumerate(zip(fila_vecinos, fila_scores)):
+            pendientes.append(ProductoRecomendacion(
+                producto_id=producto_id,
+                recomendado_id=int(ids[vecino]),
+                posicion=posicion,
+                score=float(score),
+            ))
+        if len(pendientes) >= LOTE_INSERCION:
+            ProductoRecomendacion.objects.bulk_create(pendientes)
+            pendientes = []
+    if pendientes:
+        ProductoRecomendacion.objects.bulk_create(pendientes)
+
+
+def precomputar_todo(top_n=None, index=None):
+    """Recalcula la tabla completa. Retorna la cantidad de productos."""
+    from .models import ProductoRecomendacion
+
+    if index is None:
+        index = embedding_index
+    top_n = top_n or vecinos_por_producto()
+    ids, matriz = index.datos()
+    filas = np.arange(len(ids))
+    peso, compras = compras_alineadas(ids)
+    vecinos, scores = calcular_vecinos(matriz, filas, top_n, compras, peso)
+
+    with transaction.atomic():
+        ProductoRecomendacion.objects.all().delete()
+        _guardar(ids, filas, vecinos, scores)
+    return len(ids)
+
+
+def filas_afectadas(producto_ids, top_n=None, index=None, compras=None, peso=0.0):
+    """
+    Filas del índice cuyas recomendaciones pueden cambiar porque cambió
+    (o se eliminó) el embedding de producto_ids. `compras` y `peso` como
+    en calcular_vecinos.
+    """
+    from .models import ProductoRecomendacion
+
+    if index is None:
+        index = embedding_index
+    top_n = top_n or vecinos_por_producto()
+    ids, matriz = index.datos()
+    esperado = min(top_n, len(ids) - 1)
+    if esperado <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    # Score del último vecino guardado de cada producto; -inf si la lista
+    # está incompleta (producto nuevo o vecino eliminado), lo que la marca
+    # como afectada.
+    umbral = np.full(len(ids), -np.inf, dtype=np.float32)
+    completas = [
+        (fila['producto_id'], fila['ultimo'])
+        for fila in ProductoRecomendacion.objects.order_by().values('producto_id').annotate(
+            cantidad=Count('id'), ultimo=Min('score')
+        ).iterator()
+        if fila['cantidad'] >= esperado and fila['producto_id'] in index
+    ]
+    if completas:
+        umbral[index.filas([pk for pk, _ in completas])] = [score for _, score in completas]
+    afectadas = umbral == -np.inf
+
+    cambiadas = index.filas(producto_ids)
+    afectadas[cambiadas] = True
+
+    contenedores = ProductoRecomendacion.objects.filter(
+        recomendado_id__in=list(producto_ids)
+    ).values_list('producto_id', flat=True)
+    afectadas[index.filas(set(contenedores))] = True
+
+    if len(cambiadas):
+        similitudes = matriz @ matriz[cambiadas].T
+        if compras is not None:
+            _combinar(similitudes, compras[:, cambiadas], peso)
+        similitudes[cambiadas, np.arange(len(cambiadas))] = -np.inf
+        afectadas |= similitudes.max(axis=1) > umbral
+
+    return np.flatnonzero(afectadas)
+
+
+def recomputar_incremental(producto_ids, top_n=None, index=None):
+    """
+    Recalcula solo las filas afectadas por cambios en producto_ids.
+    Retorna la cantidad de productos recalculados.
+    """
+    from .models import ProductoRecomendacion
+
+    if index is None:
+        index = embedding_index
+    top_n = top_n or vecinos_por_producto()
+    producto_ids = list(producto_ids)
+    ids, matriz = index.datos()
+    peso, compras = compras_alineadas(ids)
+    filas = filas_afectadas(producto_ids, top_n=top_n, index=index, compras=compras, peso=peso)
+    vecinos, scores = calcular_vecinos(matriz, filas, top_n, compras, peso)
+
+    with transaction.atomic():
+        # Productos que ya no están en el índice (sin embedding o eliminados)
+        ProductoRecomendacion.objects.filter(
+            producto_id__in=[pk for pk in producto_ids if pk not in index]
+        ).delete()
+        _guardar(ids, filas, vecinos, scores)
+    return len(filas)
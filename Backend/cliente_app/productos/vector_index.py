@@ -0,0 +1,422 @@
+"""
+Índice vectorial en memoria para las recomendaciones de productos.
+
+Cada proceso (worker) mantiene una matriz float32 con los embeddings ya
+normalizados, de modo que una consulta es un único producto matriz-vector
+seguido de una selección top-k con argpartition, sin volver a leer ni
+convertir los embeddings desde la base de datos en cada request.
+
+Junto a la matriz se guardan, alineados por fila, la categoría, el stock
+disponible (stock - reservado), el precio y si el producto tiene una
+promoción activa. Los filtros de la
+API se aplican como máscaras booleanas sobre esos arreglos antes de
+ordenar, así que filtrar no agrega consultas ni serializa descartes.
+
+El índice se construye de forma perezosa en la primera consulta, se
+actualiza con las señales de guardado/borrado de Producto y Promocion (y
+lo disponible, con stock_movido de los movimientos de productos.stock) y se
+reconstruye cuando supera RECOMMENDATION_INDEX_TTL segundos, para recoger
+los cambios hechos desde otros workers (o con updates masivos).
+"""
+
+import threading
+import time
+
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+from django.db.models import F
+
+
+# Metadatos de filtrado por fila: nombre -> (dtype, valor por defecto)
+METADATOS = {
+    'categoria': (np.int64, -1),
+    'disponible': (np.int64, 0),
+    'precio': (np.float64, np.nan),
+    'promocion': (np.bool_, False),
+}
+
+
+def normalizar(vectores):
+    """Normaliza vectores (1D o 2D) a norma L2 unitaria en float32."""
+    vectores = np.asarray(vectores, dtype=np.float32)
+    normas = np.linalg.norm(vectores, axis=-1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return vectores / normas
+
+
+def top_k(scores, k):
+    """
+    Retorna las posiciones de los k mayores scores, de mayor a menor.
+    Usa argpartition (O(n)) y solo ordena los k seleccionados.
+    """
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k >= n:
+        return np.argsort(-scores, kind='stable')
+    candidatos = np.argpartition(-scores, k - 1)[:k]
+    return candidatos[np.argsort(-scores[candidatos], kind='stable')]
+
+
+def top_n_por_fila(scores, top_n):
+    """Posiciones de los top_n scores de cada fila, de mayor a menor."""
+    columnas = scores.shape[1]
+    k = min(top_n, columnas)
+    if k < columnas:
+        candidatos = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidatos = np.broadcast_to(np.arange(columnas), scores.shape)
+    orden = np.argsort(-np.take_along_axis(scores, candidatos, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(candidatos, orden, axis=1)
+
+
+def construir_mascara(filtros, metadatos):
+    """
+    Máscara booleana de las filas que cumplen los filtros, o None si no
+    hay filtros. Claves admitidas: categoria, en_stock, precio_min,
+    precio_max y en_promocion.
+    """
+    if not filtros:
+        return None
+    mascara = np.ones(len(metadatos['disponible']), dtype=bool)
+    if filtros.get('categoria') is not None:
+        mascara &= metadatos['categoria'] == int(filtros['categoria'])
+    if filtros.get('en_stock'):
+        mascara &= metadatos['disponible'] > 0
+    if filtros.get('precio_min') is not None:
+        mascara &= metadatos['precio'] >= float(filtros['precio_min'])
+    if filtros.get('precio_max') is not None:
+        mascara &= metadatos['precio'] <= float(filtros['precio_max'])
+    if filtros.get('en_promocion'):
+        mascara &= metadatos['promocion']
+    return mascara
+
+
+def productos_en_promocion():
+    """Ids de productos con al menos una promoción activa."""
+    Promocion = apps.get_model('promocion', 'Promocion')
+    return set(
+        Promocion.objects.filter(activo=True).values_list('producto_id', flat=True)
+    )
+
+
+def metadatos_de(producto):
+    """Metadatos de filtrado de una instancia (omite campos diferidos)."""
+    diferidos = producto.get_deferred_fields()
+    metadatos = {}
+    if 'categoria_id' not in diferidos:
+        metadatos['categoria'] = producto.categoria_id
+    if not {'stock', 'reservado'} & diferidos:
+        metadatos['disponible'] = producto.disponible
+    if 'precio' not in diferidos and producto.precio is not None:
+        metadatos['precio'] = float(producto.precio)
+    return metadatos
+
+
+class EmbeddingIndex:
+    """
+    Matriz de embeddings normalizados con su mapeo id de producto -> fila
+    y los metadatos de filtrado alineados por fila.
+    Todas las operaciones están protegidas por un lock para poder usarse
+    desde varios threads del mismo worker; las reconstrucciones, por otro
+    (_reconstruccion), que no bloquea las consultas.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._reconstruccion = threading.Lock()
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._matriz = np.empty((0, 0), dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._meta = {
+            nombre: np.empty(0, dtype=dtype) for nombre, (dtype, _) in METADATOS.items()
+        }
+        self._tamano = 0
+        self._posiciones = {}
+        self._cargado = False
+        self._cargado_en = 0.0
+
+    # ------------------------------------------------------------------
+    # Carga
+    # ------------------------------------------------------------------
+
+    def cargar(self, filas, promociones=()):
+        """
+        Reemplaza el contenido del índice. Cada fila es (id, embedding) o
+        (id, embedding, categoria, disponible, precio); `promociones` son los
+        ids con una promoción activa.
+        """
+        ids = []
+        vectores = []
+        columnas = ('categoria', 'disponible', 'precio')
+        meta = {nombre: [] for nombre in columnas}
+        dimension = None
+        for pk, embedding, *datos in filas:
+            if embedding is None or len(embedding) == 0:
+                continue
+            if dimension is None:
+                dimension = len(embedding)
+            if len(embedding) != dimension:
+                continue
+            ids.append(pk)
+            vectores.append(np.asarray(embedding, dtype=np.float32))
+            for nombre, valor in zip(columnas, datos or (None,) * len(columnas)):
+                meta[nombre].append(METADATOS[nombre][1] if valor is None else valor)
+
+        with self._lock:
+            self._reiniciar()
+            if ids:
+                self._matriz = normalizar(np.vstack(vectores))
+                self._ids = np.asarray(ids, dtype=np.int64)
+                for nombre, valores in meta.items():
+                    self._meta[nombre] = np.asarray(valores, dtype=METADATOS[nombre][0])
+                self._meta['promocion'] = np.isin(self._ids, list(promociones))
+                self._tamano = len(ids)
+                self._posiciones = {pk: i for i, pk in enumerate(ids)}
+            self._cargado = True
+            self._cargado_en = time.monotonic()
+
+    def reconstruir(self):
+        """Carga todos los productos con embedding desde la base de datos."""
+        from .models import Producto
+
+        filas = Producto.objects.filter(embedding__isnull=False).values_list(
+            'id', 'embedding', 'categoria_id', F('stock') - F('reservado'), 'precio'
+        )
+        self.cargar(filas.iterator(chunk_size=2000), productos_en_promocion())
+
+    def invalidar(self):
+        """Descarta el contenido; se reconstruirá en la próxima consulta."""
+        with self._lock:
+            self._reiniciar()
+
+    def _vigente(self):
+        with self._lock:
+            expirado = (
+                self.ttl is not None
+                and time.monotonic() - self._cargado_en > self.ttl
+            )
+            return self._cargado and not expirado
+
+    def _asegurar_cargado(self):
+        if self._vigente():
+            return
+        # Igual que productos.busqueda.IndiceBusqueda: un solo thread
+        # reconstruye, los demás siguen con la matriz vencida; solo
+        # la primera carga hace esperar
+        if not self._reconstruccion.acquire(blocking=not self._cargado):
+            return
+        try:
+            if not self._vigente():
+                self.reconstruir()
+        finally:
+            self._reconstruccion.release()
+
+    @property
+    def cargado(self):
+        return self._cargado
+
+    @property
+    def dimension(self):
+        return self._matriz.shape[1] if self._matriz.ndim == 2 else 0
+
+    def __len__(self):
+        return self._tamano
+
+    def __contains__(self, pk):
+        return pk in self._posiciones
+
+    # ------------------------------------------------------------------
+    # Actualizaciones incrementales
+    # ------------------------------------------------------------------
+
+    def actualizar(self, pk, embedding, **metadatos):
+        """
+        Inserta o reemplaza el vector de un producto y, si se indican,
+        sus metadatos (categoria, disponible, precio).
+        """
+        if embedding is None or len(embedding) == 0:
+            self.eliminar(pk)
+            return
+
+        with self._lock:
+            if not self._cargado:
+                # Se construirá completo en la primera consulta
+                return
+            vector = normalizar(embedding)
+            if self._tamano and vector.shape[0] != self.dimension:
+                return
+
+            fila = self._posiciones.get(pk)
+            if fila is None:
+                fila = self._tamano
+                self._reservar(fila + 1, vector.shape[0])
+                self._ids[fila] = pk
+                for nombre, (_, vacio) in METADATOS.items():
+                    self._meta[nombre][fila] = vacio
+                self._posiciones[pk] = fila
+                self._tamano += 1
+            self._matriz[fila] = vector
+            self.actualizar_metadatos(pk, **metadatos)
+
+    def actualizar_metadatos(self, pk, **metadatos):
+        """Actualiza categoria, disponible, precio y/o promocion de un producto."""
+        with self._lock:
+            fila = self._posiciones.get(pk)
+            if fila is None:
+                return
+            for nombre, valor in metadatos.items():
+                if valor is not None:
+                    self._meta[nombre][fila] = valor
+
+    def eliminar(self, pk):
+        """Quita un producto moviendo la última fila a su posición."""
+        with self._lock:
+            fila = self._posiciones.pop(pk, None)
+            if fila is None:
+                return
+            ultima = self._tamano - 1
+            if fila != ultima:
+                self._matriz[fila] = self._matriz[ultima]
+                self._ids[fila] = self._ids[ultima]
+                for arreglo in self._meta.values():
+                    arreglo[fila] = arreglo[ultima]
+                self._posiciones[int(self._ids[fila])] = fila
+            self._tamano = ultima
+
+    def _reservar(self, filas, dimension):
+        """Crece la capacidad de la matriz duplicándola (amortizado O(1))."""
+        capacidad = self._matriz.shape[0] if self._matriz.ndim == 2 else 0
+        if self._tamano == 0 and self.dimension != dimension:
+            capacidad = 0
+        if filas <= capacidad:
+            return
+        nueva = max(filas, capacidad * 2, 16)
+        matriz = np.zeros((nueva, dimension), dtype=np.float32)
+        ids = np.zeros(nueva, dtype=np.int64)
+        matriz[:self._tamano] = self._matriz[:self._tamano]
+        ids[:self._tamano] = self._ids[:self._tamano]
+        for nombre, arreglo in self._meta.items():
+            ampliado = np.zeros(nueva, dtype=arreglo.dtype)
+            ampliado[:self._tamano] = arreglo[:self._tamano]
+            self._meta[nombre] = ampliado
+        self._matriz = matriz
+        self._ids = ids
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    def datos(self):
+        """
+        Retorna (ids, matriz) del contenido actual. Son vistas sin copia:
+        pensado para procesos batch que no modifican el índice mientras
+        las usan.
+        """
+        self._asegurar_cargado()
+        with self._lock:
+            return self._ids[:self._tamano], self._matriz[:self._tamano]
+
+    def filas(self, ids):
+        """Posiciones en la matriz de los ids indexados (omite los ausentes)."""
+        self._asegurar_cargado()
+        with self._lock:
+            return np.asarray(
+                [self._posiciones[pk] for pk in ids if pk in self._posiciones],
+                dtype=np.int64,
+            )
+
+    def vector(self, pk):
+        """Retorna una copia del vector normalizado de un producto, o None."""
+        self._asegurar_cargado()
+        with self._lock:
+            fila = self._posiciones.get(pk)
+            if fila is None:
+                return None
+            return self._matriz[fila].copy()
+
+    def mascara(self, filtros):
+        """Máscara de las filas que cumplen los filtros (None si no hay)."""
+        with self._lock:
+            return construir_mascara(filtros, {
+                nombre: arreglo[:self._tamano] for nombre, arreglo in self._meta.items()
+            })
+
+    def buscar(self, vector, top_n=4, excluir=(), filtros=None):
+        """
+        Retorna [(id, score), ...] de los top_n productos más similares
+        al vector dado (similitud coseno), excluyendo los ids indicados y
+        los que no cumplen los filtros.
+        """
+        self._asegurar_cargado()
+        consulta = normalizar(vector)
+        with self._lock:
+            if self._tamano == 0 or consulta.shape[0] != self.dimension:
+                return []
+            scores = self._matriz[:self._tamano] @ consulta
+            mascara = self.mascara(filtros)
+            if mascara is not None:
+                scores[~mascara] = -np.inf
+            for pk in excluir:
+                fila = self._posiciones.get(pk)
+                if fila is not None:
+                    scores[fila] = -np.inf
+            posiciones = top_k(scores, top_n + len(excluir))
+            resultados = [
+                (int(self._ids[i]), float(scores[i]))
+                for i in posiciones
+                if np.isfinite(scores[i])
+            ]
+        return resultados[:top_n]
+
+    def similares(self, pk, top_n=4, filtros=None):
+        """Productos más similares a otro producto ya indexado."""
+        vector = self.vector(pk)
+        if vector is None:
+            return []
+        return self.buscar(vector, top_n=top_n, excluir=(pk,), filtros=filtros)
+
+    def similares_lote(self, pks, top_n=4, top_n_agregado=None, filtros=None):
+        """
+        Recomendaciones de varios productos con un solo producto
+        matriz-matriz. Retorna ({pk: [(id, score), ...]}, agregadas), donde
+        agregadas ordena por la similitud media con todos los consultados.
+        Los productos consultados se excluyen de todos los resultados.
+        """
+        self._asegurar_cargado()
+        top_n_agregado = top_n if top_n_agregado is None else top_n_agregado
+        with self._lock:
+            consultados = [pk for pk in dict.fromkeys(pks) if pk in self._posiciones]
+            if not consultados:
+                return {}, []
+            filas = np.asarray([self._posiciones[pk] for pk in consultados])
+            ids = self._ids[:self._tamano]
+            scores = self._matriz[filas] @ self._matriz[:self._tamano].T
+            descartar = np.zeros(self._tamano, dtype=bool)
+            descartar[filas] = True
+            mascara = self.mascara(filtros)
+            if mascara is not None:
+                descartar |= ~mascara
+            scores[:, descartar] = -np.inf
+            agregados = scores.mean(axis=0)
+
+            por_producto = {}
+            for pk, fila, mejores in zip(consultados, scores, top_n_por_fila(scores, top_n)):
+                por_producto[pk] = [
+                    (int(ids[i]), float(fila[i])) for i in mejores if np.isfinite(fila[i])
+                ]
+            agregadas = [
+                (int(ids[i]), float(agregados[i]))
+                for i in top_k(agregados, top_n_agregado) if np.isfinite(agregados[i])
+            ]
+        return por_producto, agregadas
+
+
+# Índice compartido por el proceso
+embedding_index = EmbeddingIndex(
+    ttl=getattr(settings, 'RECOMMENDATION_INDEX_TTL', 300)
+)
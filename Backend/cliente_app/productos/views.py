@@ -1,27 +1,140 @@
-from rest_framework import viewsets, filters
+from rest_framework import permissions, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from cliente_app.conditional import ConditionalGetMixin
+from cliente_app.fieldsets import campos_solicitados, columnas_para
+from cliente_app.response_cache import CachedResponseMixin
+from .filters import BusquedaFilter
 from .models import Producto
-from .serializers import ProductoSerializer
-from .ai_recommendation import recomendar  # usa la función que definimos antes
+from .serializers import (
+    BusquedaHibridaParamsSerializer,
+    ProductoSerializer,
+    RecomendacionLoteSerializer,
+    RecomendacionParamsSerializer,
+    SugerenciasParamsSerializer,
+)
+from .ai_recommendation import recomendar, recomendar_lote
+from .busqueda_hibrida import buscar_hibrido
+from .sugerencias import indice_sugerencias
 
-class ProductoViewSet(viewsets.ModelViewSet):
-    queryset = Producto.objects.filter()  # si tienes stock, agrega stock__gt=0
+class ProductoViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
+    # list y retrieve: ETag/Last-Modified (cliente_app.conditional) y
+    # cache del catálogo (cliente_app.response_cache)
+    # El embedding no se serializa: nunca se lee desde la base de datos aquí
+    queryset = Producto.objects.defer('embedding')  # si tienes stock, agrega stock__gt=0
     serializer_class = ProductoSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    # ?search= usa el índice de búsqueda (productos.busqueda), no LIKE
+    filter_backends = [DjangoFilterBackend, BusquedaFilter]
     filterset_fields = ['categoria', 'precio']
-    search_fields = ['nombre', 'descripcion']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        campos = campos_solicitados(self.request)
+        if campos is not None:
+            if 'disponible' in campos:
+                campos = campos | {'stock', 'reservado'}
+            queryset = queryset.only(*columnas_para(Producto, campos))
+        return queryset
+
+    def filter_queryset(self, queryset):
+        # En recommend, categoria/precio filtran las recomendaciones,
+        # no el producto consultado
+        if self.action == 'recommend':
+            return queryset
+        return super().filter_queryset(queryset)
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        """
+        Endpoint: /api/productos/search/?q=...
+        Búsqueda híbrida: combina el ranking por palabras (BM25) con la
+        similitud entre el embedding de la consulta y los de los productos
+        (reciprocal-rank fusion, ver productos.busqueda_hibrida).
+
+        Parámetros opcionales: top_n (20), categoria e in_stock.
+        """
+        params = BusquedaHibridaParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        resultados = buscar_hibrido(
+            params.validated_data['q'],
+            top_n=params.validated_data['top_n'],
+            filtros=params.filtros(),
+        )
+        ids = [pk for pk, _ in resultados]
+        productos = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer([productos[pk] for pk in ids if pk in productos], many=True)
+        return Response(serializer.data)
+
+    @action(
+        detail=False, methods=['get'], url_path='suggest',
+        # Público y sin autenticación: no lee el token ni la sesión
+        authentication_classes=[], permission_classes=[permissions.AllowAny],
+    )
+    def suggest(self, request):
+        """
+        Endpoint: /api/productos/suggest/?q=...
+        Sugerencias para el buscador: productos y categorías con una
+        palabra que empieza con q, los más vendidos primero. Sale del
+        índice en memoria del worker (productos.sugerencias), sin
+        consultar la base de datos.
+
+        Parámetro opcional: top_n (8).
+        """
+        params = SugerenciasParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        return Response(indice_sugerencias.sugerir(
+            params.validated_data['q'], limite=params.validated_data['top_n'],
+        ))
 
     @action(detail=True, methods=['get'])
     def recommend(self, request, pk=None):
         """
         Endpoint: /api/productos/{id}/recommend/
         Retorna productos recomendados usando AI
+        (índice vectorial en memoria del worker)
+
+        Parámetros opcionales: top_n, categoria, misma_categoria, in_stock,
+        precio_min, precio_max, banda_precio y en_promocion. Los filtros se
+        aplican sobre el índice antes de ordenar.
         """
         producto = self.get_object()
-        # Filtramos productos que tengan embedding
-        todos_productos = Producto.objects.exclude(pk=producto.pk).filter(embedding__isnull=False)
-        recomendados = recomendar(producto, list(todos_productos))
+        params = RecomendacionParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        recomendados = recomendar(
+            producto,
+            top_n=params.validated_data['top_n'],
+            filtros=params.filtros_para(producto),
+        )
         serializer = self.get_serializer(recomendados, many=True)
         return Response(serializer.data)
+
+    @action(detail=False, methods=['post'], url_path='recommend')
+    def recommend_batch(self, request):
+        """
+        Endpoint: POST /api/productos/recommend/
+        Recomendaciones de varios productos (carrito, listado) en un solo
+        request: {"ids": [...], "top_n": 4, "top_n_agregado": 8, ...filtros}.
+
+        Retorna las recomendaciones de cada producto y un conjunto agregado
+        ("también te puede gustar") que excluye los productos consultados.
+        """
+        params = RecomendacionLoteSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        datos = params.validated_data
+        por_producto, agregadas = recomendar_lote(
+            datos['ids'],
+            top_n=datos['top_n'],
+            top_n_agregado=datos.get('top_n_agregado'),
+            filtros=params.filtros_para(producto=None),
+        )
+        return Response({
+            'recomendaciones': [
+                {
+                    'producto': pk,
+                    'recomendados': self.get_serializer(productos, many=True).data,
+                }
+                for pk, productos in por_producto.items()
+            ],
+            'tambien_te_puede_gustar': self.get_serializer(agregadas, many=True).data,
+        })
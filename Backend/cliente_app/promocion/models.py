@@ -1,8 +1,41 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from productos.models import Producto
 
 # Create your models here.
 class Promocion(models.Model):
     producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
     descuento = models.DecimalField(max_digits=5, decimal_places=2)  # porcentaje, ej. 20%
-    activo = models.BooleanField(default=True)
\ No newline at end of file
+    activo = models.BooleanField(default=True)
+
+
+# Signals para mantener el filtro "en promoción" del índice de recomendaciones
+@receiver(post_save, sender=Promocion)
+@receiver(post_delete, sender=Promocion)
+def actualizar_promocion_en_indice(sender, instance, **kwargs):
+    """
+    Recalcula si el producto tiene alguna promoción activa y lo refleja
+    en el índice vectorial una vez confirmada la transacción.
+    """
+    from productos.ann import get_vector_backend
+
+    producto_id = instance.producto_id
+
+    def actualizar():
+        activa = Promocion.objects.filter(producto_id=producto_id, activo=True).exists()
+        get_vector_backend().actualizar_metadatos(producto_id, promocion=activa)
+
+    transaction.on_commit(actualizar)
+
+
+@receiver(post_save, sender=Promocion)
+@receiver(post_delete, sender=Promocion)
+def invalidar_catalogo_promocion(sender, instance, **kwargs):
+    """
+    Invalida las respuestas cacheadas del catálogo
+    (cliente_app.response_cache).
+    """
+    from cliente_app.response_cache import invalidar_al_confirmar
+
+    invalidar_al_confirmar()
@@ -3,7 +3,9 @@ import API_BASE_URL from './config';
 
 export const ordersAPI = {
   // POST /api/orders/create_order/ - Crear orden e iniciar pago
-  createOrder: async (orderData) => {
+  // idempotencyKey: misma clave en los reintentos del mismo checkout, así
+  // el backend no crea otra orden ni otro cobro
+  createOrder: async (orderData, idempotencyKey) => {
     const token = localStorage.getItem('authToken');
     
     console.log('=== CREANDO ORDEN ===');
@@ -15,7 +17,8 @@ export const ordersAPI = {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
-        'Authorization': `Token ${token}`
+        'Authorization': `Token ${token}`,
+        ...(idempotencyKey && { 'Idempotency-Key': idempotencyKey })
       },
       body: JSON.stringify(orderData)
     });
@@ -98,10 +101,12 @@ export const ordersAPI = {
   },
 
   // GET /api/orders/ - Listar órdenes del usuario
-  getMyOrders: async () => {
+  // Respuesta paginada por cursor: { next, previous, results }; para la
+  // página siguiente se pasa la URL de `next`
+  getMyOrders: async (url = `${API_BASE_URL}/orders/`) => {
     const token = localStorage.getItem('authToken');
     
-    const response = await fetch(`${API_BASE_URL}/orders/`, {
+    const response = await fetch(url, {
       headers: {
         'Authorization': `Token ${token}`
       }
@@ -31,6 +31,17 @@ export const productosAPI = {
     return response.json();
   },
 
+  // POST /api/productos/recommend/ (varios productos en un solo request)
+  getBatchRecommendations: async (ids, options = {}) => {
+    const response = await fetch(`${API_BASE_URL}/productos/recommend/`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ ids, ...options })
+    });
+    if (!response.ok) throw new Error('Error al obtener recomendaciones');
+    return response.json();
+  },
+
   // POST /api/productos/ (con FormData para imágenes)
   create: async (formData) => {
     const response = await fetch(`${API_BASE_URL}/productos/`, {
@@ -4,6 +4,8 @@ import { useCart } from '../../context/CartContext';
 
 const ProductCard = ({ producto }) => {
   const { addToCart } = useCart();
+  // Unidades que se pueden comprar (stock menos reservas de órdenes pendientes)
+  const disponible = producto.disponible ?? producto.stock;
 
   const handleAddToCart = () => {
     addToCart(producto, 1);
@@ -26,13 +28,13 @@ const ProductCard = ({ producto }) => {
             </div>
           )}
           
-          {producto.stock < 5 && producto.stock > 0 && (
+          {disponible < 5 && disponible > 0 && (
             <span className="position-absolute top-0 end-0 m-2 badge bg-warning text-dark">
               ¡Últimas unidades!
             </span>
           )}
           
-          {producto.stock === 0 && (
+          {disponible === 0 && (
             <span className="position-absolute top-0 end-0 m-2 badge bg-danger">
               Agotado
             </span>
@@ -54,15 +56,15 @@ const ProductCard = ({ producto }) => {
           
           <button
             onClick={handleAddToCart}
-            disabled={producto.stock === 0}
-            className={`btn ${producto.stock === 0 ? 'btn-secondary' : 'btn-danger'}`}
+            disabled={disponible === 0}
+            className={`btn ${disponible === 0 ? 'btn-secondary' : 'btn-danger'}`}
           >
-            {producto.stock === 0 ? 'Agotado' : 'Agregar'}
+            {disponible === 0 ? 'Agotado' : 'Agregar'}
           </button>
         </div>
 
         <small className="text-muted mt-2">
-          Stock: {producto.stock} unidades
+          Stock: {disponible} unidades
         </small>
       </div>
     </div>
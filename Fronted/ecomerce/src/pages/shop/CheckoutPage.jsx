@@ -1,5 +1,5 @@
 // src/pages/shop/CheckoutPage.jsx
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useNavigate, Link } from 'react-router-dom';
 import { useCart } from '../../context/CartContext';
 import { useAuth } from '../../context/AuthContext';
@@ -40,6 +40,9 @@ const CheckoutForm = ({ totalAmount, cartItems }) => {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
   const [succeeded, setSucceeded] = useState(false);
+  // Idempotency-Key del último envío: se reutiliza si se reenvía el mismo
+  // pedido (doble clic, reintento tras un error de red)
+  const ultimoEnvio = useRef({ body: null, key: null });
   
   // Auto-completar con datos del usuario y perfil
   const [billingDetails, setBillingDetails] = useState({
@@ -107,7 +110,11 @@ const CheckoutForm = ({ totalAmount, cartItems }) => {
       console.log('Creando orden en el backend...');
 
       // 2. Crear la orden en el backend
-      const orderResponse = await ordersAPI.createOrder(orderData);
+      const body = JSON.stringify(orderData);
+      if (ultimoEnvio.current.body !== body) {
+        ultimoEnvio.current = { body, key: crypto.randomUUID() };
+      }
+      const orderResponse = await ordersAPI.createOrder(orderData, ultimoEnvio.current.key);
       console.log('Orden creada:', orderResponse);
 
       if (!orderResponse.client_secret) {
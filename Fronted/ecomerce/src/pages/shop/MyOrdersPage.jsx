@@ -7,7 +7,9 @@ import { useAuth } from '../../context/AuthContext';
 const MyOrdersPage = () => {
   const { isAuthenticated } = useAuth();
   const [orders, setOrders] = useState([]);
+  const [nextUrl, setNextUrl] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState('');
 
   useEffect(() => {
@@ -19,7 +21,8 @@ const MyOrdersPage = () => {
 
       try {
         const data = await ordersAPI.getMyOrders();
-        setOrders(data);
+        setOrders(data.results);
+        setNextUrl(data.next);
       } catch (err) {
         console.error('Error al cargar pedidos:', err);
         setError('No se pudieron cargar tus pedidos');
@@ -31,6 +34,20 @@ const MyOrdersPage = () => {
     loadOrders();
   }, [isAuthenticated]);
 
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const data = await ordersAPI.getMyOrders(nextUrl);
+      setOrders((prev) => [...prev, ...data.results]);
+      setNextUrl(data.next);
+    } catch (err) {
+      console.error('Error al cargar más pedidos:', err);
+      setError('No se pudieron cargar tus pedidos');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const getStatusBadge = (status) => {
     const badges = {
       pending: { class: 'warning', text: 'Pendiente', icon: 'clock' },
@@ -152,21 +169,11 @@ const MyOrdersPage = () => {
                       {getStatusBadge(order.status)}
                     </div>
 
-                    {/* Items del pedido */}
-                    <div className="mb-2">
-                      <p className="small text-muted mb-1">Productos:</p>
-                      {order.items && order.items.slice(0, 3).map((item, index) => (
-                        <span key={item.id} className="small">
-                          {item.product_name} (x{item.quantity})
-                          {index < Math.min(order.items.length - 1, 2) && ', '}
-                        </span>
-                      ))}
-                      {order.items && order.items.length > 3 && (
-                        <span className="small text-muted">
-                          {' '}y {order.items.length - 3} más
-                        </span>
-                      )}
-                    </div>
+                    {/* Items del pedido (el detalle está en Ver Detalles) */}
+                    <p className="small text-muted mb-2">
+                      <i className="bi bi-box-seam me-1"></i>
+                      {order.item_count} {order.item_count === 1 ? 'producto' : 'productos'}
+                    </p>
 
                     {/* Dirección de envío */}
                     <p className="small text-muted mb-0">
@@ -195,6 +202,19 @@ const MyOrdersPage = () => {
         ))}
       </div>
 
+      {/* Página siguiente */}
+      {nextUrl && (
+        <div className="text-center">
+          <button
+            className="btn btn-outline-danger"
+            onClick={loadMore}
+            disabled={loadingMore}
+          >
+            {loadingMore ? 'Cargando...' : 'Ver más pedidos'}
+          </button>
+        </div>
+      )}
+
       {/* Botón volver */}
       <div className="text-center mt-4">
         <Link to="/" className="btn btn-outline-secondary">